@@ -0,0 +1,91 @@
+import asyncio
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+import httpx
+
+from fluidly.auth.jwt_requests import (
+    DEFAULT_CONNECT_TIMEOUT,
+    DEFAULT_READ_TIMEOUT,
+    Timeout,
+)
+
+_client: Optional[httpx.AsyncClient] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+_limits = httpx.Limits(max_connections=100, max_keepalive_connections=20)
+_timeout = httpx.Timeout(DEFAULT_READ_TIMEOUT, connect=DEFAULT_CONNECT_TIMEOUT)
+_retries = 2
+
+T = TypeVar("T")
+
+
+def configure_async_client(
+    max_connections: int = 100,
+    max_keepalive_connections: int = 20,
+    max_retries: int = 2,
+    connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+    read_timeout: float = DEFAULT_READ_TIMEOUT,
+) -> None:
+    """Sets up the shared async client used for JWT requests. `max_retries` only
+    applies to connection failures."""
+    global _client, _client_loop, _limits, _timeout, _retries
+
+    _limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_keepalive_connections,
+    )
+    _timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+    _retries = max_retries
+    _client = None
+    _client_loop = None
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Returns the shared async client, connections are bound to an event loop so a
+    new client is created when called from a different loop."""
+    global _client, _client_loop
+
+    loop = asyncio.get_event_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        _client = httpx.AsyncClient(
+            limits=_limits,
+            timeout=_timeout,
+            transport=httpx.AsyncHTTPTransport(limits=_limits, retries=_retries),
+        )
+        _client_loop = loop
+    return _client
+
+
+async def close_async_client() -> None:
+    global _client, _client_loop
+
+    if _client is not None:
+        await _client.aclose()
+    _client = None
+    _client_loop = None
+
+
+async def sign_off_loop(sign: Callable[..., T], *args: Any) -> T:
+    """Calls `sign` in the default executor, signing may read the credentials and
+    RSA sign which would block the event loop"""
+    return await asyncio.get_event_loop().run_in_executor(None, sign, *args)
+
+
+async def make_async_jwt_request(
+    signed_jwt: Any,
+    url: Any,
+    timeout: Optional[Timeout] = None,
+    headers: Optional[Dict[str, str]] = None,
+) -> httpx.Response:
+    """Makes an authorized request to the endpoint without blocking the event loop"""
+    headers = {
+        "Authorization": "Bearer {}".format(signed_jwt.decode("utf-8")),
+        "content-type": "text/html",
+        **(headers or {}),
+    }
+
+    response = await get_async_client().get(
+        url,
+        headers=headers,
+        timeout=httpx.Timeout(timeout[1], connect=timeout[0]) if timeout else _timeout,
+    )
+    return response
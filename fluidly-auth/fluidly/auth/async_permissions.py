@@ -0,0 +1,219 @@
+import asyncio
+import time
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple, TypeVar
+
+from fluidly.auth.async_jwt_requests import make_async_jwt_request, sign_off_loop
+from fluidly.auth.cache import (
+    ADMIN_SCOPE,
+    DecisionsCache,
+    Scope,
+    SharedPermissionsCache,
+    StaleDecision,
+    Validators,
+    connection_scope,
+    get_permissions_cache,
+    get_subject,
+)
+from fluidly.auth.circuit_breaker import CircuitOpenException, get_circuit_breaker
+from fluidly.auth.deadline import (
+    DeadlineExceededException,
+    get_deadline_at,
+    is_exceeded,
+    remaining,
+)
+from fluidly.auth.hedging import get_hedger
+from fluidly.auth.jwt import generate_jwt
+from fluidly.auth.permissions import (
+    UserPermissionsDeadlineExceededException,
+    UserPermissionsRequestException,
+    UserPermissionsUnavailableException,
+    get_admin_permissions_url,
+    get_conditional_headers,
+    get_fluidly_api_url,
+    get_unique_connection_ids,
+    get_user_permissions_url,
+    handle_conditional_response,
+    record_request_error,
+)
+from fluidly.auth.single_flight import permissions_single_flight
+from fluidly.structlog.server_timing import measure
+
+
+async def send_permissions_request_async(
+    signed_jwt: Any, request_url: str, headers: Optional[Dict[str, str]] = None
+) -> Any:
+    hedger = get_hedger()
+    if hedger is not None:
+        return await hedger.call_async(
+            make_async_jwt_request, signed_jwt, request_url, headers=headers
+        )
+    return await make_async_jwt_request(signed_jwt, request_url, headers=headers)
+
+
+async def check_permissions_async(
+    original_payload: Any,
+    request_url: str,
+    deadline_at: Optional[float] = None,
+    **kwargs: Any,
+) -> bool:
+    authorised, _ = await check_conditional_permissions_async(
+        original_payload, request_url, deadline_at=deadline_at, **kwargs
+    )
+    return authorised
+
+
+async def check_conditional_permissions_async(
+    original_payload: Any,
+    request_url: str,
+    stale: Optional[StaleDecision] = None,
+    deadline_at: Optional[float] = None,
+    **kwargs: Any,
+) -> Tuple[bool, Optional[Validators]]:
+    """Same as `check_conditional_permissions`, the request is cancelled once
+    `deadline_at` passes"""
+    start = time.time()
+    signed_jwt = await sign_off_loop(generate_jwt, original_payload)
+    headers = get_conditional_headers(stale)
+    try:
+        timeout = remaining(deadline_at)
+        circuit_breaker = get_circuit_breaker()
+        if circuit_breaker is not None:
+            request = circuit_breaker.call_async(
+                send_permissions_request_async,
+                signed_jwt,
+                request_url,
+                headers,
+                deadline_at=deadline_at,
+            )
+        else:
+            request = send_permissions_request_async(signed_jwt, request_url, headers)
+        response = await asyncio.wait_for(request, timeout)
+    except CircuitOpenException:
+        record_request_error(request_url, start)
+        raise UserPermissionsUnavailableException()
+    except Exception:
+        record_request_error(request_url, start)
+        if is_exceeded(deadline_at):
+            raise UserPermissionsDeadlineExceededException()
+        raise UserPermissionsRequestException()
+
+    return handle_conditional_response(
+        response, stale, original_payload, request_url, start, **kwargs
+    )
+
+
+T = TypeVar("T")
+
+
+async def call_cache(cache: DecisionsCache, fn: Callable[..., T], *args: Any) -> T:
+    """Calls a method of the permissions cache, in the default executor for the
+    shared cache which queries SQLite"""
+    if isinstance(cache, SharedPermissionsCache):
+        return await asyncio.get_event_loop().run_in_executor(None, fn, *args)
+    return fn(*args)
+
+
+async def check_cached_permissions_async(
+    original_payload: Any,
+    scope: Scope,
+    request_url: str,
+    deadline_at: Optional[float] = None,
+    **kwargs: Any,
+) -> bool:
+    subject = get_subject(original_payload)
+    if subject is None:
+        return await check_permissions_async(
+            original_payload, request_url, deadline_at=deadline_at, **kwargs
+        )
+
+    cache = get_permissions_cache()
+    key = (subject, scope)
+    if cache is not None:
+        cached = await call_cache(cache, cache.get, key)
+        if cached is not None:
+            return cached
+
+    # The shared request runs without the deadline of the check which started it,
+    # each check only stops waiting for it at its own deadline
+    async def check() -> bool:
+        checked_at = time.time()
+        if cache is None:
+            return await check_permissions_async(
+                original_payload, request_url, **kwargs
+            )
+
+        stale = await call_cache(cache, cache.get_stale, key)
+        authorised, validators = await check_conditional_permissions_async(
+            original_payload, request_url, stale, **kwargs
+        )
+        await call_cache(cache, cache.set, key, authorised, checked_at, validators)
+        return authorised
+
+    try:
+        return await permissions_single_flight.do_async(
+            (subject, request_url), check, remaining(deadline_at)
+        )
+    except (TimeoutError, DeadlineExceededException) as e:
+        if isinstance(e, UserPermissionsDeadlineExceededException):
+            raise
+        raise UserPermissionsDeadlineExceededException() from e
+
+
+async def check_user_permissions_async(
+    original_payload: Any,
+    connection_id: str,
+    fluidly_api_url: Optional[str] = None,
+    deadline: Optional[float] = None,
+) -> bool:
+    with measure("auth"):
+        return await check_cached_permissions_async(
+            original_payload,
+            connection_scope(connection_id),
+            get_user_permissions_url(connection_id, fluidly_api_url),
+            deadline_at=get_deadline_at(deadline),
+            connection_id=connection_id,
+        )
+
+
+async def check_admin_permissions_async(
+    original_payload: Any,
+    fluidly_api_url: Optional[str] = None,
+    deadline: Optional[float] = None,
+) -> bool:
+    with measure("auth"):
+        return await check_cached_permissions_async(
+            original_payload,
+            ADMIN_SCOPE,
+            get_admin_permissions_url(fluidly_api_url),
+            deadline_at=get_deadline_at(deadline),
+        )
+
+
+async def check_user_permissions_many_async(
+    original_payload: Any,
+    connection_ids: Iterable[str],
+    fluidly_api_url: Optional[str] = None,
+    max_concurrency: int = 10,
+    deadline: Optional[float] = None,
+) -> Dict[str, bool]:
+    fluidly_api_url = get_fluidly_api_url(fluidly_api_url)
+    unique_connection_ids = get_unique_connection_ids(connection_ids)
+    semaphore = asyncio.Semaphore(max(max_concurrency, 1))
+    deadline_at = get_deadline_at(deadline)
+
+    async def check(connection_id: str) -> bool:
+        async with semaphore:
+            # Claims are updated when signing, each check gets its own copy
+            return await check_cached_permissions_async(
+                dict(original_payload),
+                connection_scope(connection_id),
+                get_user_permissions_url(connection_id, fluidly_api_url),
+                deadline_at=deadline_at,
+                connection_id=connection_id,
+            )
+
+    with measure("auth"):
+        decisions = await asyncio.gather(
+            *[check(connection_id) for connection_id in unique_connection_ids]
+        )
+    return dict(zip(unique_connection_ids, decisions))
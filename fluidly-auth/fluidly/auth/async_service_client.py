@@ -0,0 +1,129 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+
+from fluidly.auth.async_jwt_requests import sign_off_loop
+from fluidly.auth.deadline import DeadlineExceededException
+from fluidly.auth.jwt_requests import RETRY_STATUSES
+from fluidly.auth.service_client import BaseServiceClient
+
+RETRIED_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout)
+
+
+class AsyncServiceClient(BaseServiceClient):
+    """Same as `ServiceClient` for asyncio, the `deadline` bounds the whole call
+    including retries and the body of streamed responses is read by the caller.
+
+    Connections are bound to an event loop so the underlying client is recreated
+    when used from a different loop.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(base_url, **kwargs)
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+        )
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_event_loop()
+        if (
+            self._client is None
+            or self._client.is_closed
+            or self._client_loop is not loop
+        ):
+            self._client = httpx.AsyncClient(
+                limits=self.limits,
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                transport=httpx.AsyncHTTPTransport(limits=self.limits),
+            )
+            self._client_loop = loop
+        return self._client
+
+    async def send(
+        self,
+        method: str,
+        url: str,
+        headers: Optional[Dict[str, str]],
+        stream: bool,
+        **kwargs: Any,
+    ) -> httpx.Response:
+        signed_headers = await sign_off_loop(self.headers, headers)
+        client = self.client()
+        request = client.build_request(method, url, headers=signed_headers, **kwargs)
+        return await client.send(request, stream=stream)
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        deadline: Optional[float] = None,
+        headers: Optional[Dict[str, str]] = None,
+        stream: bool = False,
+        **kwargs: Any,
+    ) -> httpx.Response:
+        method = method.upper()
+        url = self.url(path)
+        deadline_at = self.deadline_at(deadline)
+        retries = self.retries(method, kwargs.get("content"))
+
+        attempt = 0
+        while True:
+            remaining = self.remaining(deadline_at)
+            start = time.monotonic()
+            try:
+                response = await asyncio.wait_for(
+                    self.send(method, url, headers, stream, **kwargs), remaining
+                )
+            except asyncio.TimeoutError as e:
+                self.metrics.record(method, "error", time.monotonic() - start)
+                raise DeadlineExceededException() from e
+            except httpx.TransportError as e:
+                self.metrics.record(method, "error", time.monotonic() - start)
+                if attempt == retries or not isinstance(e, RETRIED_ERRORS):
+                    raise
+            else:
+                self.metrics.record(
+                    method, str(response.status_code), time.monotonic() - start
+                )
+                if response.status_code not in RETRY_STATUSES or attempt == retries:
+                    return response
+                await response.aclose()
+
+            await asyncio.sleep(self.backoff(attempt, deadline_at))
+            attempt += 1
+
+    async def get(self, path: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("POST", path, **kwargs)
+
+    @asynccontextmanager
+    async def stream(
+        self, method: str, path: str, **kwargs: Any
+    ) -> AsyncIterator[httpx.Response]:
+        """Sends the request without reading the response body, the connection
+        goes back to the pool when leaving the context"""
+        response = await self.request(method, path, stream=True, **kwargs)
+        try:
+            yield response
+        finally:
+            await response.aclose()
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+        self._client = None
+        self._client_loop = None
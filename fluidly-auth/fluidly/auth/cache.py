@@ -0,0 +1,457 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple, Union
+
+from fluidly.auth.lazy import LazyModule
+
+if TYPE_CHECKING:
+    import sqlite3
+else:
+    # Only needed by the shared cache
+    sqlite3 = LazyModule("sqlite3")
+
+# Scopes are tagged so no connection id can be taken for another scope
+Scope = Tuple[str, ...]
+
+ADMIN_SCOPE: Scope = ("admin",)
+
+CacheKey = Tuple[str, Scope]
+
+# Version of the shared cache database, see `SharedPermissionsCache._migrate`
+SCHEMA_VERSION = 1
+
+# HTTP validators of a decision, `etag` and `last_modified`
+Validators = Dict[str, str]
+StaleDecision = Tuple[bool, Validators]
+
+
+def get_subject(claims: Any) -> Optional[str]:
+    """Returns the user identifier the permission decision is made for, the Fluidly
+    user id so permission change events can refer to it, with a fallback on `sub`
+    from the Auth0 token."""
+    subject = claims.get("https://api.fluidly.com/app_metadata", {}).get("userId")
+    if not subject:
+        subject = claims.get("sub")
+    return str(subject) if subject else None
+
+
+def connection_scope(connection_id: str) -> Scope:
+    return ("connection", connection_id)
+
+
+def encode_scope(scope: Scope) -> str:
+    """Text form of a scope for the shared cache, e.g. `connection:<id>`"""
+    return ":".join(scope)
+
+
+def matches(key: CacheKey, subject: Optional[str], scope: Optional[Scope]) -> bool:
+    return (subject is None or key[0] == subject) and (scope is None or key[1] == scope)
+
+
+class PermissionsCache:
+    """Bounded in-memory cache of permission decisions.
+
+    Decisions are keyed by (subject, scope) where scope is the `connection_scope`
+    of a connection id or `ADMIN_SCOPE`. Grants and denials expire after their
+    own TTLs and the least recently used entry is evicted once `max_size` entries
+    are stored. Decisions checked before the last invalidation are not stored so
+    a request in flight cannot bring back a revoked grant.
+
+    Expired decisions stored with validators are kept until evicted so they can
+    be revalidated with a conditional request, see `get_stale`.
+    """
+
+    def __init__(
+        self, max_size: int = 10000, grant_ttl: float = 60, denial_ttl: float = 5
+    ) -> None:
+        self.max_size = max_size
+        self.grant_ttl = grant_ttl
+        self.denial_ttl = denial_ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+        self._decisions: (
+            "OrderedDict[CacheKey, Tuple[float, bool, Optional[Validators]]]"
+        ) = OrderedDict()
+        self._invalidated_at = 0.0
+
+    def get(self, key: CacheKey) -> Optional[bool]:
+        with self._lock:
+            cached = self._decisions.get(key)
+            if cached is not None:
+                expires_at, granted, validators = cached
+                if time.monotonic() < expires_at:
+                    self._decisions.move_to_end(key)
+                    self.hits += 1
+                    return granted
+                if not validators:
+                    del self._decisions[key]
+                self.expirations += 1
+
+            self.misses += 1
+            return None
+
+    def get_stale(self, key: CacheKey) -> Optional[StaleDecision]:
+        """Returns a decision stored with validators, even if expired"""
+        with self._lock:
+            cached = self._decisions.get(key)
+            if cached is None or not cached[2]:
+                return None
+            return cached[1], cached[2]
+
+    def set(
+        self,
+        key: CacheKey,
+        granted: bool,
+        checked_at: Optional[float] = None,
+        validators: Optional[Validators] = None,
+    ) -> None:
+        """Stores a decision, `checked_at` is the `time.time()` at which it was
+        requested"""
+        ttl = self.grant_ttl if granted else self.denial_ttl
+        if ttl <= 0 and not validators:
+            return
+
+        with self._lock:
+            if checked_at is not None and checked_at < self._invalidated_at:
+                return
+            self._decisions[key] = (
+                time.monotonic() + max(ttl, 0),
+                granted,
+                validators or None,
+            )
+            self._decisions.move_to_end(key)
+            while len(self._decisions) > self.max_size:
+                self._decisions.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(
+        self, subject: Optional[str] = None, scope: Optional[Scope] = None
+    ) -> int:
+        """Removes the decisions of a subject, of a scope or of both, returns the
+        number of decisions removed"""
+        with self._lock:
+            self._invalidated_at = time.time()
+            if subject is not None and scope is not None:
+                keys = [(subject, scope)] if (subject, scope) in self._decisions else []
+            else:
+                keys = [key for key in self._decisions if matches(key, subject, scope)]
+            for key in keys:
+                del self._decisions[key]
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._decisions.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+            self.expirations = 0
+            self.invalidations = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "size": len(self._decisions),
+            }
+
+
+class SharedPermissionsCache:
+    """Permission decisions cache shared by all the processes of a host.
+
+    Decisions are stored in a SQLite database in WAL mode at `path` so every
+    worker reads the entries written by the others. Expiry is checked in the
+    lookup query so an expired decision is never returned, expired and least
+    soon to expire entries are pruned every `prune_interval` writes to keep the
+    database around `max_size` entries. Storage errors are counted and treated
+    as cache misses. The last invalidation time is shared too so no process
+    stores a decision checked before it. Expired decisions stored with
+    validators are only pruned to keep the size bound.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_size: int = 100000,
+        grant_ttl: float = 60,
+        denial_ttl: float = 5,
+        prune_interval: int = 100,
+        timeout: float = 1.0,
+    ) -> None:
+        self.path = path
+        self.max_size = max_size
+        self.grant_ttl = grant_ttl
+        self.denial_ttl = denial_ttl
+        self.prune_interval = prune_interval
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.invalidations = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._connection()
+
+    def _connection(self) -> "sqlite3.Connection":
+        # SQLite connections must not cross threads or forked processes
+        connection: Optional[sqlite3.Connection] = getattr(
+            self._local, "connection", None
+        )
+        if connection is not None and self._local.pid == os.getpid():
+            return connection
+
+        connection = sqlite3.connect(
+            self.path, timeout=self.timeout, isolation_level=None
+        )
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS decisions ("
+            "subject TEXT NOT NULL, scope TEXT NOT NULL, granted INTEGER NOT NULL, "
+            "expires_at REAL NOT NULL, validators TEXT, PRIMARY KEY (subject, scope))"
+        )
+        columns = [row[1] for row in connection.execute("PRAGMA table_info(decisions)")]
+        if "validators" not in columns:
+            # Databases created before validators were stored
+            connection.execute("ALTER TABLE decisions ADD COLUMN validators TEXT")
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS decisions_expires_at ON decisions (expires_at)"
+        )
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS decisions_scope ON decisions (scope)"
+        )
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS invalidations ("
+            "id INTEGER PRIMARY KEY CHECK (id = 0), invalidated_at REAL NOT NULL)"
+        )
+        connection.execute("INSERT OR IGNORE INTO invalidations VALUES (0, 0)")
+        (version,) = connection.execute("PRAGMA user_version").fetchone()
+        if version < SCHEMA_VERSION:
+            self._migrate(connection)
+        self._local.connection = connection
+        self._local.pid = os.getpid()
+        return connection
+
+    @staticmethod
+    def _migrate(connection: "sqlite3.Connection") -> None:
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            (version,) = connection.execute("PRAGMA user_version").fetchone()
+            if version < 1:
+                # Scopes were stored untagged, a connection id could read as admin
+                connection.execute("DELETE FROM decisions")
+            connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            connection.execute("COMMIT")
+        except sqlite3.Error:
+            connection.execute("ROLLBACK")
+            raise
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, key: CacheKey) -> Optional[bool]:
+        try:
+            row = (
+                self._connection()
+                .execute(
+                    "SELECT granted FROM decisions "
+                    "WHERE subject = ? AND scope = ? AND expires_at > ?",
+                    (key[0], encode_scope(key[1]), time.time()),
+                )
+                .fetchone()
+            )
+        except sqlite3.Error:
+            self._count("errors")
+            row = None
+
+        if row is None:
+            self._count("misses")
+            return None
+        self._count("hits")
+        return bool(row[0])
+
+    def get_stale(self, key: CacheKey) -> Optional[StaleDecision]:
+        """Returns a decision stored with validators, even if expired"""
+        try:
+            row = (
+                self._connection()
+                .execute(
+                    "SELECT granted, validators FROM decisions "
+                    "WHERE subject = ? AND scope = ? AND validators IS NOT NULL",
+                    (key[0], encode_scope(key[1])),
+                )
+                .fetchone()
+            )
+        except sqlite3.Error:
+            self._count("errors")
+            return None
+
+        if row is None:
+            return None
+        return bool(row[0]), json.loads(row[1])
+
+    def set(
+        self,
+        key: CacheKey,
+        granted: bool,
+        checked_at: Optional[float] = None,
+        validators: Optional[Validators] = None,
+    ) -> None:
+        """Stores a decision, `checked_at` is the `time.time()` at which it was
+        requested"""
+        ttl = self.grant_ttl if granted else self.denial_ttl
+        if ttl <= 0 and not validators:
+            return
+
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % self.prune_interval == 0
+
+        try:
+            connection = self._connection()
+            # Checking the invalidation time in the insert makes it atomic
+            connection.execute(
+                "INSERT OR REPLACE INTO decisions "
+                "(subject, scope, granted, expires_at, validators) "
+                "SELECT ?, ?, ?, ?, ? "
+                "WHERE ? >= (SELECT invalidated_at FROM invalidations)",
+                (
+                    key[0],
+                    encode_scope(key[1]),
+                    int(granted),
+                    time.time() + max(ttl, 0),
+                    json.dumps(validators) if validators else None,
+                    float("inf") if checked_at is None else checked_at,
+                ),
+            )
+            if prune:
+                self.prune()
+        except sqlite3.Error:
+            self._count("errors")
+
+    def prune(self) -> None:
+        """Deletes the expired decisions without validators then the ones expiring
+        first until at most `max_size` are stored"""
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                "DELETE FROM decisions WHERE expires_at <= ? AND validators IS NULL",
+                (time.time(),),
+            )
+            connection.execute(
+                "DELETE FROM decisions WHERE rowid IN (SELECT rowid FROM decisions "
+                "ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_size,),
+            )
+            connection.execute("COMMIT")
+        except sqlite3.Error:
+            connection.execute("ROLLBACK")
+            raise
+
+    def invalidate(
+        self, subject: Optional[str] = None, scope: Optional[Scope] = None
+    ) -> int:
+        """Removes the decisions of a subject, of a scope or of both for every
+        process, returns the number of decisions removed"""
+        conditions = []
+        parameters = []
+        if subject is not None:
+            conditions.append("subject = ?")
+            parameters.append(subject)
+        if scope is not None:
+            conditions.append("scope = ?")
+            parameters.append(encode_scope(scope))
+        where = " AND ".join(conditions) or "1"
+
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                "UPDATE invalidations SET invalidated_at = max(invalidated_at, ?)",
+                (time.time(),),
+            )
+            removed = connection.execute(
+                f"DELETE FROM decisions WHERE {where}", parameters
+            ).rowcount
+            connection.execute("COMMIT")
+        except sqlite3.Error:
+            connection.execute("ROLLBACK")
+            raise
+
+        with self._lock:
+            self.invalidations += removed
+        return int(removed)
+
+    def clear(self) -> None:
+        self._connection().execute("DELETE FROM decisions")
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.errors = 0
+            self.invalidations = 0
+
+    def stats(self) -> Dict[str, int]:
+        (size,) = (
+            self._connection().execute("SELECT COUNT(*) FROM decisions").fetchone()
+        )
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "errors": self.errors,
+                "invalidations": self.invalidations,
+                "size": size,
+            }
+
+
+DecisionsCache = Union[PermissionsCache, SharedPermissionsCache]
+
+_permissions_cache: Optional[DecisionsCache] = None
+
+
+def enable_permissions_cache(
+    max_size: int = 10000, grant_ttl: float = 60, denial_ttl: float = 5
+) -> PermissionsCache:
+    """Turns on caching of permission decisions for the whole process."""
+    global _permissions_cache
+
+    cache = PermissionsCache(
+        max_size=max_size, grant_ttl=grant_ttl, denial_ttl=denial_ttl
+    )
+    _permissions_cache = cache
+    return cache
+
+
+def enable_shared_permissions_cache(path: str, **kwargs: Any) -> SharedPermissionsCache:
+    """Turns on caching of permission decisions shared with the other processes
+    using the same `path`, see `SharedPermissionsCache` for the options."""
+    global _permissions_cache
+
+    cache = SharedPermissionsCache(path, **kwargs)
+    _permissions_cache = cache
+    return cache
+
+
+def disable_permissions_cache() -> None:
+    global _permissions_cache
+
+    _permissions_cache = None
+
+
+def get_permissions_cache() -> Optional[DecisionsCache]:
+    return _permissions_cache
@@ -0,0 +1,243 @@
+import threading
+import time
+from collections import deque
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+from fluidly.auth.deadline import is_exceeded
+from fluidly.auth.lazy import LazyModule
+
+if TYPE_CHECKING:
+    import asyncio
+
+    from fluidly.structlog import base_logger
+else:
+    # Only used by async calls and state changes, both are slow to import
+    asyncio = LazyModule("asyncio")
+    base_logger = LazyModule("fluidly.structlog.base_logger")
+
+T = TypeVar("T")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenException(Exception):
+    pass
+
+
+def is_server_error(response: Any) -> bool:
+    return getattr(response, "status_code", 200) >= 500
+
+
+class CircuitBreaker:
+    """Stops calling a degraded dependency and fails fast instead.
+
+    Calls are recorded over a sliding `window` of seconds, a call fails when it
+    raises, when `is_failure` returns true for its result or when it takes longer
+    than `slow_call_threshold` seconds. Once at least `minimum_calls` are recorded
+    and the failure rate reaches `failure_rate_threshold` the circuit opens and
+    calls are rejected with `CircuitOpenException`. After `reset_timeout` seconds
+    up to `half_open_max_calls` probes are let through, the first probe outcome
+    closes or re-opens the circuit.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_rate_threshold: float = 0.5,
+        slow_call_threshold: float = 2.0,
+        minimum_calls: int = 20,
+        window: float = 30.0,
+        reset_timeout: float = 30.0,
+        half_open_max_calls: int = 1,
+        is_failure: Callable[[Any], bool] = is_server_error,
+    ) -> None:
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_threshold = slow_call_threshold
+        self.minimum_calls = minimum_calls
+        self.window = window
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.is_failure = is_failure
+        self.state = CLOSED
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._outcomes: Deque[Tuple[float, bool]] = deque()
+        self._opened_at = 0.0
+        self._probes = 0
+
+    def _transition(self, state: str, **kwargs: Any) -> None:
+        logger = base_logger.get_logger()
+        logger.warning(
+            "Circuit breaker state changed",
+            circuit_breaker=self.name,
+            previous_state=self.state,
+            state=state,
+            **kwargs,
+        )
+        self.state = state
+
+    def _failure_rate(self, now: float) -> float:
+        while self._outcomes and self._outcomes[0][0] < now - self.window:
+            self._outcomes.popleft()
+
+        if not self._outcomes:
+            return 0.0
+        return sum(failed for _, failed in self._outcomes) / len(self._outcomes)
+
+    def before_call(self) -> None:
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    self.rejected += 1
+                    raise CircuitOpenException(self.name)
+                self._transition(HALF_OPEN)
+                self._probes = 0
+
+            if self.state == HALF_OPEN:
+                if self._probes >= self.half_open_max_calls:
+                    self.rejected += 1
+                    raise CircuitOpenException(self.name)
+                self._probes += 1
+
+    def after_call(self, failed: bool) -> None:
+        with self._lock:
+            now = time.monotonic()
+
+            if self.state == HALF_OPEN:
+                if failed:
+                    self._opened_at = now
+                    self._transition(OPEN, probe_failed=True)
+                else:
+                    self._outcomes.clear()
+                    self._transition(CLOSED)
+                return
+
+            if self.state == OPEN:
+                return
+
+            self._outcomes.append((now, failed))
+            failure_rate = self._failure_rate(now)
+            if (
+                len(self._outcomes) >= self.minimum_calls
+                and failure_rate >= self.failure_rate_threshold
+            ):
+                self._opened_at = now
+                self._transition(
+                    OPEN, failure_rate=failure_rate, calls=len(self._outcomes)
+                )
+
+    def cancel_call(self) -> None:
+        """Releases the probe of a call cancelled before its outcome is known"""
+        with self._lock:
+            if self.state == HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def _cut_short(self, start: float, deadline_at: Optional[float]) -> None:
+        """Records a call stopped at the `deadline_at` of its caller as slow when
+        the caller gave it at least `slow_call_threshold` seconds, a shorter
+        deadline says nothing of the service so the call is released instead"""
+        if deadline_at is not None and deadline_at - start >= self.slow_call_threshold:
+            self.after_call(True)
+        else:
+            self.cancel_call()
+
+    def call(
+        self,
+        fn: Callable[..., T],
+        *args: Any,
+        deadline_at: Optional[float] = None,
+        **kwargs: Any,
+    ) -> T:
+        """Calls `fn`, see `_cut_short` for calls failing past the `deadline_at`
+        of their caller"""
+        self.before_call()
+        start = time.monotonic()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            if is_exceeded(deadline_at):
+                self._cut_short(start, deadline_at)
+            else:
+                self.after_call(True)
+            raise
+
+        self.after_call(
+            self.is_failure(result)
+            or time.monotonic() - start > self.slow_call_threshold
+        )
+        return result
+
+    async def call_async(
+        self,
+        fn: Callable[..., Awaitable[T]],
+        *args: Any,
+        deadline_at: Optional[float] = None,
+        **kwargs: Any,
+    ) -> T:
+        self.before_call()
+        start = time.monotonic()
+        try:
+            result = await fn(*args, **kwargs)
+        except asyncio.CancelledError:
+            # Cancelled at the deadline of the caller or by the caller going away
+            if is_exceeded(deadline_at):
+                self._cut_short(start, deadline_at)
+            else:
+                self.cancel_call()
+            raise
+        except Exception:
+            if is_exceeded(deadline_at):
+                self._cut_short(start, deadline_at)
+            else:
+                self.after_call(True)
+            raise
+
+        self.after_call(
+            self.is_failure(result)
+            or time.monotonic() - start > self.slow_call_threshold
+        )
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.state,
+                "rejected": self.rejected,
+                "calls": len(self._outcomes),
+                "failure_rate": self._failure_rate(time.monotonic()),
+            }
+
+
+_circuit_breaker: Optional[CircuitBreaker] = None
+
+
+def enable_circuit_breaker(**kwargs: Any) -> CircuitBreaker:
+    """Turns on the circuit breaker around calls to the user permissions service,
+    see `CircuitBreaker` for the options."""
+    global _circuit_breaker
+
+    _circuit_breaker = CircuitBreaker("user-permissions", **kwargs)
+    return _circuit_breaker
+
+
+def disable_circuit_breaker() -> None:
+    global _circuit_breaker
+
+    _circuit_breaker = None
+
+
+def get_circuit_breaker() -> Optional[CircuitBreaker]:
+    return _circuit_breaker
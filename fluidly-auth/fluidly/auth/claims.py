@@ -0,0 +1,96 @@
+import base64
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Union
+
+USER_INFO_HEADER = "X-Endpoint-API-UserInfo"
+
+
+def base64_decode(encoded_str: Union[str, bytes]) -> str:
+    """Decodes base64 that may be missing its padding, as sent by Cloud Endpoints
+
+    https://en.wikipedia.org/wiki/Base64#Output_padding
+    """
+    if isinstance(encoded_str, str):
+        encoded_str = encoded_str.encode("utf-8")
+
+    num_missed_paddings = 4 - len(encoded_str) % 4
+    if num_missed_paddings != 4:
+        encoded_str += b"=" * num_missed_paddings
+    return base64.b64decode(encoded_str).decode("utf-8")
+
+
+def parse_user_info(encoded_user_info: Union[str, bytes]) -> Dict[str, Any]:
+    """Parses the claims from the user info header set by Google Cloud Endpoints"""
+    decoded_user_info = base64_decode(encoded_user_info)
+    # First parsing of the decoded header string
+    user_info = json.loads(decoded_user_info)
+
+    # Claims are given as a string by Cloud Endpoints (ESPv1) so we have
+    # to parse the claims attribute, ESPv2 gives the claims directly
+    claims: Dict[str, Any] = (
+        json.loads(user_info.get("claims", "{}"))
+        if "claims" in user_info
+        else user_info
+    )
+    return claims
+
+
+class ClaimsCache:
+    """Bounded LRU cache of parsed user info headers.
+
+    Entries are keyed by a digest of the raw header so the cache does not keep the
+    tokens themselves. Callers get a shallow copy of the claims which they can
+    update, nested claims are shared and must not be modified. Headers which fail
+    to parse are not cached.
+    """
+
+    def __init__(self, max_size: int = 1024) -> None:
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._claims: "OrderedDict[bytes, Dict[str, Any]]" = OrderedDict()
+
+    @staticmethod
+    def key(encoded_user_info: Union[str, bytes]) -> bytes:
+        if isinstance(encoded_user_info, str):
+            encoded_user_info = encoded_user_info.encode("utf-8")
+        return hashlib.sha256(encoded_user_info).digest()
+
+    def parse(self, encoded_user_info: Union[str, bytes]) -> Dict[str, Any]:
+        key = self.key(encoded_user_info)
+        with self._lock:
+            claims = self._claims.get(key)
+            if claims is not None:
+                self._claims.move_to_end(key)
+                self.hits += 1
+                return dict(claims)
+            self.misses += 1
+
+        claims = parse_user_info(encoded_user_info)
+        with self._lock:
+            self._claims[key] = claims
+            self._claims.move_to_end(key)
+            while len(self._claims) > self.max_size:
+                self._claims.popitem(last=False)
+        return dict(claims)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._claims.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._claims)}
+
+
+claims_cache = ClaimsCache()
+
+
+def parse_claims(encoded_user_info: Union[str, bytes]) -> Dict[str, Any]:
+    return claims_cache.parse(encoded_user_info)
@@ -0,0 +1,51 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+_deadline_at: "ContextVar[Optional[float]]" = ContextVar(
+    "fluidly_auth_deadline_at", default=None
+)
+
+
+class DeadlineExceededException(Exception):
+    pass
+
+
+def get_deadline_at(deadline: Optional[float] = None) -> Optional[float]:
+    """Returns the `time.monotonic()` by which work must be done, the sooner of
+    `deadline` seconds from now and the deadline of the current context"""
+    deadline_at = _deadline_at.get()
+    if deadline is not None:
+        call_deadline_at = time.monotonic() + deadline
+        if deadline_at is None or call_deadline_at < deadline_at:
+            deadline_at = call_deadline_at
+    return deadline_at
+
+
+def remaining(deadline_at: Optional[float]) -> Optional[float]:
+    """Returns the seconds left before `deadline_at`, raises
+    `DeadlineExceededException` once it has passed"""
+    if deadline_at is None:
+        return None
+
+    time_left = deadline_at - time.monotonic()
+    if time_left <= 0:
+        raise DeadlineExceededException()
+    return time_left
+
+
+def is_exceeded(deadline_at: Optional[float]) -> bool:
+    return deadline_at is not None and time.monotonic() >= deadline_at
+
+
+@contextmanager
+def request_deadline(deadline: Optional[float]) -> Iterator[Optional[float]]:
+    """Bounds the permission checks and service client calls made in the block to
+    `deadline` seconds, nested deadlines can only shorten it. The deadline follows
+    the context into coroutines but not into threads started in the block."""
+    token = _deadline_at.set(get_deadline_at(deadline))
+    try:
+        yield _deadline_at.get()
+    finally:
+        _deadline_at.reset(token)
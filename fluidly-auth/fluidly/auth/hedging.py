@@ -0,0 +1,242 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    List,
+    Optional,
+    TypeVar,
+)
+
+from fluidly.auth.lazy import LazyModule
+
+if TYPE_CHECKING:
+    import asyncio
+else:
+    # Only used by async calls, asyncio is slow to import
+    asyncio = LazyModule("asyncio")
+
+T = TypeVar("T")
+
+
+class Hedger:
+    """Sends a second identical request when the first one is slow.
+
+    The hedge delay is the `percentile` of the latest `window_size` latencies,
+    hedging starts once `min_samples` latencies are recorded. Every request earns
+    `max_hedge_ratio` of a hedge so hedges never add more than that share of
+    extra load, even when the service is down.
+
+    Requests which may be hedged are sent from a pool of `max_workers` threads
+    so the caller can return with whichever request answers first. The pool
+    never queues: when every worker is busy the request is sent from the calling
+    thread without a hedge, and hedges are only sent from a free worker.
+    """
+
+    def __init__(
+        self,
+        percentile: float = 0.95,
+        min_delay: float = 0.01,
+        max_hedge_ratio: float = 0.1,
+        max_hedge_burst: float = 10,
+        window_size: int = 1000,
+        min_samples: int = 20,
+        max_workers: int = 32,
+    ) -> None:
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_hedge_ratio = max_hedge_ratio
+        self.max_hedge_burst = max_hedge_burst
+        self.min_samples = min_samples
+        self.requests = 0
+        self.hedges_fired = 0
+        self.hedges_won = 0
+        self.saturated = 0
+        self._lock = threading.Lock()
+        self._latencies: Deque[float] = deque(maxlen=window_size)
+        self._delay: Optional[float] = None
+        self._budget = 0.0
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="hedging"
+        )
+        self._workers = threading.BoundedSemaphore(max_workers)
+
+    def record_latency(self, latency: float) -> None:
+        with self._lock:
+            self._latencies.append(latency)
+            # Sorting the window is not free, refresh the delay every few samples
+            if len(self._latencies) % 10 == 0 or self._delay is None:
+                self._delay = self._compute_delay()
+
+    def _compute_delay(self) -> Optional[float]:
+        if len(self._latencies) < self.min_samples:
+            return None
+        latencies = sorted(self._latencies)
+        index = min(int(len(latencies) * self.percentile), len(latencies) - 1)
+        return max(latencies[index], self.min_delay)
+
+    def hedge_delay(self) -> Optional[float]:
+        """Returns the delay before hedging a new request, None when it must not
+        be hedged"""
+        with self._lock:
+            self.requests += 1
+            self._budget = min(
+                self._budget + self.max_hedge_ratio, self.max_hedge_burst
+            )
+            if self._delay is None or self._budget < 1:
+                return None
+            return self._delay
+
+    def _fire_hedge(self) -> bool:
+        with self._lock:
+            if self._budget < 1:
+                return False
+            self._budget -= 1
+            self.hedges_fired += 1
+            return True
+
+    def _refund_hedge(self) -> None:
+        with self._lock:
+            self._budget += 1
+            self.hedges_fired -= 1
+
+    def _won(self) -> None:
+        with self._lock:
+            self.hedges_won += 1
+
+    def _timed(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        start = time.monotonic()
+        result = fn(*args, **kwargs)
+        self.record_latency(time.monotonic() - start)
+        return result
+
+    def _submit(
+        self, fn: Callable[..., T], *args: Any, **kwargs: Any
+    ) -> "Optional[Future[T]]":
+        """Runs `fn` on a free worker, returns None when they are all busy"""
+        if not self._workers.acquire(blocking=False):
+            with self._lock:
+                self.saturated += 1
+            return None
+
+        future = self._executor.submit(self._timed, fn, *args, **kwargs)
+        future.add_done_callback(lambda _: self._workers.release())
+        return future
+
+    def call(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        delay = self.hedge_delay()
+        primary = self._submit(fn, *args, **kwargs) if delay is not None else None
+        if primary is None:
+            return self._timed(fn, *args, **kwargs)
+
+        done, _ = wait([primary], timeout=delay)
+        hedge = None
+        if not done and self._fire_hedge():
+            hedge = self._submit(fn, *args, **kwargs)
+            if hedge is None:
+                self._refund_hedge()
+        if hedge is None:
+            result: T = primary.result()
+            return result
+
+        pending: List["Future[T]"] = [primary, hedge]
+        error: Optional[BaseException] = None
+        while pending:
+            done_futures, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done_futures:
+                pending.remove(future)
+                if future.exception() is None:
+                    if future is hedge:
+                        self._won()
+                    hedged_result: T = future.result()
+                    return hedged_result
+                error = error or future.exception()
+
+        assert error is not None
+        raise error
+
+    async def _timed_async(
+        self, fn: Callable[..., Awaitable[T]], *args: Any, **kwargs: Any
+    ) -> T:
+        start = time.monotonic()
+        result = await fn(*args, **kwargs)
+        self.record_latency(time.monotonic() - start)
+        return result
+
+    async def call_async(
+        self, fn: Callable[..., Awaitable[T]], *args: Any, **kwargs: Any
+    ) -> T:
+        delay = self.hedge_delay()
+        if delay is None:
+            return await self._timed_async(fn, *args, **kwargs)
+
+        primary = asyncio.ensure_future(self._timed_async(fn, *args, **kwargs))
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done or not self._fire_hedge():
+            return await primary
+
+        hedge = asyncio.ensure_future(self._timed_async(fn, *args, **kwargs))
+        pending = {primary, hedge}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self._won()
+                        return task.result()
+                    error = error or task.exception()
+        finally:
+            for task in pending:
+                task.cancel()
+
+        assert error is not None
+        raise error
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "hedges_fired": self.hedges_fired,
+                "hedges_won": self.hedges_won,
+                "saturated": self.saturated,
+                "delay": self._delay,
+            }
+
+
+_hedger: Optional[Hedger] = None
+
+
+def enable_hedging(**kwargs: Any) -> Hedger:
+    """Turns on hedging of requests to the user permissions service, see `Hedger`
+    for the options."""
+    disable_hedging()
+
+    global _hedger
+
+    _hedger = Hedger(**kwargs)
+    return _hedger
+
+
+def disable_hedging() -> None:
+    global _hedger
+
+    if _hedger is not None:
+        _hedger.close()
+    _hedger = None
+
+
+def get_hedger() -> Optional[Hedger]:
+    return _hedger
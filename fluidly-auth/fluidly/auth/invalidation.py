@@ -0,0 +1,97 @@
+import os
+import re
+import socket
+from typing import Any, Optional
+
+from google.api_core.exceptions import AlreadyExists
+
+from fluidly.auth.cache import connection_scope, get_permissions_cache
+from fluidly.pubsub.base_subscriber import GOOGLE_PROJECT, SubscriptionFutures
+from fluidly.pubsub.exceptions import DropMessageException
+from fluidly.pubsub.message import Message
+from fluidly.pubsub.subscriber import get_pubsub_subscriber, setup_subscriptions
+from fluidly.structlog import base_logger
+
+PERMISSIONS_CHANGED_TOPIC = "user-permissions-changed"
+PERMISSIONS_CHANGED_SUBSCRIPTION = "user-permissions-changed"
+# Pub/Sub deletes the subscriptions of processes gone for a day, its minimum
+SUBSCRIPTION_EXPIRATION = 24 * 3600
+# Older events only evict decisions which have expired since
+MESSAGE_RETENTION = 600
+
+
+def get_optional(message: Message, attribute: str) -> Optional[str]:
+    value = message.data.get(attribute)
+    return str(value) if value is not None else None
+
+
+def handle_permissions_changed(message: Message) -> None:
+    """Evicts the cached decisions affected by a permission change event.
+
+    The event carries a `userId`, a `connectionId` or both, a user without a
+    connection evicts all the decisions of the user including admin ones and a
+    connection without a user evicts the decisions of every user for it.
+    """
+    subject = get_optional(message, "userId")
+    connection_id = get_optional(message, "connectionId")
+    if subject is None and connection_id is None:
+        raise DropMessageException()
+
+    scope = connection_scope(connection_id) if connection_id is not None else None
+    cache = get_permissions_cache()
+    removed = cache.invalidate(subject=subject, scope=scope) if cache else 0
+    base_logger.get_logger().info(
+        "Invalidated cached permissions",
+        user_id=subject,
+        connection_id=connection_id,
+        removed=removed,
+    )
+    message.message.ack()
+
+
+def get_process_subscription_name(
+    prefix: str = PERMISSIONS_CHANGED_SUBSCRIPTION,
+) -> str:
+    """Returns a subscription name unique to this process, from its host and pid"""
+    host = re.sub(r"[^A-Za-z0-9-]", "-", socket.gethostname())
+    return f"{prefix}-{host}-{os.getpid()}"[:255]
+
+
+def create_process_subscription(topic_name: str = PERMISSIONS_CHANGED_TOPIC) -> str:
+    """Creates a subscription to `topic_name` for this process, which Pub/Sub
+    deletes once the process has stopped pulling for a day"""
+    subscriber = get_pubsub_subscriber()
+    subscription_name = get_process_subscription_name()
+    try:
+        subscriber.create_subscription(
+            request={
+                "name": subscriber.subscription_path(GOOGLE_PROJECT, subscription_name),
+                "topic": subscriber.topic_path(GOOGLE_PROJECT, topic_name),
+                "expiration_policy": {"ttl": {"seconds": SUBSCRIPTION_EXPIRATION}},
+                "message_retention_duration": {"seconds": MESSAGE_RETENTION},
+            }
+        )
+    except AlreadyExists:
+        # Left by an earlier process of the host with the same pid
+        pass
+    return subscription_name
+
+
+def setup_permissions_invalidation(
+    subscription_name: Optional[str] = None,
+    topic_name: str = PERMISSIONS_CHANGED_TOPIC,
+    **kwargs: Any,
+) -> SubscriptionFutures:
+    """Subscribes to permission change events to evict cached decisions as soon
+    as access changes.
+
+    Pub/Sub delivers each event to a single subscriber of a subscription, so
+    every process with its own cache needs its own subscription. By default one
+    is created on `topic_name` for the process, a `subscription_name` given
+    instead must not be shared with other processes.
+    """
+    if subscription_name is None:
+        subscription_name = create_process_subscription(topic_name)
+    return setup_subscriptions(
+        [(subscription_name, handle_permissions_changed)], **kwargs
+    )
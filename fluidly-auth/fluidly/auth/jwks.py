@@ -0,0 +1,377 @@
+import base64
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Dict, Mapping, Optional, Tuple, Union
+
+from fluidly.auth.jwt import audience as fluidly_audience
+from fluidly.auth.jwt_requests import DEFAULT_CONNECT_TIMEOUT, Timeout, get_session
+from fluidly.auth.lazy import LazyModule
+
+if TYPE_CHECKING:
+    from google.auth import crypt
+
+    from fluidly.structlog import base_logger
+else:
+    # google.auth.crypt needs cryptography, which comes with the `jwks` extra
+    crypt = LazyModule("google.auth.crypt")
+    # Only needed to log failed fetches, structlog is slow to import
+    base_logger = LazyModule("fluidly.structlog.base_logger")
+
+CachedClaims = Tuple[float, Dict[str, Any]]
+
+
+class InvalidTokenException(Exception):
+    pass
+
+
+def base64url_decode(encoded: Union[str, bytes]) -> bytes:
+    if isinstance(encoded, str):
+        encoded = encoded.encode("utf-8")
+    return base64.urlsafe_b64decode(encoded + b"=" * (-len(encoded) % 4))
+
+
+def base64url_to_int(encoded: str) -> int:
+    return int.from_bytes(base64url_decode(encoded), "big")
+
+
+def get_verifier(jwk: Mapping[str, Any]) -> "crypt.Verifier":
+    """Builds a signature verifier from the modulus and exponent of an RSA JWK"""
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric.rsa import RSAPublicNumbers
+
+    public_key = RSAPublicNumbers(
+        base64url_to_int(jwk["e"]), base64url_to_int(jwk["n"])
+    ).public_key()
+    pem = public_key.public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    verifier: crypt.Verifier = crypt.RSAVerifier.from_string(pem)  # type: ignore
+    return verifier
+
+
+def get_bearer_token(authorization: Optional[str]) -> Optional[str]:
+    if not authorization:
+        return None
+
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token.strip():
+        return None
+    return token.strip()
+
+
+class JWKS:
+    """Signing keys of a token issuer, fetched from its JWKS url.
+
+    Keys are fetched on first use and again every `refresh_interval` seconds, in
+    a background thread while the current keys keep being served. A token signed
+    with an unknown key id waits for a fetch so rotated keys are picked up, at
+    most once every `min_refresh_interval` seconds. The previous keys are kept
+    when a fetch fails.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        refresh_interval: float = 3600,
+        min_refresh_interval: float = 30,
+        timeout: Timeout = (DEFAULT_CONNECT_TIMEOUT, 5),
+    ) -> None:
+        self.url = url
+        self.refresh_interval = refresh_interval
+        self.min_refresh_interval = min_refresh_interval
+        self.timeout = timeout
+        self.refreshes = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+        self._verifiers: "Dict[str, crypt.Verifier]" = {}
+        self._refreshed_at: Optional[float] = None
+        self._attempted_at: Optional[float] = None
+        self._refresh_thread: Optional[threading.Thread] = None
+
+    def refresh(self) -> None:
+        """Fetches the signing keys, only valid RSA keys used for signatures and
+        with a key id are kept"""
+        response = get_session().get(self.url, timeout=self.timeout)
+        response.raise_for_status()
+
+        verifiers = {}
+        for jwk in response.json().get("keys", []):
+            # Other keys are skipped rather than failing the whole key set
+            if not isinstance(jwk, dict) or not isinstance(jwk.get("kid"), str):
+                continue
+            if jwk.get("kty") != "RSA" or jwk.get("use", "sig") != "sig":
+                continue
+            try:
+                verifiers[jwk["kid"]] = get_verifier(jwk)
+            except (KeyError, TypeError, ValueError):
+                base_logger.get_logger().warning(
+                    "Skipped invalid signing key", url=self.url, kid=jwk["kid"]
+                )
+        self._verifiers = verifiers
+        self._refreshed_at = time.monotonic()
+        self.refreshes += 1
+
+    def _try_refresh(self) -> None:
+        try:
+            self.refresh()
+        except Exception:
+            self.failures += 1
+            base_logger.get_logger().warning(
+                "Failed to fetch signing keys", url=self.url, exc_info=True
+            )
+
+    def _throttled(self, now: float) -> bool:
+        return self._attempted_at is not None and (
+            now - self._attempted_at < self.min_refresh_interval
+        )
+
+    def _missing(self, key_id: str, now: float) -> bool:
+        return not self._throttled(now) and (
+            self._refreshed_at is None or key_id not in self._verifiers
+        )
+
+    def _stale(self, now: float) -> bool:
+        refreshing = (
+            self._refresh_thread is not None and self._refresh_thread.is_alive()
+        )
+        return (
+            not refreshing
+            and not self._throttled(now)
+            and self._refreshed_at is not None
+            and now - self._refreshed_at >= self.refresh_interval
+        )
+
+    def get_verifier(self, key_id: str) -> "Optional[crypt.Verifier]":
+        now = time.monotonic()
+        if self._missing(key_id, now):
+            # Fetching under the lock so concurrent requests share a single fetch
+            with self._lock:
+                now = time.monotonic()
+                if self._missing(key_id, now):
+                    self._attempted_at = now
+                    self._try_refresh()
+        elif self._stale(now):
+            with self._lock:
+                now = time.monotonic()
+                if self._stale(now):
+                    self._attempted_at = now
+                    self._refresh_thread = threading.Thread(
+                        target=self._try_refresh, name="jwks-refresh", daemon=True
+                    )
+                    self._refresh_thread.start()
+
+        return self._verifiers.get(key_id)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "keys": len(self._verifiers),
+        }
+
+
+class TokenVerifier:
+    """Verifies RS256 bearer tokens against the signing keys of trusted issuers.
+
+    `issuers` maps each trusted issuer to its `JWKS`, tokens must be issued for
+    `audience` and `leeway` seconds of clock skew are allowed. The claims of
+    verified tokens are cached until the token expires, keyed by a digest of the
+    token, so repeated requests with the same token skip the signature check.
+    Callers get a shallow copy of the claims which they can update.
+    """
+
+    def __init__(
+        self,
+        issuers: Mapping[str, JWKS],
+        audience: str = fluidly_audience,
+        leeway: float = 0,
+        max_size: int = 1024,
+    ) -> None:
+        self.issuers = dict(issuers)
+        self.audience = audience
+        self.leeway = leeway
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._claims: "OrderedDict[bytes, CachedClaims]" = OrderedDict()
+
+    def verify(self, token: str) -> Dict[str, Any]:
+        """Returns the claims of a valid token, raises `InvalidTokenException`
+        otherwise"""
+        key = hashlib.sha256(token.encode("utf-8")).digest()
+        now = time.time()
+        cached_claims = self._get_cached(key, now)
+        if cached_claims is not None:
+            return cached_claims
+
+        return self._cache(key, self.decode(token, now))
+
+    async def verify_async(self, token: str) -> Dict[str, Any]:
+        """Same as `verify` but checks tokens missing from the cache in the
+        default executor, as they may wait for the signing keys to be fetched"""
+        import asyncio
+
+        key = hashlib.sha256(token.encode("utf-8")).digest()
+        now = time.time()
+        cached_claims = self._get_cached(key, now)
+        if cached_claims is not None:
+            return cached_claims
+
+        claims = await asyncio.get_event_loop().run_in_executor(
+            None, self.decode, token, now
+        )
+        return self._cache(key, claims)
+
+    def _get_cached(self, key: bytes, now: float) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            cached = self._claims.get(key)
+            if cached is not None:
+                expires_at, claims = cached
+                if now < expires_at + self.leeway:
+                    self._claims.move_to_end(key)
+                    self.hits += 1
+                    return dict(claims)
+                del self._claims[key]
+            self.misses += 1
+        return None
+
+    def _cache(self, key: bytes, claims: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            self._claims[key] = (float(claims["exp"]), claims)
+            self._claims.move_to_end(key)
+            while len(self._claims) > self.max_size:
+                self._claims.popitem(last=False)
+        return dict(claims)
+
+    def decode(self, token: str, now: float) -> Dict[str, Any]:
+        try:
+            header_segment, payload_segment, signature_segment = token.split(".")
+            header = json.loads(base64url_decode(header_segment))
+            claims = json.loads(base64url_decode(payload_segment))
+            signature = base64url_decode(signature_segment)
+        except ValueError:
+            raise InvalidTokenException("Malformed token")
+
+        if not isinstance(header, dict) or not isinstance(claims, dict):
+            raise InvalidTokenException("Malformed token")
+        if header.get("alg") != "RS256":
+            raise InvalidTokenException("Unsupported signing algorithm")
+
+        issuer = claims.get("iss")
+        jwks = self.issuers.get(issuer) if isinstance(issuer, str) else None
+        if jwks is None:
+            raise InvalidTokenException("Untrusted issuer")
+        key_id = header.get("kid")
+        if not isinstance(key_id, str):
+            raise InvalidTokenException("Invalid signing key id")
+        verifier = jwks.get_verifier(key_id)
+        if verifier is None:
+            raise InvalidTokenException("Unknown signing key")
+        signed_section = f"{header_segment}.{payload_segment}".encode("utf-8")
+        if not verifier.verify(signed_section, signature):  # type: ignore
+            raise InvalidTokenException("Invalid signature")
+
+        self.validate(claims, now)
+        return claims
+
+    def validate(self, claims: Dict[str, Any], now: float) -> None:
+        expires_at = claims.get("exp")
+        if not isinstance(expires_at, (int, float)):
+            raise InvalidTokenException("Missing expiry")
+        if now >= expires_at + self.leeway:
+            raise InvalidTokenException("Token has expired")
+
+        for claim in ("nbf", "iat"):
+            valid_from = claims.get(claim)
+            if isinstance(valid_from, (int, float)) and now + self.leeway < valid_from:
+                raise InvalidTokenException("Token is not yet valid")
+
+        audiences = claims.get("aud")
+        if isinstance(audiences, str):
+            audiences = [audiences]
+        if not isinstance(audiences, list) or self.audience not in audiences:
+            raise InvalidTokenException("Invalid audience")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._claims.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._claims),
+            }
+        stats["issuers"] = {
+            issuer: jwks.stats() for issuer, jwks in self.issuers.items()
+        }
+        return stats
+
+
+_token_verifier: Optional[TokenVerifier] = None
+
+
+def enable_token_verification(
+    issuers: Mapping[str, str],
+    audience: str = fluidly_audience,
+    leeway: float = 0,
+    max_size: int = 1024,
+    **kwargs: Any,
+) -> TokenVerifier:
+    """Verifies the bearer tokens of incoming requests in process instead of
+    relying on the user info header set by Google Cloud Endpoints.
+
+    `issuers` maps each trusted issuer to its JWKS url, e.g.
+    `{"https://fluidly.eu.auth0.com/": "https://fluidly.eu.auth0.com/.well-known/jwks.json"}`,
+    other options are passed to `JWKS`.
+    """
+    global _token_verifier
+
+    _token_verifier = TokenVerifier(
+        {issuer: JWKS(url, **kwargs) for issuer, url in issuers.items()},
+        audience=audience,
+        leeway=leeway,
+        max_size=max_size,
+    )
+    return _token_verifier
+
+
+def disable_token_verification() -> None:
+    global _token_verifier
+
+    _token_verifier = None
+
+
+def get_token_verifier() -> Optional[TokenVerifier]:
+    return _token_verifier
+
+
+def _get_token(authorization: Optional[str]) -> Tuple[TokenVerifier, str]:
+    token_verifier = get_token_verifier()
+    if token_verifier is None:
+        raise ValueError("Token verification is not enabled")
+
+    token = get_bearer_token(authorization)
+    if token is None:
+        raise InvalidTokenException("Missing bearer token")
+    return token_verifier, token
+
+
+def verify_authorization(authorization: Optional[str]) -> Dict[str, Any]:
+    """Returns the claims of the bearer token in an Authorization header, token
+    verification must be enabled"""
+    token_verifier, token = _get_token(authorization)
+    return token_verifier.verify(token)
+
+
+async def verify_authorization_async(authorization: Optional[str]) -> Dict[str, Any]:
+    """Same as `verify_authorization` without blocking the event loop"""
+    token_verifier, token = _get_token(authorization)
+    return await token_verifier.verify_async(token)
@@ -1,29 +1,229 @@
+import hashlib
 import json
 import os
+import threading
 import time
-from typing import Any, Mapping, Optional, Tuple
+from collections import OrderedDict
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Hashable,
+    List,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+)
 
-from google.auth import crypt, jwt
-from google.auth.crypt.base import Signer
-from google.oauth2.service_account import Credentials
+from fluidly.auth.lazy import LazyModule
+
+if TYPE_CHECKING:
+    from google.auth import crypt, jwt
+    from google.auth.crypt.base import Signer
+    from google.oauth2 import service_account
+else:
+    # Imported when first signing, google.auth is slow to import
+    crypt = LazyModule("google.auth.crypt")
+    jwt = LazyModule("google.auth.jwt")
+    service_account = LazyModule("google.oauth2.service_account")
 
 audience = "https://api.fluidly.com"
+token_lifetime = 3600
 
+# Registered claims set by `generate_jwt`, they are overwritten on every call so
+# they are not part of the token cache key.
+PAYLOAD_CLAIMS = ("iat", "exp", "iss", "aud", "sub", "email")
 
-def get_service_account_and_signer(
-    path: Optional[str], info: Optional[Mapping[str, str]]
-) -> Tuple[str, Signer]:
+CachedToken = Tuple[bytes, Dict[str, Any]]
+# Credentials path, credentials info and claims a token was signed from
+TokenSource = Tuple[Optional[str], Optional[str], Dict[str, Any]]
+
+
+def get_credentials_version(path: str) -> Optional[float]:
+    """Returns the modification time of a credentials file, `None` when it
+    cannot be read"""
     try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+class TokenCache:
+    """Process-wide cache of signed service account tokens.
+
+    Tokens are keyed by credentials source and claim set and are re-signed once
+    they are within `refresh_margin` seconds of their expiry, or once their
+    credentials file changes. The sources of the tokens are kept so they can be
+    re-signed in the background before then.
+    """
+
+    def __init__(self, refresh_margin: int = 300, max_size: int = 1024) -> None:
+        self.refresh_margin = refresh_margin
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._tokens: "OrderedDict[Hashable, CachedToken]" = OrderedDict()
+        self._sources: Dict[Hashable, TokenSource] = {}
+        self._used: Set[Hashable] = set()
+
+    @staticmethod
+    def key(path: Optional[str], info: Optional[str], claims: Any) -> Hashable:
+        if path is not None:
+            # Tokens signed before the credentials file changed are not reused
+            credentials_key: Tuple[Any, ...] = (
+                "path",
+                path,
+                get_credentials_version(path),
+            )
+        else:
+            credentials_key = (
+                "info",
+                hashlib.sha256((info or "").encode("utf-8")).hexdigest(),
+            )
+
+        claims_key = json.dumps(
+            {k: v for k, v in claims.items() if k not in PAYLOAD_CLAIMS},
+            sort_keys=True,
+            default=str,
+        )
+        return credentials_key, claims_key
+
+    def get(self, key: Hashable, now: int) -> Optional[CachedToken]:
+        with self._lock:
+            cached = self._tokens.get(key)
+            if cached is not None:
+                _, payload = cached
+                if payload["iat"] <= now < payload["exp"] - self.refresh_margin:
+                    self._tokens.move_to_end(key)
+                    self._used.add(key)
+                    self.hits += 1
+                    return cached
+                self._remove(key)
+
+            self.misses += 1
+            return None
+
+    def set(
+        self,
+        key: Hashable,
+        token: bytes,
+        payload: Dict[str, Any],
+        source: Optional[TokenSource] = None,
+    ) -> None:
+        with self._lock:
+            self._tokens[key] = (token, payload)
+            self._tokens.move_to_end(key)
+            self._used.discard(key)
+            if source is not None:
+                self._sources[key] = source
+            while len(self._tokens) > self.max_size:
+                self._remove(next(iter(self._tokens)))
+
+    def _remove(self, key: Hashable) -> None:
+        del self._tokens[key]
+        self._sources.pop(key, None)
+        self._used.discard(key)
+
+    def due(self, now: int, refresh_at: float) -> List[Tuple[Hashable, TokenSource]]:
+        """Returns the tokens used since they were signed which are past the
+        `refresh_at` fraction of their lifetime"""
+        with self._lock:
+            return [
+                (key, self._sources[key])
+                for key, (_, payload) in self._tokens.items()
+                if key in self._used
+                and key in self._sources
+                and payload["iat"] + refresh_at * (payload["exp"] - payload["iat"])
+                <= now
+                < payload["exp"]
+            ]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._tokens.clear()
+            self._sources.clear()
+            self._used.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._tokens)}
+
+
+token_cache = TokenCache()
+
+
+class SignerRegistry:
+    """Loaded service account emails and signers.
+
+    Entries are keyed by credentials path or by a digest of the credentials info.
+    Path based entries are reloaded when the file's modification time changes.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._signers: Dict[Hashable, Tuple[float, str, "Signer"]] = {}
+
+    @staticmethod
+    def load(
+        path: Optional[str], info: Optional[Mapping[str, str]]
+    ) -> Tuple[str, "Signer"]:
         if path is not None:
-            return Credentials.from_service_account_file(
+            return service_account.Credentials.from_service_account_file(
                 path
             ).service_account_email, crypt.RSASigner.from_service_account_file(path)
         elif info is not None:
-            return Credentials.from_service_account_info(
+            return service_account.Credentials.from_service_account_info(
                 info
             ).service_account_email, crypt.RSASigner.from_service_account_info(info)
         else:
             raise ValueError("Credentials path or info must be set")
+
+    def get(
+        self, path: Optional[str], info: Optional[Mapping[str, str]]
+    ) -> Tuple[str, "Signer"]:
+        version: Optional[float]
+        if path is not None:
+            key: Hashable = ("path", path)
+            # When the file cannot be read the loader raises the appropriate error
+            version = get_credentials_version(path)
+        elif info is not None:
+            key = (
+                "info",
+                hashlib.sha256(
+                    json.dumps(info, sort_keys=True).encode("utf-8")
+                ).hexdigest(),
+            )
+            version = 0
+        else:
+            raise ValueError("Credentials path or info must be set")
+
+        with self._lock:
+            cached = self._signers.get(key)
+            if cached is not None and cached[0] == version:
+                return cached[1], cached[2]
+
+            sa_email, signer = self.load(path, info)
+            if version is not None:
+                self._signers[key] = (version, sa_email, signer)
+            return sa_email, signer
+
+    def clear(self) -> None:
+        with self._lock:
+            self._signers.clear()
+
+
+signer_registry = SignerRegistry()
+
+
+def get_service_account_and_signer(
+    path: Optional[str], info: Optional[Mapping[str, str]]
+) -> Tuple[str, "Signer"]:
+    try:
+        return signer_registry.get(path, info)
     except FileNotFoundError or AttributeError:
         raise Exception("Credentials must be a path or json")
 
@@ -33,7 +233,11 @@ def generate_jwt(
     google_application_credentials: Optional[str] = None,
     google_application_credentials_info: Optional[str] = None,
 ) -> bytes:
-    """Generates a signed JSON Web Token using a Google API Service Account."""
+    """Generates a signed JSON Web Token using a Google API Service Account.
+
+    Signed tokens are cached in `token_cache` and reused until they get close to
+    their expiry, so repeated calls with the same claims do not re-sign.
+    """
 
     auth0_jwt_token = os.getenv("AUTH0_JWT_TOKEN")
     if auth0_jwt_token:
@@ -42,13 +246,8 @@ def generate_jwt(
     if google_application_credentials is None:
         google_application_credentials = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
 
-    parsed_google_application_credentials_info = None
     if google_application_credentials_info is None:
         google_application_credentials_info = os.getenv("GOOGLE_CREDENTIALS")
-    if google_application_credentials_info:
-        parsed_google_application_credentials_info = json.loads(
-            google_application_credentials_info
-        )
 
     if not google_application_credentials and not google_application_credentials_info:
         raise ValueError(
@@ -57,13 +256,57 @@ def generate_jwt(
 
     now = int(time.time())
 
+    cache_key = token_cache.key(
+        google_application_credentials, google_application_credentials_info, claims
+    )
+    cached = token_cache.get(cache_key, now)
+    if cached is not None:
+        cached_jwt, cached_payload = cached
+        claims.update(cached_payload)
+        return cached_jwt
+
+    source_claims = {k: v for k, v in claims.items() if k not in PAYLOAD_CLAIMS}
+    jwt_string, payload = sign_jwt(
+        claims,
+        google_application_credentials,
+        google_application_credentials_info,
+        now,
+    )
+    token_cache.set(
+        cache_key,
+        jwt_string,
+        payload,
+        (
+            google_application_credentials,
+            google_application_credentials_info,
+            source_claims,
+        ),
+    )
+
+    return jwt_string
+
+
+def sign_jwt(
+    claims: Any,
+    google_application_credentials: Optional[str],
+    google_application_credentials_info: Optional[str],
+    now: int,
+) -> Tuple[bytes, Dict[str, Any]]:
+    """Signs the claims updated with the registered claims, returns the token and
+    the registered claims"""
+    parsed_google_application_credentials_info = None
+    if google_application_credentials_info:
+        parsed_google_application_credentials_info = json.loads(
+            google_application_credentials_info
+        )
+
     sa_email, signer = get_service_account_and_signer(
         google_application_credentials, parsed_google_application_credentials_info
     )
 
     payload = {
         "iat": now,
-        "exp": now + 3600,
+        "exp": now + token_lifetime,
         # iss must match 'issuer' in the security configuration in your
         # swagger spec (e.g. service account email). It can be any string.
         "iss": sa_email,
@@ -78,5 +321,15 @@ def generate_jwt(
     claims.update(payload)
 
     jwt_string: bytes = jwt.encode(signer, claims)
+    return jwt_string, payload
 
-    return jwt_string
+
+def refresh_tokens(refresh_at: float) -> int:
+    """Re-signs the cached tokens due for a refresh, returns how many were
+    re-signed"""
+    now = int(time.time())
+    due = token_cache.due(now, refresh_at)
+    for key, (path, info, claims) in due:
+        jwt_string, payload = sign_jwt(dict(claims), path, info, now)
+        token_cache.set(key, jwt_string, payload, (path, info, claims))
+    return len(due)
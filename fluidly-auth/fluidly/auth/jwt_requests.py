@@ -1,15 +1,230 @@
-from typing import Any
+import random
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional, Tuple
 
-import requests
-from requests import Response
+from fluidly.auth.deadline import DeadlineExceededException, is_exceeded, remaining
+from fluidly.auth.lazy import LazyModule
 
+if TYPE_CHECKING:
+    import requests
+    from requests import Response, Session
+    from urllib3.util import Timeout as UrllibTimeout
+else:
+    # Imported when the session is first set up, requests is slow to import
+    requests = LazyModule("requests")
 
-def make_jwt_request(signed_jwt: Any, url: Any) -> Response:
-    """Makes an authorized request to the endpoint"""
+DEFAULT_CONNECT_TIMEOUT = 3.05
+DEFAULT_READ_TIMEOUT = 10.0
+RETRY_STATUSES = (502, 503, 504)
+
+Timeout = Tuple[float, float]
+
+
+def __getattr__(name: str) -> Any:
+    # JitteredRetry extends urllib3 so it is only imported when asked for
+    if name == "JitteredRetry":
+        from fluidly.auth.retry import JitteredRetry
+
+        return JitteredRetry
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+_session: "Optional[Session]" = None
+_deadline_session: "Optional[Session]" = None
+_session_lock = threading.RLock()
+_timeout: Timeout = (DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT)
+_max_retries = 2
+_backoff_factor = 0.1
+
+
+def configure_session(
+    pool_connections: int = 10,
+    pool_maxsize: int = 10,
+    max_retries: int = 2,
+    backoff_factor: float = 0.1,
+    connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+    read_timeout: float = DEFAULT_READ_TIMEOUT,
+) -> "Session":
+    """Replaces the process-wide keep-alive session used for JWT requests.
+
+    Idempotent requests are retried at most `max_retries` times on connection
+    errors and on 502/503/504 responses, with a jittered backoff whatever their
+    Retry-After header says. Requests bounded by a deadline are
+    retried only while the deadline leaves time for it.
+    """
+    from fluidly.auth.retry import JitteredRetry
+
+    global _session, _deadline_session, _timeout, _max_retries, _backoff_factor
+
+    retry = JitteredRetry(
+        total=max_retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUSES,
+        raise_on_status=False,
+        # Retry-After would hold requests past their timeouts, back off instead
+        respect_retry_after_header=False,
+    )
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retry
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    # urllib3 would give each retry the full timeout, so requests bounded by a
+    # deadline make single attempts through the same connection pools
+    single_attempt_adapter = requests.adapters.HTTPAdapter(max_retries=0)
+    single_attempt_adapter.poolmanager = adapter.poolmanager
+    deadline_session = requests.Session()
+    deadline_session.mount("https://", single_attempt_adapter)
+    deadline_session.mount("http://", single_attempt_adapter)
+
+    with _session_lock:
+        previous_session, _session = _session, session
+        previous_deadline_session, _deadline_session = (
+            _deadline_session,
+            deadline_session,
+        )
+        _timeout = (connect_timeout, read_timeout)
+        _max_retries = max_retries
+        _backoff_factor = backoff_factor
+
+    if previous_session is not None:
+        previous_session.close()
+    if previous_deadline_session is not None:
+        previous_deadline_session.close()
+
+    return session
+
+
+def get_timeout(deadline_at: Optional[float] = None) -> Timeout:
+    """Returns the configured timeouts capped by the time left before
+    `deadline_at`, raises `DeadlineExceededException` once it has passed"""
+    connect_timeout, read_timeout = _timeout
+    time_left = remaining(deadline_at)
+    if time_left is None:
+        return _timeout
+    return min(connect_timeout, time_left), min(read_timeout, time_left)
+
+
+def get_session() -> "Session":
+    session = _session
+    if session is None:
+        with _session_lock:
+            session = _session if _session is not None else configure_session()
+    return session
+
+
+def get_deadline_session() -> "Session":
+    get_session()
+    assert _deadline_session is not None
+    return _deadline_session
+
+
+def make_jwt_request(
+    signed_jwt: Any,
+    url: Any,
+    timeout: Optional[Timeout] = None,
+    headers: Optional[Dict[str, str]] = None,
+    deadline_at: Optional[float] = None,
+) -> "Response":
+    """Makes an authorized request to the endpoint, the request and its retries
+    give up by the `deadline_at` monotonic time"""
     headers = {
         "Authorization": "Bearer {}".format(signed_jwt.decode("utf-8")),
         "content-type": "text/html",
+        **(headers or {}),
     }
 
-    response = requests.get(url, headers=headers)
+    if deadline_at is not None:
+        return make_request_with_deadline(url, headers, timeout, deadline_at)
+
+    response = get_session().get(url, headers=headers, timeout=timeout or _timeout)
     return response
+
+
+def make_request_with_deadline(
+    url: Any, headers: Dict[str, str], timeout: Optional[Timeout], deadline_at: float
+) -> "Response":
+    session = get_deadline_session()
+    return send_with_retries(
+        lambda attempt_timeout: session.get(
+            url, headers=headers, timeout=attempt_timeout  # type: ignore
+        ),
+        timeout or _timeout,
+        _max_retries,
+        _backoff_factor,
+        deadline_at,
+    )
+
+
+def get_attempt_timeout(
+    timeout: Timeout, deadline_at: Optional[float]
+) -> "UrllibTimeout":
+    """Returns the timeouts of a single attempt, requests passes urllib3 timeouts
+    through and `total` caps the connection and read time of the attempt by the
+    time left before `deadline_at`"""
+    from urllib3.util import Timeout as UrllibTimeout
+
+    connect_timeout, read_timeout = timeout
+    return UrllibTimeout(
+        connect=connect_timeout, read=read_timeout, total=remaining(deadline_at)
+    )
+
+
+def get_backoff(
+    attempt: int, backoff_factor: float, deadline_at: Optional[float]
+) -> float:
+    """Full jitter exponential backoff, cut short by the deadline"""
+    backoff = random.uniform(0, backoff_factor * pow(2, attempt))
+    if deadline_at is not None:
+        backoff = min(backoff, max(deadline_at - time.monotonic(), 0))
+    return backoff
+
+
+def send_with_retries(
+    send: Callable[["UrllibTimeout"], "Response"],
+    timeout: Timeout,
+    retries: int,
+    backoff_factor: float,
+    deadline_at: Optional[float] = None,
+    record: Optional[Callable[[str, float], None]] = None,
+) -> "Response":
+    """Sends a request with `send`, called with the timeouts of each attempt.
+
+    Connection errors and 502/503/504 responses are retried at most `retries`
+    times, the last response is returned once they are exhausted. Attempts and
+    backoffs are bounded by `deadline_at`, `DeadlineExceededException` is raised
+    once it passes. `record` is called with the status code, or "error", and the
+    duration of every attempt.
+    """
+    attempt = 0
+    while True:
+        # Raises `DeadlineExceededException` once the deadline has passed
+        attempt_timeout = get_attempt_timeout(timeout, deadline_at)
+        start = time.monotonic()
+        try:
+            response = send(attempt_timeout)
+        except requests.exceptions.ConnectionError as e:
+            if record is not None:
+                record("error", time.monotonic() - start)
+            if is_exceeded(deadline_at):
+                raise DeadlineExceededException() from e
+            if attempt >= retries:
+                raise
+        except requests.exceptions.Timeout as e:
+            if record is not None:
+                record("error", time.monotonic() - start)
+            if is_exceeded(deadline_at):
+                raise DeadlineExceededException() from e
+            raise
+        else:
+            if record is not None:
+                record(str(response.status_code), time.monotonic() - start)
+            if response.status_code not in RETRY_STATUSES or attempt >= retries:
+                return response
+            response.close()
+
+        time.sleep(get_backoff(attempt, backoff_factor, deadline_at))
+        attempt += 1
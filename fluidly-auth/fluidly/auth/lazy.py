@@ -0,0 +1,37 @@
+import importlib
+from types import ModuleType
+from typing import Any, Optional
+
+
+class LazyModule:
+    """Stands in for a module which is only imported on first attribute access.
+
+    Keeps heavy dependencies such as `google.auth` or `requests` out of the import
+    time of `fluidly.auth`, which matters for the cold start of scale-to-zero
+    services. Attributes set on the stand-in are set on the module, so patching
+    it in tests behaves as patching the module.
+    """
+
+    def __init__(self, name: str) -> None:
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_module", None)
+
+    def _load(self) -> ModuleType:
+        module: Optional[ModuleType] = object.__getattribute__(self, "_module")
+        if module is None:
+            # The import system lock makes concurrent first accesses safe
+            module = importlib.import_module(object.__getattribute__(self, "_name"))
+            object.__setattr__(self, "_module", module)
+        return module
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self._load(), name, value)
+
+    def __delattr__(self, name: str) -> None:
+        delattr(self._load(), name)
+
+    def __repr__(self) -> str:
+        return f"<lazy module {object.__getattribute__(self, '_name')!r}>"
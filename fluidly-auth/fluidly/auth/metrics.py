@@ -0,0 +1,160 @@
+import bisect
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+CONNECTION = "connection"
+ADMIN = "admin"
+ENDPOINTS = (CONNECTION, ADMIN)
+
+GRANTED = "granted"
+DENIED = "denied"
+PAYLOAD_ERROR = "payload_error"
+REQUEST_ERROR = "request_error"
+OUTCOMES = (GRANTED, DENIED, PAYLOAD_ERROR, REQUEST_ERROR)
+
+# Exponential bucket bounds in seconds from 1ms to ~60s, 25% apart
+DEFAULT_BUCKETS = tuple(0.001 * pow(1.25, i) for i in range(50))
+
+PERCENTILES = (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))
+
+
+def get_endpoint(request_url: str) -> str:
+    # Matching the whole path, connection urls end with the connection id
+    if request_url.rstrip("/").endswith("/user-permissions/admin"):
+        return ADMIN
+    return CONNECTION
+
+
+class LatencyHistogram:
+    """Fixed buckets histogram of latencies in seconds.
+
+    Memory does not grow with the number of observations, percentiles are
+    interpolated within a bucket so they are precise to the bucket width.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self.bounds = sorted(buckets)
+        # The last count is for observations above the highest bound
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def record(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+
+        rank = q * self.count
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            if count and cumulative + count >= rank:
+                lower = self.bounds[index - 1] if index > 0 else 0.0
+                upper = self.bounds[index] if index < len(self.bounds) else self.max
+                value = lower + (upper - lower) * (rank - cumulative) / count
+                return min(value, self.max)
+            cumulative += count
+        return self.max
+
+    def buckets(self) -> List[Tuple[float, int]]:
+        """Returns the cumulative count of observations for each upper bound"""
+        cumulative = 0
+        buckets = []
+        for bound, count in zip(self.bounds + [float("inf")], self.counts):
+            cumulative += count
+            buckets.append((bound, cumulative))
+        return buckets
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "max": self.max,
+            **{name: self.percentile(q) for name, q in PERCENTILES},
+        }
+
+
+class PermissionsMetrics:
+    """In-memory latency histograms and outcome counters of permission checks
+    against the user permissions service, per endpoint type."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self._buckets = buckets
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, LatencyHistogram] = {}
+        self._outcomes: Dict[str, Dict[str, int]] = {}
+        self.reset()
+
+    def record(self, endpoint: str, outcome: str, duration: float) -> None:
+        with self._lock:
+            if endpoint not in self._histograms:
+                self._histograms[endpoint] = LatencyHistogram(self._buckets)
+                self._outcomes[endpoint] = dict.fromkeys(OUTCOMES, 0)
+            self._histograms[endpoint].record(duration)
+            self._outcomes[endpoint][outcome] += 1
+
+    def histogram(self, endpoint: str) -> Optional[LatencyHistogram]:
+        return self._histograms.get(endpoint)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Returns the count, sum, max, p50, p95 and p99 latencies and the outcome
+        counters for each endpoint type"""
+        with self._lock:
+            snapshot = {}
+            for endpoint, histogram in self._histograms.items():
+                snapshot[endpoint] = {
+                    **histogram.summary(),
+                    "outcomes": dict(self._outcomes[endpoint]),
+                }
+            return snapshot
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms = {
+                endpoint: LatencyHistogram(self._buckets) for endpoint in ENDPOINTS
+            }
+            self._outcomes = {
+                endpoint: dict.fromkeys(OUTCOMES, 0) for endpoint in ENDPOINTS
+            }
+
+
+permissions_metrics = PermissionsMetrics()
+
+
+class RequestMetrics:
+    """In-memory latency histograms per request method and response counts per
+    status code, failed requests are counted with the "error" status."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self._buckets = buckets
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, LatencyHistogram] = {}
+        self._statuses: Dict[str, int] = {}
+
+    def record(self, method: str, status: str, duration: float) -> None:
+        with self._lock:
+            histogram = self._histograms.get(method)
+            if histogram is None:
+                histogram = self._histograms[method] = LatencyHistogram(self._buckets)
+            histogram.record(duration)
+            self._statuses[status] = self._statuses.get(status, 0) + 1
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                "latency": {
+                    method: histogram.summary()
+                    for method, histogram in self._histograms.items()
+                },
+                "statuses": dict(self._statuses),
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms = {}
+            self._statuses = {}
@@ -1,10 +1,44 @@
 import os
 import time
-from typing import Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Tuple
 
+from fluidly.auth.cache import (
+    ADMIN_SCOPE,
+    Scope,
+    StaleDecision,
+    Validators,
+    connection_scope,
+    get_permissions_cache,
+    get_subject,
+)
+from fluidly.auth.circuit_breaker import CircuitOpenException, get_circuit_breaker
+from fluidly.auth.deadline import (
+    DeadlineExceededException,
+    get_deadline_at,
+    is_exceeded,
+    remaining,
+)
+from fluidly.auth.hedging import get_hedger
 from fluidly.auth.jwt import generate_jwt
-from fluidly.auth.jwt_requests import make_jwt_request
-from fluidly.structlog import base_logger
+from fluidly.auth.jwt_requests import Timeout, get_timeout, make_jwt_request
+from fluidly.auth.lazy import LazyModule
+from fluidly.auth.metrics import (
+    DENIED,
+    GRANTED,
+    PAYLOAD_ERROR,
+    REQUEST_ERROR,
+    get_endpoint,
+    permissions_metrics,
+)
+from fluidly.auth.single_flight import permissions_single_flight
+from fluidly.structlog.server_timing import measure
+
+if TYPE_CHECKING:
+    from fluidly.structlog import base_logger
+else:
+    # Imported when first logging, structlog is slow to import
+    base_logger = LazyModule("fluidly.structlog.base_logger")
 
 
 class UserPermissionsRequestException(Exception):
@@ -15,6 +49,51 @@ class UserPermissionsPayloadException(Exception):
     pass
 
 
+class UserPermissionsUnavailableException(UserPermissionsRequestException):
+    """Raised without calling the user permissions service while its circuit
+    breaker is open"""
+
+
+class UserPermissionsDeadlineExceededException(
+    UserPermissionsRequestException, DeadlineExceededException
+):
+    """Raised when the deadline of the check passes before the user permissions
+    service answers"""
+
+
+class TooManyConnectionsException(ValueError):
+    """Raised when a batch check asks for more connections than
+    `get_max_connections`"""
+
+
+DEFAULT_MAX_CONNECTIONS = 100
+
+_max_connections = DEFAULT_MAX_CONNECTIONS
+
+
+def configure_max_connections(max_connections: int) -> None:
+    """Sets how many connections a batch permission check accepts, larger batches
+    are rejected before any permissions are checked"""
+    global _max_connections
+
+    _max_connections = max_connections
+
+
+def get_max_connections() -> int:
+    return _max_connections
+
+
+def get_unique_connection_ids(connection_ids: Iterable[str]) -> List[str]:
+    """Returns the connection ids without duplicates, raises
+    `TooManyConnectionsException` when there are more than `get_max_connections`"""
+    unique_connection_ids = list(dict.fromkeys(connection_ids))
+    if len(unique_connection_ids) > _max_connections:
+        raise TooManyConnectionsException(
+            f"At most {_max_connections} connections can be checked at once"
+        )
+    return unique_connection_ids
+
+
 def get_fluidly_api_url(fluidly_api_url: Optional[str] = None) -> str:
     if not fluidly_api_url:
         fluidly_api_url = os.getenv("FLUIDLY_API_URL")
@@ -24,22 +103,159 @@ def get_fluidly_api_url(fluidly_api_url: Optional[str] = None) -> str:
     return fluidly_api_url
 
 
-def check_permissions(original_payload: Any, request_url: str, **kwargs: Any) -> bool:
+def send_permissions_request(
+    signed_jwt: Any,
+    request_url: str,
+    headers: Optional[Dict[str, str]] = None,
+    timeout: Optional[Timeout] = None,
+    deadline_at: Optional[float] = None,
+) -> Any:
+    hedger = get_hedger()
+    if hedger is not None:
+        return hedger.call(
+            make_jwt_request,
+            signed_jwt,
+            request_url,
+            timeout,
+            headers=headers,
+            deadline_at=deadline_at,
+        )
+    return make_jwt_request(
+        signed_jwt, request_url, timeout, headers=headers, deadline_at=deadline_at
+    )
+
+
+def check_permissions(
+    original_payload: Any,
+    request_url: str,
+    deadline_at: Optional[float] = None,
+    **kwargs: Any,
+) -> bool:
+    return check_conditional_permissions(
+        original_payload, request_url, deadline_at=deadline_at, **kwargs
+    )[0]
+
+
+def check_conditional_permissions(
+    original_payload: Any,
+    request_url: str,
+    stale: Optional[StaleDecision] = None,
+    deadline_at: Optional[float] = None,
+    **kwargs: Any,
+) -> Tuple[bool, Optional[Validators]]:
+    """Checks permissions, revalidating the `stale` decision with a conditional
+    request when given. The request timeouts are capped by the time left before
+    the `deadline_at` monotonic time.
+
+    Returns the decision and the validators to store it with.
+    """
     start = time.time()
     signed_jwt = generate_jwt(original_payload)
+    headers = get_conditional_headers(stale)
     try:
-        response = make_jwt_request(signed_jwt, request_url)
+        timeout = get_timeout(deadline_at)
+        circuit_breaker = get_circuit_breaker()
+        if circuit_breaker is not None:
+            response = circuit_breaker.call(
+                send_permissions_request,
+                signed_jwt,
+                request_url,
+                headers,
+                timeout,
+                deadline_at,
+                deadline_at=deadline_at,
+            )
+        else:
+            response = send_permissions_request(
+                signed_jwt, request_url, headers, timeout, deadline_at
+            )
+    except CircuitOpenException:
+        record_request_error(request_url, start)
+        raise UserPermissionsUnavailableException()
     except Exception:
+        record_request_error(request_url, start)
+        if is_exceeded(deadline_at):
+            raise UserPermissionsDeadlineExceededException()
         raise UserPermissionsRequestException()
 
+    return handle_conditional_response(
+        response, stale, original_payload, request_url, start, **kwargs
+    )
+
+
+def get_validators(response: Any) -> Optional[Validators]:
+    validators = {
+        name: response.headers[header]
+        for name, header in (("etag", "ETag"), ("last_modified", "Last-Modified"))
+        if response.headers.get(header)
+    }
+    return validators or None
+
+
+def get_conditional_headers(stale: Optional[StaleDecision]) -> Dict[str, str]:
+    if stale is None:
+        return {}
+
+    validators = stale[1]
+    headers = {}
+    if "etag" in validators:
+        headers["If-None-Match"] = validators["etag"]
+    if "last_modified" in validators:
+        headers["If-Modified-Since"] = validators["last_modified"]
+    return headers
+
+
+def handle_conditional_response(
+    response: Any,
+    stale: Optional[StaleDecision],
+    original_payload: Any,
+    request_url: str,
+    start: float,
+    **kwargs: Any,
+) -> Tuple[bool, Optional[Validators]]:
+    """A 304 response keeps the `stale` decision without reading the body, any
+    other response is handled as a full one"""
+    if stale is None or response.status_code != 304:
+        authorised = handle_permissions_response(
+            response, original_payload, request_url, start, **kwargs
+        )
+        return authorised, get_validators(response)
+
+    granted, validators = stale
+    duration = time.time() - start
+    permissions_metrics.record(
+        get_endpoint(request_url), GRANTED if granted else DENIED, duration
+    )
+    base_logger.get_logger().info(
+        "Revalidated user permissions",
+        granted=granted,
+        url=request_url,
+        duration=duration,
+    )
+    return granted, {**validators, **(get_validators(response) or {})}
+
+
+def record_request_error(request_url: str, start: float) -> None:
+    permissions_metrics.record(
+        get_endpoint(request_url), REQUEST_ERROR, time.time() - start
+    )
+
+
+def handle_permissions_response(
+    response: Any, original_payload: Any, request_url: str, start: float, **kwargs: Any
+) -> bool:
+    """Turns a user permissions service response into a decision, works with both
+    `requests` and `httpx` responses."""
     logger = base_logger.get_logger()
     end = time.time()
+    endpoint = get_endpoint(request_url)
 
     try:
         response_json = response.json()
 
         authorised = response.status_code == 200 and response_json.get("grantAccess")
         if not authorised:
+            permissions_metrics.record(endpoint, DENIED, end - start)
             logger.warning(
                 "Authorisation failed",
                 response_json=response_json,
@@ -51,15 +267,16 @@ def check_permissions(original_payload: Any, request_url: str, **kwargs: Any) ->
                 **kwargs,
             )
             return False
+        permissions_metrics.record(endpoint, GRANTED, end - start)
         logger.info(
             "Called user permissions",
-            response_json=response_json,
             status_code=response.status_code,
             url=request_url,
             duration=end - start,
         )
         return True
     except Exception:
+        permissions_metrics.record(endpoint, PAYLOAD_ERROR, end - start)
         logger.warning(
             "Authorisation failed",
             status_code=response.status_code,
@@ -72,20 +289,150 @@ def check_permissions(original_payload: Any, request_url: str, **kwargs: Any) ->
         raise UserPermissionsPayloadException()
 
 
+def check_cached_permissions(
+    original_payload: Any,
+    scope: Scope,
+    request_url: str,
+    deadline_at: Optional[float] = None,
+    **kwargs: Any,
+) -> bool:
+    """Checks permissions through the permissions cache when it is enabled.
+
+    Concurrent checks for the same subject and url share a single request to the
+    user permissions service. Only decisions are cached, errors are raised and
+    retried on the next call. Expired decisions are revalidated with a
+    conditional request when the service sent an ETag or Last-Modified header.
+
+    Past the `deadline_at` monotonic time the check gives up with
+    `UserPermissionsDeadlineExceededException`, cached decisions are still
+    returned. A check sharing the request of another one waits for it at most
+    until its own deadline. When the deadline of the check making the shared
+    request passes first, the checks waiting for it make it again rather than
+    fail with it.
+    """
+    subject = get_subject(original_payload)
+    if subject is None:
+        return check_permissions(
+            original_payload, request_url, deadline_at=deadline_at, **kwargs
+        )
+
+    cache = get_permissions_cache()
+    key = (subject, scope)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    def check() -> bool:
+        checked_at = time.time()
+        if cache is None:
+            return check_permissions(
+                original_payload, request_url, deadline_at=deadline_at, **kwargs
+            )
+
+        authorised, validators = check_conditional_permissions(
+            original_payload,
+            request_url,
+            cache.get_stale(key),
+            deadline_at=deadline_at,
+            **kwargs,
+        )
+        cache.set(key, authorised, checked_at, validators)
+        return authorised
+
+    try:
+        return permissions_single_flight.do(
+            (subject, request_url),
+            check,
+            remaining(deadline_at),
+            retry_on=(DeadlineExceededException,),
+        )
+    except (TimeoutError, DeadlineExceededException) as e:
+        if isinstance(e, UserPermissionsDeadlineExceededException):
+            raise
+        raise UserPermissionsDeadlineExceededException() from e
+
+
+def get_user_permissions_url(
+    connection_id: str, fluidly_api_url: Optional[str] = None
+) -> str:
+    return f"{get_fluidly_api_url(fluidly_api_url)}/v1/user-permissions/connections/{connection_id}"
+
+
+def get_admin_permissions_url(fluidly_api_url: Optional[str] = None) -> str:
+    return f"{get_fluidly_api_url(fluidly_api_url)}/v1/user-permissions/admin"
+
+
 def check_user_permissions(
-    original_payload: Any, connection_id: str, fluidly_api_url: Optional[str] = None
+    original_payload: Any,
+    connection_id: str,
+    fluidly_api_url: Optional[str] = None,
+    deadline: Optional[float] = None,
 ) -> bool:
-    return check_permissions(
-        original_payload,
-        f"{get_fluidly_api_url(fluidly_api_url)}/v1/user-permissions/connections/{connection_id}",
-        connection_id=connection_id,
-    )
+    """`deadline` bounds the check to a number of seconds, on top of the
+    `request_deadline` of the current context"""
+    with measure("auth"):
+        return check_cached_permissions(
+            original_payload,
+            connection_scope(connection_id),
+            get_user_permissions_url(connection_id, fluidly_api_url),
+            deadline_at=get_deadline_at(deadline),
+            connection_id=connection_id,
+        )
 
 
 def check_admin_permissions(
-    original_payload: Any, fluidly_api_url: Optional[str] = None
+    original_payload: Any,
+    fluidly_api_url: Optional[str] = None,
+    deadline: Optional[float] = None,
 ) -> bool:
-    return check_permissions(
-        original_payload,
-        f"{get_fluidly_api_url(fluidly_api_url)}/v1/user-permissions/admin",
-    )
+    with measure("auth"):
+        return check_cached_permissions(
+            original_payload,
+            ADMIN_SCOPE,
+            get_admin_permissions_url(fluidly_api_url),
+            deadline_at=get_deadline_at(deadline),
+        )
+
+
+def check_user_permissions_many(
+    original_payload: Any,
+    connection_ids: Iterable[str],
+    fluidly_api_url: Optional[str] = None,
+    max_concurrency: int = 10,
+    deadline: Optional[float] = None,
+) -> Dict[str, bool]:
+    """Checks the user permissions for each connection, running at most
+    `max_concurrency` requests at once. The `deadline` applies to all the checks.
+
+    Returns a map of connection id to decision, any error fetching a decision is
+    raised. More connections than `get_max_connections` raise
+    `TooManyConnectionsException`.
+    """
+    fluidly_api_url = get_fluidly_api_url(fluidly_api_url)
+    unique_connection_ids = get_unique_connection_ids(connection_ids)
+    # Worker threads do not see the deadline of the calling context
+    deadline_at = get_deadline_at(deadline)
+
+    def check(connection_id: str) -> bool:
+        # Claims are updated when signing, each check gets its own copy
+        return check_cached_permissions(
+            dict(original_payload),
+            connection_scope(connection_id),
+            get_user_permissions_url(connection_id, fluidly_api_url),
+            deadline_at=deadline_at,
+            connection_id=connection_id,
+        )
+
+    with measure("auth"):
+        if len(unique_connection_ids) <= 1 or max_concurrency <= 1:
+            return {
+                connection_id: check(connection_id)
+                for connection_id in unique_connection_ids
+            }
+
+        with ThreadPoolExecutor(
+            max_workers=min(max_concurrency, len(unique_connection_ids))
+        ) as executor:
+            decisions = executor.map(check, unique_connection_ids)
+            return dict(zip(unique_connection_ids, decisions))
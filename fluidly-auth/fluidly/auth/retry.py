@@ -0,0 +1,12 @@
+import random
+
+from urllib3.util.retry import Retry
+
+
+class JitteredRetry(Retry):
+    """urllib3 retry policy using "full jitter" exponential backoff so retries
+    from many workers don't hit the service in lockstep."""
+
+    def get_backoff_time(self) -> float:
+        backoff = super().get_backoff_time()
+        return random.uniform(0, backoff) if backoff > 0 else 0
@@ -0,0 +1,169 @@
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+import requests
+from requests import Response, Session
+from requests.adapters import HTTPAdapter
+from urllib3.util import Timeout as UrllibTimeout
+
+from fluidly.auth.deadline import DeadlineExceededException, get_deadline_at
+from fluidly.auth.deadline import remaining as deadline_remaining
+from fluidly.auth.jwt import generate_jwt
+from fluidly.auth.jwt_requests import (
+    DEFAULT_CONNECT_TIMEOUT,
+    DEFAULT_READ_TIMEOUT,
+    get_attempt_timeout,
+    get_backoff,
+    send_with_retries,
+)
+from fluidly.auth.metrics import RequestMetrics
+
+IDEMPOTENT_METHODS = frozenset(("GET", "HEAD", "OPTIONS", "PUT", "DELETE"))
+
+
+def is_stream(body: Any) -> bool:
+    return any(hasattr(body, attr) for attr in ("read", "__next__", "__anext__"))
+
+
+class BaseServiceClient:
+    """Settings and helpers shared by the sync and async service clients"""
+
+    def __init__(
+        self,
+        base_url: str,
+        claims: Optional[Dict[str, Any]] = None,
+        google_application_credentials: Optional[str] = None,
+        google_application_credentials_info: Optional[str] = None,
+        max_retries: int = 2,
+        backoff_factor: float = 0.1,
+        connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+        read_timeout: float = DEFAULT_READ_TIMEOUT,
+        deadline: Optional[float] = None,
+    ) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.claims = claims or {}
+        self.google_application_credentials = google_application_credentials
+        self.google_application_credentials_info = google_application_credentials_info
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.deadline = deadline
+        self.metrics = RequestMetrics()
+
+    def url(self, path: str) -> str:
+        if path.startswith(("http://", "https://")):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def headers(self, headers: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+        # Signed tokens are cached so this only signs when the token is due
+        signed_jwt = generate_jwt(
+            dict(self.claims),
+            self.google_application_credentials,
+            self.google_application_credentials_info,
+        )
+        return {
+            "Authorization": f"Bearer {signed_jwt.decode('utf-8')}",
+            **(headers or {}),
+        }
+
+    def deadline_at(self, deadline: Optional[float]) -> Optional[float]:
+        """The deadline of the call, also bounded by the `request_deadline` of
+        the current context"""
+        return get_deadline_at(deadline if deadline is not None else self.deadline)
+
+    @staticmethod
+    def remaining(deadline_at: Optional[float]) -> Optional[float]:
+        return deadline_remaining(deadline_at)
+
+    def retries(self, method: str, body: Any) -> int:
+        # Streamed bodies are consumed by the first attempt
+        if method.upper() not in IDEMPOTENT_METHODS or is_stream(body):
+            return 0
+        return self.max_retries
+
+    def backoff(self, attempt: int, deadline_at: Optional[float]) -> float:
+        return get_backoff(attempt, self.backoff_factor, deadline_at)
+
+
+class ServiceClient(BaseServiceClient):
+    """Client calling other Fluidly APIs with a signed service account JWT.
+
+    Keeps a keep-alive connection pool per host, retries idempotent requests on
+    connection errors and 502/503/504 responses and records request latencies in
+    `metrics`. A `deadline` in seconds, per client or per call, bounds the whole
+    call including retries, for streamed responses it bounds getting the
+    response and each read of the body.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        pool_connections: int = 10,
+        pool_maxsize: int = 10,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(base_url, **kwargs)
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections, pool_maxsize=pool_maxsize
+        )
+        self.session: Session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def timeout(self, deadline_at: Optional[float]) -> UrllibTimeout:
+        return get_attempt_timeout(
+            (self.connect_timeout, self.read_timeout), deadline_at
+        )
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        deadline: Optional[float] = None,
+        headers: Optional[Dict[str, str]] = None,
+        **kwargs: Any,
+    ) -> Response:
+        method = method.upper()
+        url = self.url(path)
+
+        def send(timeout: UrllibTimeout) -> Response:
+            return self.session.request(
+                method,
+                url,
+                headers=self.headers(headers),
+                timeout=timeout,  # type: ignore
+                **kwargs,
+            )
+
+        def record(outcome: str, duration: float) -> None:
+            self.metrics.record(method, outcome, duration)
+
+        return send_with_retries(
+            send,
+            (self.connect_timeout, self.read_timeout),
+            self.retries(method, kwargs.get("data")),
+            self.backoff_factor,
+            self.deadline_at(deadline),
+            record,
+        )
+
+    def get(self, path: str, **kwargs: Any) -> Response:
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs: Any) -> Response:
+        return self.request("POST", path, **kwargs)
+
+    @contextmanager
+    def stream(self, method: str, path: str, **kwargs: Any) -> Iterator[Response]:
+        """Sends the request without reading the response body, the connection
+        goes back to the pool when leaving the context"""
+        response = self.request(method, path, stream=True, **kwargs)
+        try:
+            yield response
+        finally:
+            response.close()
+
+    def close(self) -> None:
+        self.session.close()
@@ -0,0 +1,146 @@
+import functools
+import threading
+import time
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Hashable,
+    Optional,
+    Tuple,
+    Type,
+    TypeVar,
+)
+
+from fluidly.auth.lazy import LazyModule
+
+if TYPE_CHECKING:
+    import asyncio
+else:
+    # Only used by async calls, asyncio is slow to import
+    asyncio = LazyModule("asyncio")
+
+T = TypeVar("T")
+
+
+class Call:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Coalesces concurrent calls sharing a key into a single call.
+
+    The first caller for a key runs the function, callers arriving while it is in
+    flight wait for it and share its result or exception. Works for threads with
+    `do` and for coroutines of the same event loop with `do_async`. Waiting
+    callers give up after `timeout` seconds with a `TimeoutError`, the call
+    carries on for the others.
+    """
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.collapsed = 0
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Call] = {}
+        self._tasks: Dict[Tuple[int, Hashable], "asyncio.Future[Any]"] = {}
+
+    def do(
+        self,
+        key: Hashable,
+        fn: Callable[[], T],
+        timeout: Optional[float] = None,
+        retry_on: Tuple[Type[BaseException], ...] = (),
+    ) -> T:
+        """Runs `fn` on the calling thread. Waiting callers do not share the
+        `retry_on` exceptions of the call, e.g. the deadline of the caller which
+        ran it passing, they make the call again with one of them running it."""
+        wait_until = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if call is None:
+                    self.calls += 1
+                    call = self._calls[key] = Call()
+                else:
+                    self.collapsed += 1
+
+            if leader:
+                break
+
+            wait_timeout = None
+            if wait_until is not None:
+                wait_timeout = max(wait_until - time.monotonic(), 0)
+            if not call.done.wait(wait_timeout):
+                raise TimeoutError()
+            if call.error is None:
+                shared_result: T = call.result
+                return shared_result
+            if not isinstance(call.error, retry_on):
+                raise call.error
+
+        try:
+            result = fn()
+            call.result = result
+            return result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def do_async(
+        self,
+        key: Hashable,
+        fn: Callable[[], Awaitable[T]],
+        timeout: Optional[float] = None,
+    ) -> T:
+        """The call runs as its own task so it is not cancelled with the caller
+        which started it, e.g. when its client disconnects, the other callers
+        still get its outcome"""
+        loop = asyncio.get_event_loop()
+        loop_key = (id(loop), key)
+
+        with self._lock:
+            task = self._tasks.get(loop_key)
+            if task is None:
+                task = self._tasks[loop_key] = asyncio.ensure_future(fn())
+                task.add_done_callback(functools.partial(self._call_done, loop_key))
+                self.calls += 1
+            else:
+                self.collapsed += 1
+
+        try:
+            shared_result: T = await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError()
+        return shared_result
+
+    def _call_done(
+        self, loop_key: Tuple[int, Hashable], task: "asyncio.Future[Any]"
+    ) -> None:
+        with self._lock:
+            if self._tasks.get(loop_key) is task:
+                del self._tasks[loop_key]
+        if not task.cancelled():
+            # Mark the exception as retrieved when every caller gave up
+            task.exception()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"calls": self.calls, "collapsed": self.collapsed}
+
+    def reset(self) -> None:
+        with self._lock:
+            self.calls = 0
+            self.collapsed = 0
+
+
+permissions_single_flight = SingleFlight()
@@ -0,0 +1,88 @@
+import threading
+from typing import Any, Dict, Optional
+
+from fluidly.auth.jwt import refresh_tokens
+from fluidly.structlog import base_logger
+
+
+class TokenRefresher:
+    """Re-signs the cached service tokens in a background thread.
+
+    Every `interval` seconds the tokens used since they were signed and past the
+    `refresh_at` fraction of their lifetime are re-signed, so request threads keep
+    finding a valid token in the cache. `refresh_at` must be reached before the
+    token cache refresh margin for requests to never sign inline.
+    """
+
+    def __init__(self, refresh_at: float = 0.8, interval: float = 30.0) -> None:
+        if not 0 < refresh_at < 1:
+            raise ValueError("refresh_at must be between 0 and 1")
+
+        self.refresh_at = refresh_at
+        self.interval = interval
+        self.refreshed = 0
+        self.failures = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def refresh(self) -> None:
+        try:
+            self.refreshed += refresh_tokens(self.refresh_at)
+        except Exception:
+            # Requests sign inline when the token is not refreshed in time
+            self.failures += 1
+            base_logger.get_logger().warning(
+                "Failed to refresh service tokens", exc_info=True
+            )
+
+    def run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.refresh()
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self.run, name="token-refresher", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._thread is not None,
+            "refreshed": self.refreshed,
+            "failures": self.failures,
+        }
+
+
+_token_refresher: Optional[TokenRefresher] = None
+
+
+def enable_token_refresher(**kwargs: Any) -> TokenRefresher:
+    """Starts re-signing the cached service tokens in the background, see
+    `TokenRefresher` for the options. Threads do not survive a fork so pre-forking
+    servers must enable it in each worker."""
+    disable_token_refresher()
+
+    global _token_refresher
+
+    _token_refresher = TokenRefresher(**kwargs)
+    _token_refresher.start()
+    return _token_refresher
+
+
+def disable_token_refresher() -> None:
+    global _token_refresher
+
+    if _token_refresher is not None:
+        _token_refresher.stop()
+    _token_refresher = None
+
+
+def get_token_refresher() -> Optional[TokenRefresher]:
+    return _token_refresher
@@ -11,7 +11,7 @@ URL = "https://github.com/fluidly/python-shared"
 EMAIL = "tech@fluidly.com"
 AUTHOR = "Fluidly"
 REQUIRES_PYTHON = ">=3.6.0"
-VERSION = "0.1.3"
+VERSION = "0.1.42"
 
 
 def local_dependencies(*packages):
@@ -28,7 +28,11 @@ REQUIRED = [
 
 DEPENDENCY_LINKS = [""]
 
-EXTRAS = {}
+EXTRAS = {
+    "async": ["httpx"],
+    "jwks": ["cryptography"],
+    "pubsub": ["fluidly-pubsub"],
+}
 
 try:
     package_root = os.path.abspath(os.path.dirname(__file__))
@@ -0,0 +1,85 @@
+import asyncio
+
+import httpx
+import pytest
+
+from fluidly.auth import async_jwt_requests
+from fluidly.auth.async_jwt_requests import (
+    close_async_client,
+    configure_async_client,
+    get_async_client,
+    make_async_jwt_request,
+)
+
+
+@pytest.fixture()
+def mocked_transport(monkeypatch):
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200, json={"grantAccess": True})
+
+    transport = httpx.MockTransport(handler)
+    monkeypatch.setattr(
+        async_jwt_requests.httpx,
+        "AsyncHTTPTransport",
+        lambda **kwargs: transport,
+    )
+    yield requests
+    configure_async_client()
+
+
+class TestMakeAsyncJWTRequests:
+    JWT = b"test"
+    URL = "https://test.url"
+
+    def test_making_signed_call(self, mocked_transport):
+        async def request():
+            response = await make_async_jwt_request(self.JWT, self.URL)
+            await close_async_client()
+            return response
+
+        response = asyncio.run(request())
+
+        assert response.status_code == 200
+        assert mocked_transport[0].headers["Authorization"] == "Bearer test"
+        assert mocked_transport[0].headers["content-type"] == "text/html"
+
+    def test_passing_timeout(self, mocked_transport):
+        async def request():
+            await make_async_jwt_request(self.JWT, self.URL, timeout=(1, 2))
+            await close_async_client()
+
+        asyncio.run(request())
+
+        assert mocked_transport[0].extensions["timeout"]["connect"] == 1
+        assert mocked_transport[0].extensions["timeout"]["read"] == 2
+
+    def test_reusing_client_within_loop(self, mocked_transport):
+        async def clients():
+            first, second = get_async_client(), get_async_client()
+            await close_async_client()
+            return first, second
+
+        first, second = asyncio.run(clients())
+
+        assert first is second
+
+    def test_new_client_per_loop(self, mocked_transport):
+        async def client():
+            return get_async_client()
+
+        assert asyncio.run(client()) is not asyncio.run(client())
+
+    def test_configures_timeout(self, mocked_transport):
+        configure_async_client(connect_timeout=1, read_timeout=2)
+
+        async def client():
+            client = get_async_client()
+            await close_async_client()
+            return client
+
+        timeout = asyncio.run(client()).timeout
+        assert timeout.connect == 1
+        assert timeout.read == 2
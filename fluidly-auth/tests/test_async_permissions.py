@@ -0,0 +1,337 @@
+import asyncio
+import threading
+from unittest import mock
+
+import httpx
+import pytest
+
+from fluidly.auth import async_permissions, permissions
+from fluidly.auth.async_permissions import (
+    check_admin_permissions_async,
+    check_user_permissions_async,
+    check_user_permissions_many_async,
+)
+from fluidly.auth.cache import (
+    connection_scope,
+    disable_permissions_cache,
+    enable_permissions_cache,
+    enable_shared_permissions_cache,
+)
+from fluidly.auth.permissions import (
+    TooManyConnectionsException,
+    UserPermissionsDeadlineExceededException,
+    UserPermissionsPayloadException,
+    UserPermissionsRequestException,
+)
+
+FLUIDLY_API_URL = "https://fluidly-api.url"
+
+
+@pytest.fixture()
+def mocked_generate_jwt(monkeypatch):
+    mock_generate_jwt = mock.MagicMock(return_value=b"JWT_TOKEN")
+    monkeypatch.setattr(async_permissions, "generate_jwt", mock_generate_jwt)
+    yield mock_generate_jwt
+
+
+def mock_async_jwt_request(monkeypatch, response=None, exception=None):
+    requests = []
+
+    async def make_async_jwt_request(signed_jwt, url, headers=None):
+        requests.append(url)
+        if exception is not None:
+            raise exception
+        if callable(response):
+            return response(headers)
+        return response
+
+    monkeypatch.setattr(
+        async_permissions, "make_async_jwt_request", make_async_jwt_request
+    )
+    return requests
+
+
+@pytest.fixture()
+def mocked_granted_permissions(monkeypatch):
+    yield mock_async_jwt_request(
+        monkeypatch, httpx.Response(200, json={"grantAccess": True})
+    )
+
+
+@pytest.fixture()
+def mocked_not_granted_permissions(monkeypatch):
+    yield mock_async_jwt_request(
+        monkeypatch, httpx.Response(200, json={"grantAccess": False})
+    )
+
+
+@pytest.fixture()
+def mocked_500_permissions(monkeypatch):
+    yield mock_async_jwt_request(monkeypatch, httpx.Response(500))
+
+
+@pytest.fixture()
+def mocked_unavailable_permissions(monkeypatch):
+    yield mock_async_jwt_request(monkeypatch, exception=httpx.ConnectError("Nope"))
+
+
+class TestCheckUserPermissionsAsync:
+    def test_required_permission_url(self):
+        with pytest.raises(ValueError, match="Please provide FLUIDLY_API_URL"):
+            asyncio.run(check_user_permissions_async({}, "connection_id"))
+
+    def test_granted_permissions(self, mocked_generate_jwt, mocked_granted_permissions):
+        assert asyncio.run(
+            check_user_permissions_async({}, "connection_id", FLUIDLY_API_URL)
+        )
+        assert mocked_granted_permissions == [
+            f"{FLUIDLY_API_URL}/v1/user-permissions/connections/connection_id"
+        ]
+        mocked_generate_jwt.assert_called_with({})
+
+    def test_not_granted_permissions(
+        self, mocked_generate_jwt, mocked_not_granted_permissions
+    ):
+        assert not asyncio.run(
+            check_user_permissions_async({}, "connection_id", FLUIDLY_API_URL)
+        )
+
+    def test_payload_exception_when_unavailable(
+        self, mocked_generate_jwt, mocked_500_permissions
+    ):
+        with pytest.raises(UserPermissionsPayloadException):
+            asyncio.run(
+                check_user_permissions_async({}, "connection_id", FLUIDLY_API_URL)
+            )
+
+    def test_request_exception_when_unreachable(
+        self, mocked_generate_jwt, mocked_unavailable_permissions
+    ):
+        with pytest.raises(UserPermissionsRequestException):
+            asyncio.run(
+                check_user_permissions_async({}, "connection_id", FLUIDLY_API_URL)
+            )
+
+    def test_uses_permissions_cache(
+        self, mocked_generate_jwt, mocked_granted_permissions
+    ):
+        enable_permissions_cache()
+
+        async def check_twice():
+            for _ in range(2):
+                await check_user_permissions_async(
+                    {"sub": "auth0|123"}, "connection_id", FLUIDLY_API_URL
+                )
+
+        try:
+            asyncio.run(check_twice())
+        finally:
+            disable_permissions_cache()
+
+        assert len(mocked_granted_permissions) == 1
+
+    def test_queries_shared_cache_off_the_event_loop(
+        self, tmp_path, mocked_generate_jwt, mocked_granted_permissions
+    ):
+        cache = enable_shared_permissions_cache(str(tmp_path / "permissions.sqlite3"))
+        threads = set()
+
+        def record_thread(method):
+            def wrapper(*args):
+                threads.add(threading.current_thread())
+                return method(*args)
+
+            return wrapper
+
+        async def check_twice():
+            for _ in range(2):
+                await check_user_permissions_async(
+                    {"sub": "auth0|123"}, "connection_id", FLUIDLY_API_URL
+                )
+
+        try:
+            with mock.patch.multiple(
+                cache,
+                get=record_thread(cache.get),
+                get_stale=record_thread(cache.get_stale),
+                set=record_thread(cache.set),
+            ):
+                asyncio.run(check_twice())
+        finally:
+            disable_permissions_cache()
+
+        assert len(mocked_granted_permissions) == 1
+        assert cache.stats()["hits"] == 1
+        assert threads and threading.current_thread() not in threads
+
+    def test_revalidates_expired_decision(self, monkeypatch, mocked_generate_jwt):
+        def respond(headers):
+            if headers.get("If-None-Match") == '"v1"':
+                return httpx.Response(304)
+            return httpx.Response(
+                200, json={"grantAccess": True}, headers={"ETag": '"v1"'}
+            )
+
+        requests = mock_async_jwt_request(monkeypatch, respond)
+        cache = enable_permissions_cache(grant_ttl=0)
+
+        async def check_twice():
+            return [
+                await check_user_permissions_async(
+                    {"sub": "auth0|123"}, "connection_id", FLUIDLY_API_URL
+                )
+                for _ in range(2)
+            ]
+
+        try:
+            assert asyncio.run(check_twice()) == [True, True]
+            assert cache.get_stale(
+                ("auth0|123", connection_scope("connection_id"))
+            ) == (
+                True,
+                {"etag": '"v1"'},
+            )
+        finally:
+            disable_permissions_cache()
+
+        assert len(requests) == 2
+
+
+class TestCheckAdminPermissionsAsync:
+    def test_admin_granted_permissions(
+        self, mocked_generate_jwt, mocked_granted_permissions
+    ):
+        assert asyncio.run(check_admin_permissions_async({}, FLUIDLY_API_URL))
+        assert mocked_granted_permissions == [
+            f"{FLUIDLY_API_URL}/v1/user-permissions/admin"
+        ]
+
+    def test_admin_not_granted_permissions(
+        self, mocked_generate_jwt, mocked_not_granted_permissions
+    ):
+        assert not asyncio.run(check_admin_permissions_async({}, FLUIDLY_API_URL))
+
+
+class TestCheckUserPermissionsManyAsync:
+    @pytest.fixture()
+    def mocked_per_connection_permissions(self, monkeypatch):
+        requests = []
+        in_flight = []
+
+        async def make_async_jwt_request(signed_jwt, url, headers=None):
+            requests.append(url)
+            in_flight.append(url)
+            await asyncio.sleep(0.01)
+            concurrency = len(in_flight)
+            in_flight.remove(url)
+            granted = not url.endswith("/denied")
+            return httpx.Response(
+                200, json={"grantAccess": granted, "concurrency": concurrency}
+            )
+
+        monkeypatch.setattr(
+            async_permissions, "make_async_jwt_request", make_async_jwt_request
+        )
+        yield requests
+
+    def test_returns_decision_per_connection(
+        self, mocked_generate_jwt, mocked_per_connection_permissions
+    ):
+        decisions = asyncio.run(
+            check_user_permissions_many_async(
+                {}, ["first", "denied", "first"], FLUIDLY_API_URL
+            )
+        )
+
+        assert decisions == {"first": True, "denied": False}
+        assert len(mocked_per_connection_permissions) == 2
+
+    def test_bounds_concurrency(
+        self, monkeypatch, mocked_generate_jwt, mocked_per_connection_permissions
+    ):
+        concurrency = []
+        handle_permissions_response = permissions.handle_permissions_response
+
+        def record_concurrency(response, *args, **kwargs):
+            concurrency.append(response.json()["concurrency"])
+            return handle_permissions_response(response, *args, **kwargs)
+
+        monkeypatch.setattr(
+            permissions, "handle_permissions_response", record_concurrency
+        )
+
+        asyncio.run(
+            check_user_permissions_many_async(
+                {}, [str(i) for i in range(10)], FLUIDLY_API_URL, max_concurrency=3
+            )
+        )
+
+        assert max(concurrency) == 3
+
+    def test_rejects_too_many_connections(
+        self, monkeypatch, mocked_generate_jwt, mocked_per_connection_permissions
+    ):
+        monkeypatch.setattr(permissions, "_max_connections", 2)
+
+        with pytest.raises(TooManyConnectionsException):
+            asyncio.run(
+                check_user_permissions_many_async({}, ["a", "b", "c"], FLUIDLY_API_URL)
+            )
+
+        assert mocked_per_connection_permissions == []
+
+
+class TestPermissionsDeadlineAsync:
+    def test_cancels_request_at_deadline(self, monkeypatch, mocked_generate_jwt):
+        cancelled = []
+
+        async def slow_response(headers):
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        async def make_async_jwt_request(signed_jwt, url, headers=None):
+            return await slow_response(headers)
+
+        monkeypatch.setattr(
+            async_permissions, "make_async_jwt_request", make_async_jwt_request
+        )
+
+        with pytest.raises(UserPermissionsDeadlineExceededException):
+            asyncio.run(
+                check_admin_permissions_async({}, FLUIDLY_API_URL, deadline=0.01)
+            )
+        assert cancelled == [True]
+
+    def test_deadline_of_a_check_does_not_fail_concurrent_checks(
+        self, monkeypatch, mocked_generate_jwt
+    ):
+        async def make_async_jwt_request(signed_jwt, url, headers=None):
+            await asyncio.sleep(0.2)
+            return httpx.Response(200, json={"grantAccess": True})
+
+        monkeypatch.setattr(
+            async_permissions, "make_async_jwt_request", make_async_jwt_request
+        )
+        claims = {"sub": "auth0|123"}
+
+        async def gather():
+            with_deadline = asyncio.ensure_future(
+                check_user_permissions_async(
+                    dict(claims), "connection_id", FLUIDLY_API_URL, deadline=0.1
+                )
+            )
+            await asyncio.sleep(0.02)
+            without_deadline = check_user_permissions_async(
+                dict(claims), "connection_id", FLUIDLY_API_URL
+            )
+            return await asyncio.gather(
+                with_deadline, without_deadline, return_exceptions=True
+            )
+
+        with_deadline, without_deadline = asyncio.run(gather())
+
+        assert isinstance(with_deadline, UserPermissionsDeadlineExceededException)
+        assert without_deadline is True
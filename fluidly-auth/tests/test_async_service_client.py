@@ -0,0 +1,126 @@
+import asyncio
+from unittest import mock
+
+import httpx
+import pytest
+
+from fluidly.auth import async_service_client, service_client
+from fluidly.auth.async_service_client import AsyncServiceClient
+from fluidly.auth.service_client import DeadlineExceededException
+
+BASE_URL = "https://api.test"
+
+
+@pytest.fixture(autouse=True)
+def mocked_generate_jwt(monkeypatch):
+    monkeypatch.setattr(
+        service_client, "generate_jwt", mock.MagicMock(return_value=b"JWT_TOKEN")
+    )
+
+
+def mock_transport(monkeypatch, *responses):
+    """Answers with `responses` in turn, the last one is repeated, a response can
+    be an exception to raise or a coroutine function"""
+    requests = []
+
+    async def handler(request):
+        requests.append(request)
+        response = responses[min(len(requests), len(responses)) - 1]
+        if isinstance(response, Exception):
+            raise response
+        if callable(response):
+            return await response()
+        return response
+
+    transport = httpx.MockTransport(handler)
+    monkeypatch.setattr(
+        async_service_client.httpx,
+        "AsyncHTTPTransport",
+        lambda **kwargs: transport,
+    )
+    return requests
+
+
+def run(client, method, *args, **kwargs):
+    async def request():
+        try:
+            return await getattr(client, method)(*args, **kwargs)
+        finally:
+            await client.aclose()
+
+    return asyncio.run(request())
+
+
+@pytest.fixture()
+def client():
+    return AsyncServiceClient(BASE_URL, backoff_factor=0)
+
+
+class TestAsyncServiceClient:
+    def test_get_with_bearer_token(self, monkeypatch, client):
+        requests = mock_transport(monkeypatch, httpx.Response(200, json=[1, 2]))
+
+        response = run(client, "get", "/v1/items", params={"page": 1})
+
+        assert response.json() == [1, 2]
+        assert requests[0].headers["Authorization"] == "Bearer JWT_TOKEN"
+        assert str(requests[0].url) == f"{BASE_URL}/v1/items?page=1"
+
+    def test_post(self, monkeypatch, client):
+        requests = mock_transport(monkeypatch, httpx.Response(201))
+
+        response = run(client, "post", "/v1/items", json={"name": "item"})
+
+        assert response.status_code == 201
+        assert requests[0].method == "POST"
+
+    def test_retries_idempotent_requests(self, monkeypatch, client):
+        requests = mock_transport(monkeypatch, httpx.Response(503), httpx.Response(200))
+
+        assert run(client, "get", "/v1/items").status_code == 200
+        assert len(requests) == 2
+
+    def test_retries_connection_errors(self, monkeypatch, client):
+        requests = mock_transport(
+            monkeypatch, httpx.ConnectError("refused"), httpx.Response(200)
+        )
+
+        assert run(client, "get", "/v1/items").status_code == 200
+        assert len(requests) == 2
+
+    def test_does_not_retry_post(self, monkeypatch, client):
+        requests = mock_transport(monkeypatch, httpx.Response(503))
+
+        assert run(client, "post", "/v1/items").status_code == 503
+        assert len(requests) == 1
+
+    def test_deadline_exceeded(self, monkeypatch, client):
+        async def slow():
+            await asyncio.sleep(1)
+            return httpx.Response(200)
+
+        mock_transport(monkeypatch, slow)
+
+        with pytest.raises(DeadlineExceededException):
+            run(client, "get", "/v1/items", deadline=0.05)
+        assert client.metrics.snapshot()["statuses"] == {"error": 1}
+
+    def test_streams_response(self, monkeypatch, client):
+        mock_transport(monkeypatch, httpx.Response(200, content=b"a" * 100))
+
+        async def stream():
+            async with client.stream("GET", "/v1/export") as response:
+                body = b"".join([chunk async for chunk in response.aiter_bytes()])
+            await client.aclose()
+            return body
+
+        assert asyncio.run(stream()) == b"a" * 100
+
+    def test_records_latency_metrics(self, monkeypatch, client):
+        mock_transport(monkeypatch, httpx.Response(200))
+
+        run(client, "get", "/v1/items")
+
+        snapshot = client.metrics.snapshot()
+        assert snapshot["statuses"] == {"200": 1}
+        assert snapshot["latency"]["GET"]["count"] == 1
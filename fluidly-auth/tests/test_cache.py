@@ -0,0 +1,278 @@
+import multiprocessing
+import sqlite3
+import threading
+
+import pytest
+from freezegun import freeze_time
+
+from fluidly.auth.cache import (
+    ADMIN_SCOPE,
+    PermissionsCache,
+    SharedPermissionsCache,
+    connection_scope,
+    disable_permissions_cache,
+    enable_shared_permissions_cache,
+    get_permissions_cache,
+    get_subject,
+)
+
+
+class TestGetSubject:
+    def test_subject_from_sub(self):
+        assert get_subject({"sub": "auth0|123"}) == "auth0|123"
+
+    def test_subject_from_user_id(self):
+        claims = {"https://api.fluidly.com/app_metadata": {"userId": 2}}
+        assert get_subject(claims) == "2"
+
+    def test_user_id_preferred_over_sub(self):
+        claims = {
+            "sub": "auth0|123",
+            "https://api.fluidly.com/app_metadata": {"userId": 2},
+        }
+        assert get_subject(claims) == "2"
+
+    def test_no_subject(self):
+        assert get_subject({}) is None
+
+
+class TestPermissionsCache:
+    def test_miss_then_hit(self):
+        cache = PermissionsCache()
+
+        assert cache.get(("user", connection_scope("connection"))) is None
+        cache.set(("user", connection_scope("connection")), True)
+
+        assert cache.get(("user", connection_scope("connection"))) == True
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+
+    def test_grants_and_denials_expire_separately(self):
+        cache = PermissionsCache(grant_ttl=60, denial_ttl=5)
+
+        with freeze_time("2019-01-14 03:21:34") as frozen_time:
+            cache.set(("user", connection_scope("granted")), True)
+            cache.set(("user", connection_scope("denied")), False)
+
+            frozen_time.tick(10)
+
+            assert cache.get(("user", connection_scope("granted"))) == True
+            assert cache.get(("user", connection_scope("denied"))) is None
+            assert cache.stats()["expirations"] == 1
+
+    def test_zero_ttl_is_not_cached(self):
+        cache = PermissionsCache(denial_ttl=0)
+
+        cache.set(("user", connection_scope("connection")), False)
+
+        assert cache.stats()["size"] == 0
+
+    def test_keeps_expired_decisions_with_validators(self):
+        cache = PermissionsCache(grant_ttl=60, denial_ttl=0)
+
+        with freeze_time("2019-01-14 03:21:34") as frozen_time:
+            cache.set(
+                ("user", connection_scope("granted")), True, validators={"etag": '"v1"'}
+            )
+            cache.set(
+                ("user", connection_scope("denied")), False, validators={"etag": '"v2"'}
+            )
+            cache.set(("user", connection_scope("other")), True)
+
+            frozen_time.tick(120)
+
+            assert cache.get(("user", connection_scope("granted"))) is None
+            assert cache.get_stale(("user", connection_scope("granted"))) == (
+                True,
+                {"etag": '"v1"'},
+            )
+            assert cache.get_stale(("user", connection_scope("denied"))) == (
+                False,
+                {"etag": '"v2"'},
+            )
+            assert cache.get_stale(("user", connection_scope("other"))) is None
+
+    def test_admin_scope_is_not_a_connection(self):
+        cache = PermissionsCache()
+
+        cache.set(("user", connection_scope("admin")), True)
+
+        assert cache.get(("user", ADMIN_SCOPE)) is None
+
+    def test_evicts_least_recently_used(self):
+        cache = PermissionsCache(max_size=2)
+
+        cache.set(("user", connection_scope("first")), True)
+        cache.set(("user", connection_scope("second")), True)
+        cache.get(("user", connection_scope("first")))
+        cache.set(("user", connection_scope("third")), True)
+
+        assert cache.get(("user", connection_scope("second"))) is None
+        assert cache.get(("user", connection_scope("first"))) == True
+        assert cache.stats()["evictions"] == 1
+        assert cache.stats()["size"] == 2
+
+
+@pytest.fixture()
+def cache_path(tmp_path):
+    return str(tmp_path / "permissions.sqlite3")
+
+
+def set_decision(path, subject):
+    SharedPermissionsCache(path).set((subject, connection_scope("connection")), True)
+
+
+class TestSharedPermissionsCache:
+    def test_miss_then_hit(self, cache_path):
+        cache = SharedPermissionsCache(cache_path)
+
+        assert cache.get(("user", connection_scope("connection"))) is None
+        cache.set(("user", connection_scope("connection")), True)
+        cache.set(("user", ADMIN_SCOPE), False)
+
+        assert cache.get(("user", connection_scope("connection"))) == True
+        assert cache.get(("user", ADMIN_SCOPE)) == False
+        assert cache.stats() == {
+            "hits": 2,
+            "misses": 1,
+            "errors": 0,
+            "invalidations": 0,
+            "size": 2,
+        }
+
+    def test_grants_and_denials_expire_separately(self, cache_path):
+        cache = SharedPermissionsCache(cache_path, grant_ttl=60, denial_ttl=5)
+
+        with freeze_time("2019-01-14 03:21:34") as frozen_time:
+            cache.set(("user", connection_scope("granted")), True)
+            cache.set(("user", connection_scope("denied")), False)
+
+            frozen_time.tick(10)
+
+            assert cache.get(("user", connection_scope("granted"))) == True
+            assert cache.get(("user", connection_scope("denied"))) is None
+
+    def test_shared_between_processes(self, cache_path):
+        cache = SharedPermissionsCache(cache_path)
+        processes = [
+            multiprocessing.Process(target=set_decision, args=(cache_path, str(i)))
+            for i in range(4)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        for i in range(4):
+            assert cache.get((str(i), connection_scope("connection"))) == True
+
+    def test_shared_between_threads(self, cache_path):
+        cache = SharedPermissionsCache(cache_path)
+        thread = threading.Thread(
+            target=cache.set, args=(("user", connection_scope("connection")), True)
+        )
+        thread.start()
+        thread.join()
+
+        assert cache.get(("user", connection_scope("connection"))) == True
+
+    def test_bounded_size(self, cache_path):
+        cache = SharedPermissionsCache(cache_path, max_size=5, prune_interval=10)
+
+        for i in range(20):
+            cache.set((str(i), connection_scope("connection")), True)
+
+        assert cache.stats()["size"] == 5 + 20 % 10
+
+    def test_prune_removes_expired_first(self, cache_path):
+        cache = SharedPermissionsCache(cache_path, grant_ttl=60, denial_ttl=5)
+
+        with freeze_time("2019-01-14 03:21:34") as frozen_time:
+            cache.set(("user", connection_scope("granted")), True)
+            cache.set(("user", connection_scope("denied")), False)
+            frozen_time.tick(10)
+            cache.prune()
+
+        assert cache.stats()["size"] == 1
+
+    def test_keeps_expired_decisions_with_validators(self, cache_path):
+        cache = SharedPermissionsCache(cache_path, grant_ttl=60)
+        validators = {"etag": '"v1"', "last_modified": "Mon, 14 Jan 2019 03:21:34 GMT"}
+
+        with freeze_time("2019-01-14 03:21:34") as frozen_time:
+            cache.set(
+                ("user", connection_scope("granted")), True, validators=validators
+            )
+            cache.set(("user", connection_scope("other")), True)
+            frozen_time.tick(120)
+            cache.prune()
+
+            assert cache.get(("user", connection_scope("granted"))) is None
+            assert cache.get_stale(("user", connection_scope("granted"))) == (
+                True,
+                validators,
+            )
+            assert cache.get_stale(("user", connection_scope("other"))) is None
+            assert cache.stats()["size"] == 1
+
+    def test_adds_validators_to_existing_database(self, cache_path):
+        connection = sqlite3.connect(cache_path)
+        connection.execute(
+            "CREATE TABLE decisions (subject TEXT NOT NULL, scope TEXT NOT NULL, "
+            "granted INTEGER NOT NULL, expires_at REAL NOT NULL, "
+            "PRIMARY KEY (subject, scope))"
+        )
+        connection.close()
+        cache = SharedPermissionsCache(cache_path)
+
+        cache.set(
+            ("user", connection_scope("connection")), True, validators={"etag": '"v1"'}
+        )
+
+        assert cache.get_stale(("user", connection_scope("connection"))) == (
+            True,
+            {"etag": '"v1"'},
+        )
+
+    def test_admin_scope_is_not_a_connection(self, cache_path):
+        cache = SharedPermissionsCache(cache_path)
+
+        cache.set(("user", connection_scope("admin")), True)
+
+        assert cache.get(("user", ADMIN_SCOPE)) is None
+        assert cache.get(("user", connection_scope("admin"))) == True
+
+    def test_drops_decisions_with_untagged_scopes(self, cache_path):
+        connection = sqlite3.connect(cache_path)
+        connection.execute(
+            "CREATE TABLE decisions (subject TEXT NOT NULL, scope TEXT NOT NULL, "
+            "granted INTEGER NOT NULL, expires_at REAL NOT NULL, "
+            "validators TEXT, PRIMARY KEY (subject, scope))"
+        )
+        connection.execute(
+            "INSERT INTO decisions VALUES ('user', 'admin', 1, 1e12, NULL)"
+        )
+        connection.commit()
+        connection.close()
+
+        cache = SharedPermissionsCache(cache_path)
+
+        assert cache.get(("user", ADMIN_SCOPE)) is None
+        cache.set(("user", ADMIN_SCOPE), True)
+        assert SharedPermissionsCache(cache_path).get(("user", ADMIN_SCOPE)) == True
+
+    def test_errors_are_misses(self, cache_path):
+        cache = SharedPermissionsCache(cache_path)
+        cache._connection().execute("DROP TABLE decisions")
+
+        cache.set(("user", connection_scope("connection")), True)
+
+        assert cache.get(("user", connection_scope("connection"))) is None
+        assert cache.errors == 2
+
+    def test_enable_shared_permissions_cache(self, cache_path):
+        cache = enable_shared_permissions_cache(cache_path)
+
+        assert get_permissions_cache() is cache
+        disable_permissions_cache()
+        assert get_permissions_cache() is None
@@ -0,0 +1,289 @@
+import asyncio
+import re
+import time
+from unittest import mock
+
+import pytest
+import requests
+import responses
+from freezegun import freeze_time
+
+from fluidly.auth import circuit_breaker as module
+from fluidly.auth import permissions
+from fluidly.auth.circuit_breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    CircuitOpenException,
+    disable_circuit_breaker,
+    enable_circuit_breaker,
+)
+from fluidly.auth.permissions import (
+    UserPermissionsRequestException,
+    UserPermissionsUnavailableException,
+    check_user_permissions,
+)
+
+FLUIDLY_API_URL = "https://fluidly-api.url"
+
+
+class Response:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+def fail():
+    raise ConnectionError()
+
+
+@pytest.fixture()
+def logger_mock(monkeypatch):
+    mock_logger = mock.MagicMock()
+    monkeypatch.setattr(module.base_logger, "get_logger", lambda: mock_logger)
+    yield mock_logger
+
+
+@pytest.fixture()
+def breaker(logger_mock):
+    return CircuitBreaker(
+        "test", minimum_calls=4, failure_rate_threshold=0.5, reset_timeout=10
+    )
+
+
+def trip(breaker):
+    for _ in range(4):
+        with pytest.raises(ConnectionError):
+            breaker.call(fail)
+
+
+class TestCircuitBreaker:
+    def test_stays_closed_below_failure_rate(self, breaker):
+        for _ in range(3):
+            breaker.call(lambda: Response(200))
+        with pytest.raises(ConnectionError):
+            breaker.call(fail)
+
+        assert breaker.state == CLOSED
+
+    def test_needs_minimum_calls(self, breaker):
+        for _ in range(3):
+            with pytest.raises(ConnectionError):
+                breaker.call(fail)
+
+        assert breaker.state == CLOSED
+
+    def test_opens_on_errors(self, breaker, logger_mock):
+        trip(breaker)
+
+        assert breaker.state == OPEN
+        args, kwargs = logger_mock.warning.call_args
+        assert args == ("Circuit breaker state changed",)
+        assert kwargs["previous_state"] == CLOSED
+        assert kwargs["state"] == OPEN
+        assert kwargs["failure_rate"] == 1
+
+    def test_opens_on_server_errors(self, breaker):
+        for _ in range(4):
+            breaker.call(lambda: Response(503))
+
+        assert breaker.state == OPEN
+
+    def test_opens_on_slow_calls(self, breaker):
+        breaker.slow_call_threshold = -1
+        for _ in range(4):
+            breaker.call(lambda: Response(200))
+
+        assert breaker.state == OPEN
+
+    def test_rejects_calls_when_open(self, breaker):
+        trip(breaker)
+        call = mock.MagicMock()
+
+        with pytest.raises(CircuitOpenException):
+            breaker.call(call)
+
+        assert not call.called
+        assert breaker.stats()["rejected"] == 1
+
+    def test_forgets_outcomes_outside_window(self, breaker):
+        with freeze_time("2019-01-14 03:21:34") as frozen_time:
+            for _ in range(3):
+                with pytest.raises(ConnectionError):
+                    breaker.call(fail)
+            frozen_time.tick(60)
+            with pytest.raises(ConnectionError):
+                breaker.call(fail)
+
+        assert breaker.state == CLOSED
+
+    def test_half_open_probe_success_closes(self, breaker):
+        with freeze_time("2019-01-14 03:21:34") as frozen_time:
+            trip(breaker)
+            frozen_time.tick(11)
+
+            breaker.call(lambda: Response(200))
+
+        assert breaker.state == CLOSED
+        assert breaker.stats()["calls"] == 0
+
+    def test_half_open_probe_failure_reopens(self, breaker):
+        with freeze_time("2019-01-14 03:21:34") as frozen_time:
+            trip(breaker)
+            frozen_time.tick(11)
+
+            with pytest.raises(ConnectionError):
+                breaker.call(fail)
+
+            assert breaker.state == OPEN
+            with pytest.raises(CircuitOpenException):
+                breaker.call(fail)
+
+    def test_half_open_limits_probes(self, breaker):
+        with freeze_time("2019-01-14 03:21:34") as frozen_time:
+            trip(breaker)
+            frozen_time.tick(11)
+            breaker.before_call()
+
+            assert breaker.state == HALF_OPEN
+            with pytest.raises(CircuitOpenException):
+                breaker.before_call()
+
+    def test_async_calls(self, breaker):
+        async def fail_async():
+            raise ConnectionError()
+
+        async def call_many():
+            for _ in range(4):
+                with pytest.raises(ConnectionError):
+                    await breaker.call_async(fail_async)
+
+        asyncio.run(call_many())
+
+        assert breaker.state == OPEN
+
+    def test_cancelled_probe_is_released(self, breaker):
+        trip(breaker)
+        breaker.reset_timeout = 0
+
+        async def cancel_probe():
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(breaker.call_async(asyncio.sleep, 1), 0.01)
+
+        asyncio.run(cancel_probe())
+
+        assert breaker.state == HALF_OPEN
+        breaker.call(lambda: Response(200))
+        assert breaker.state == CLOSED
+
+    def test_failures_past_caller_deadline_are_not_counted(self, breaker):
+        for _ in range(4):
+            with pytest.raises(ConnectionError):
+                breaker.call(fail, deadline_at=time.monotonic() - 1)
+
+        assert breaker.state == CLOSED
+        assert breaker.stats()["calls"] == 0
+
+    def test_calls_cut_short_by_long_deadlines_open_circuit(self, breaker):
+        breaker.slow_call_threshold = 0.01
+
+        def hang(deadline_at):
+            time.sleep(max(deadline_at - time.monotonic(), 0))
+            raise ConnectionError()
+
+        for _ in range(4):
+            deadline_at = time.monotonic() + 0.02
+            with pytest.raises(ConnectionError):
+                breaker.call(hang, deadline_at, deadline_at=deadline_at)
+
+        assert breaker.state == OPEN
+
+    def test_async_calls_cancelled_at_long_deadlines_open_circuit(self, breaker):
+        breaker.slow_call_threshold = 0.01
+
+        async def hang_many():
+            for _ in range(4):
+                deadline_at = time.monotonic() + 0.02
+                with pytest.raises(asyncio.TimeoutError):
+                    await asyncio.wait_for(
+                        breaker.call_async(asyncio.sleep, 1, deadline_at=deadline_at),
+                        0.03,
+                    )
+
+        asyncio.run(hang_many())
+
+        assert breaker.state == OPEN
+
+
+class TestPermissionsCircuitBreaker:
+    @pytest.fixture()
+    def permissions_breaker(self, logger_mock):
+        breaker = enable_circuit_breaker(minimum_calls=2)
+        yield breaker
+        disable_circuit_breaker()
+
+    def test_fails_fast_when_open(
+        self, monkeypatch, permissions_breaker, mocked_responses
+    ):
+        monkeypatch.setattr(permissions, "generate_jwt", mock.MagicMock())
+        mocked_responses.add(
+            responses.GET, re.compile(f"{FLUIDLY_API_URL}/*"), status=503
+        )
+
+        for _ in range(2):
+            with pytest.raises(permissions.UserPermissionsPayloadException):
+                check_user_permissions({}, "connection_id", FLUIDLY_API_URL)
+
+        calls = len(mocked_responses.calls)
+        with pytest.raises(UserPermissionsUnavailableException):
+            check_user_permissions({}, "connection_id", FLUIDLY_API_URL)
+
+        assert len(mocked_responses.calls) == calls
+        assert issubclass(
+            UserPermissionsUnavailableException, UserPermissionsRequestException
+        )
+
+    def test_deadline_timeouts_do_not_open_circuit(
+        self, monkeypatch, permissions_breaker, mocked_responses
+    ):
+        monkeypatch.setattr(permissions, "generate_jwt", mock.MagicMock())
+
+        def slow_timeout(request):
+            time.sleep(0.02)
+            raise requests.exceptions.ReadTimeout()
+
+        mocked_responses.add_callback(
+            responses.GET, re.compile(f"{FLUIDLY_API_URL}/*"), callback=slow_timeout
+        )
+
+        for _ in range(3):
+            with pytest.raises(permissions.UserPermissionsDeadlineExceededException):
+                check_user_permissions(
+                    {}, "connection_id", FLUIDLY_API_URL, deadline=0.01
+                )
+
+        assert permissions_breaker.state == CLOSED
+
+    def test_hanging_service_opens_circuit_with_deadlines(
+        self, monkeypatch, permissions_breaker, mocked_responses
+    ):
+        monkeypatch.setattr(permissions, "generate_jwt", mock.MagicMock())
+        permissions_breaker.slow_call_threshold = 0.01
+
+        def hang(request):
+            time.sleep(0.05)
+            raise requests.exceptions.ReadTimeout()
+
+        mocked_responses.add_callback(
+            responses.GET, re.compile(f"{FLUIDLY_API_URL}/*"), callback=hang
+        )
+
+        for _ in range(2):
+            with pytest.raises(permissions.UserPermissionsDeadlineExceededException):
+                check_user_permissions(
+                    {}, "connection_id", FLUIDLY_API_URL, deadline=0.03
+                )
+
+        assert permissions_breaker.state == OPEN
+        with pytest.raises(UserPermissionsUnavailableException):
+            check_user_permissions({}, "connection_id", FLUIDLY_API_URL, deadline=0.03)
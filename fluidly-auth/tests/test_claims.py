@@ -0,0 +1,88 @@
+import base64
+import binascii
+import json
+
+import pytest
+
+from fluidly.auth.claims import ClaimsCache, claims_cache, parse_claims, parse_user_info
+
+CLAIMS = {
+    "sub": "auth0|user",
+    "https://api.fluidly.com/app_metadata": {"userId": "user_id"},
+}
+
+
+def encode(user_info):
+    # Cloud Endpoints strips the padding
+    return base64.b64encode(json.dumps(user_info).encode()).decode().rstrip("=")
+
+
+@pytest.fixture(autouse=True)
+def clear_claims_cache():
+    claims_cache.clear()
+    yield
+    claims_cache.clear()
+
+
+class TestParseUserInfo:
+    def test_esp_v1_claims(self):
+        assert parse_user_info(encode({"claims": json.dumps(CLAIMS)})) == CLAIMS
+
+    def test_esp_v2_claims(self):
+        assert parse_user_info(encode(CLAIMS)) == CLAIMS
+
+
+class TestClaimsCache:
+    def test_parses_once(self):
+        cache = ClaimsCache()
+        header = encode(CLAIMS)
+
+        assert cache.parse(header) == CLAIMS
+        assert cache.parse(header) == CLAIMS
+        assert cache.stats() == {"hits": 1, "misses": 1, "size": 1}
+
+    def test_returns_copies(self):
+        cache = ClaimsCache()
+        header = encode(CLAIMS)
+
+        claims = cache.parse(header)
+        claims["iat"] = 1234
+
+        assert "iat" not in cache.parse(header)
+
+    def test_evicts_least_recently_used(self):
+        cache = ClaimsCache(max_size=2)
+        first, second, third = (encode({"sub": str(i)}) for i in range(3))
+
+        cache.parse(first)
+        cache.parse(second)
+        cache.parse(first)
+        cache.parse(third)
+
+        assert cache.stats()["size"] == 2
+        cache.parse(first)
+        assert cache.stats()["hits"] == 2
+        cache.parse(second)
+        assert cache.stats()["misses"] == 4
+
+    def test_does_not_cache_invalid_headers(self):
+        cache = ClaimsCache()
+
+        with pytest.raises((binascii.Error, ValueError)):
+            cache.parse("not json")
+
+        assert cache.stats()["size"] == 0
+
+    def test_keys_on_digest(self):
+        cache = ClaimsCache()
+        header = encode(CLAIMS)
+        cache.parse(header)
+
+        assert header.encode() not in cache._claims
+        assert ClaimsCache.key(header) in cache._claims
+
+    def test_module_cache(self):
+        header = encode(CLAIMS)
+
+        assert parse_claims(header) == parse_claims(header.encode())
+        assert claims_cache.stats()["hits"] == 1
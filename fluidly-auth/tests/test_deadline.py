@@ -0,0 +1,51 @@
+import asyncio
+import time
+
+import pytest
+
+from fluidly.auth.deadline import (
+    DeadlineExceededException,
+    get_deadline_at,
+    is_exceeded,
+    remaining,
+    request_deadline,
+)
+
+
+class TestDeadline:
+    def test_no_deadline(self):
+        assert get_deadline_at() is None
+        assert remaining(None) is None
+        assert not is_exceeded(None)
+
+    def test_call_deadline(self):
+        deadline_at = get_deadline_at(10)
+
+        assert 9 < remaining(deadline_at) <= 10
+
+    def test_remaining_raises_once_passed(self):
+        with pytest.raises(DeadlineExceededException):
+            remaining(time.monotonic() - 1)
+
+    def test_context_deadline(self):
+        with request_deadline(1) as deadline_at:
+            assert get_deadline_at() == deadline_at
+            assert get_deadline_at(10) == deadline_at
+            assert get_deadline_at(0.5) < deadline_at
+
+        assert get_deadline_at() is None
+
+    def test_nested_deadlines_only_shorten(self):
+        with request_deadline(1) as outer_deadline_at:
+            with request_deadline(10) as inner_deadline_at:
+                assert inner_deadline_at == outer_deadline_at
+
+    def test_deadline_follows_coroutines(self):
+        async def get_remaining():
+            return remaining(get_deadline_at())
+
+        async def run():
+            with request_deadline(1):
+                return await asyncio.gather(get_remaining(), get_remaining())
+
+        assert all(0 < time_left <= 1 for time_left in asyncio.run(run()))
@@ -0,0 +1,187 @@
+import asyncio
+import threading
+import time
+from unittest import mock
+
+import pytest
+
+from fluidly.auth import async_permissions, permissions
+from fluidly.auth.hedging import Hedger, disable_hedging, enable_hedging, get_hedger
+
+
+class Response:
+    def __init__(self, status_code, payload):
+        self.status_code = status_code
+        self.payload = payload
+        self.headers = {}
+
+    def json(self):
+        return self.payload
+
+
+def slow_then_fast(delay=0.5):
+    """Returns a function whose first call is slow and next calls are fast"""
+    lock = threading.Lock()
+    calls = []
+
+    def fn():
+        with lock:
+            calls.append(1)
+            first = len(calls) == 1
+        if first:
+            time.sleep(delay)
+            return "primary"
+        return "hedge"
+
+    return fn, calls
+
+
+def warm(hedger, latency=0.01, samples=20):
+    for _ in range(samples):
+        hedger.record_latency(latency)
+
+
+@pytest.fixture()
+def hedger():
+    hedger = Hedger(min_samples=20, max_hedge_ratio=1, max_hedge_burst=1)
+    yield hedger
+    hedger.close()
+
+
+class TestHedger:
+    def test_does_not_hedge_before_min_samples(self, hedger):
+        warm(hedger, samples=19)
+        fn, calls = slow_then_fast(delay=0.05)
+
+        assert hedger.call(fn) == "primary"
+        assert len(calls) == 1
+        assert hedger.stats()["hedges_fired"] == 0
+
+    def test_hedge_wins_when_primary_is_slow(self, hedger):
+        warm(hedger)
+        fn, calls = slow_then_fast()
+
+        assert hedger.call(fn) == "hedge"
+        assert len(calls) == 2
+        assert hedger.stats() == {
+            "requests": 1,
+            "hedges_fired": 1,
+            "hedges_won": 1,
+            "saturated": 0,
+            "delay": 0.01,
+        }
+
+    def test_does_not_hedge_fast_requests(self, hedger):
+        warm(hedger, latency=1)
+
+        assert hedger.call(lambda: "primary") == "primary"
+        assert hedger.stats()["hedges_fired"] == 0
+
+    def test_budget_caps_hedges(self):
+        hedger = Hedger(min_samples=20, max_hedge_ratio=0.5, max_hedge_burst=1)
+        warm(hedger)
+
+        for _ in range(4):
+            fn, _ = slow_then_fast(delay=0.05)
+            hedger.call(fn)
+        hedger.close()
+
+        assert hedger.stats()["requests"] == 4
+        assert hedger.stats()["hedges_fired"] == 2
+
+    def test_delay_is_percentile_of_latencies(self):
+        hedger = Hedger(percentile=0.9, min_samples=10)
+        for latency in range(1, 11):
+            hedger.record_latency(latency / 10)
+        hedger.close()
+
+        assert hedger.stats()["delay"] == 1.0
+
+    def test_raises_when_both_requests_fail(self, hedger):
+        warm(hedger)
+
+        def fail():
+            time.sleep(0.05)
+            raise ConnectionError()
+
+        with pytest.raises(ConnectionError):
+            hedger.call(fail)
+        assert hedger.stats()["hedges_fired"] == 1
+
+    def test_runs_on_calling_thread_when_workers_are_busy(self):
+        hedger = Hedger(min_samples=20, max_hedge_ratio=1, max_workers=1)
+        warm(hedger)
+        release = threading.Event()
+        busy = threading.Thread(target=hedger.call, args=(lambda: release.wait(5),))
+        busy.start()
+        time.sleep(0.05)
+
+        try:
+            start = time.monotonic()
+            assert hedger.call(threading.current_thread) is threading.current_thread()
+            assert time.monotonic() - start < 0.5
+        finally:
+            release.set()
+            busy.join()
+            hedger.close()
+
+        # Neither the request nor the hedge of the busy call queued for the worker
+        assert hedger.stats()["saturated"] == 2
+        assert hedger.stats()["hedges_fired"] == 0
+
+    def test_async_hedge_wins_when_primary_is_slow(self, hedger):
+        warm(hedger)
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            if len(calls) == 1:
+                await asyncio.sleep(0.5)
+                return "primary"
+            return "hedge"
+
+        assert asyncio.run(hedger.call_async(fn)) == "hedge"
+        assert hedger.stats()["hedges_won"] == 1
+
+
+class TestPermissionsHedging:
+    @pytest.fixture()
+    def enabled_hedger(self):
+        hedger = enable_hedging(min_samples=20, max_hedge_ratio=1, max_hedge_burst=1)
+        warm(hedger)
+        yield hedger
+        disable_hedging()
+        assert get_hedger() is None
+
+    def test_hedges_permissions_request(self, monkeypatch, enabled_hedger):
+        monkeypatch.setattr(permissions, "generate_jwt", mock.MagicMock())
+        fn, calls = slow_then_fast()
+        monkeypatch.setattr(
+            permissions,
+            "make_jwt_request",
+            lambda *args, **kwargs: Response(200, {"grantAccess": fn() == "hedge"}),
+        )
+
+        assert permissions.check_permissions({}, "https://fluidly-api.url")
+        assert len(calls) == 2
+        assert enabled_hedger.stats()["hedges_won"] == 1
+
+    def test_hedges_async_permissions_request(self, monkeypatch, enabled_hedger):
+        monkeypatch.setattr(async_permissions, "generate_jwt", mock.MagicMock())
+        calls = []
+
+        async def make_async_jwt_request(*args, **kwargs):
+            calls.append(1)
+            if len(calls) == 1:
+                await asyncio.sleep(0.5)
+                return Response(200, {"grantAccess": False})
+            return Response(200, {"grantAccess": True})
+
+        monkeypatch.setattr(
+            async_permissions, "make_async_jwt_request", make_async_jwt_request
+        )
+
+        assert asyncio.run(
+            async_permissions.check_permissions_async({}, "https://fluidly-api.url")
+        )
+        assert enabled_hedger.stats()["hedges_won"] == 1
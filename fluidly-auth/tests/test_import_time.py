@@ -0,0 +1,111 @@
+import re
+import subprocess
+import sys
+
+import pytest
+
+from fluidly.auth import jwt_requests
+from fluidly.auth.lazy import LazyModule
+
+# Cumulative import time of fluidly.auth.permissions in microseconds, around 10x
+# what it takes locally so the test only fails when heavy imports creep back in
+IMPORT_BUDGET = 150_000
+
+LAZY_DEPENDENCIES = [
+    "google.auth",
+    "google.oauth2",
+    "requests",
+    "urllib3",
+    "structlog",
+    "asyncio",
+    "sqlite3",
+]
+
+# The web framework integrations import their framework, but token verification
+# is optional so its dependencies are only imported once it is used
+INTEGRATIONS = ["fluidly.flask.decorators", "fluidly.fastapi.dependencies.auth"]
+INTEGRATION_LAZY_DEPENDENCIES = [
+    "cryptography",
+    "google.auth",
+    "google.oauth2",
+    "requests",
+    "httpx",
+    "fluidly.auth.jwks",
+    "fluidly.auth.async_permissions",
+]
+
+
+def lazily_imported(imported, dependencies):
+    return [
+        name
+        for name in imported
+        for dependency in dependencies
+        if name == dependency or name.startswith(f"{dependency}.")
+    ]
+
+
+def import_times(module):
+    """Runs a fresh interpreter with `-X importtime`, returns the cumulative import
+    time in microseconds of every module imported by `module`"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+\s+\|\s+(\d+)\s+\|\s+(\S+)", line)
+        if match:
+            times[match.group(2)] = int(match.group(1))
+    return times
+
+
+class TestImportTime:
+    @pytest.mark.parametrize(
+        "module", ["fluidly.auth.permissions", "fluidly.auth.jwks"]
+    )
+    def test_heavy_dependencies_are_imported_lazily(self, module):
+        imported = import_times(module)
+
+        assert lazily_imported(imported, LAZY_DEPENDENCIES) == []
+
+    @pytest.mark.parametrize("module", INTEGRATIONS)
+    def test_integrations_import_token_verification_lazily(self, module):
+        imported = import_times(module)
+
+        assert lazily_imported(imported, INTEGRATION_LAZY_DEPENDENCIES) == []
+
+    def test_import_budget(self):
+        # Best of a few runs to smooth over a busy machine
+        cost = min(
+            import_times("fluidly.auth.permissions")["fluidly.auth.permissions"]
+            for _ in range(3)
+        )
+
+        assert cost < IMPORT_BUDGET
+
+
+class TestLazyModule:
+    def test_imports_on_first_access(self):
+        module = LazyModule("json")
+
+        assert module.dumps([1]) == "[1]"
+        assert repr(module) == "<lazy module 'json'>"
+
+    def test_patches_the_module(self, monkeypatch):
+        monkeypatch.setattr(jwt_requests.requests, "codes", None)
+
+        import requests
+
+        assert requests.codes is None
+
+    def test_missing_module(self):
+        with pytest.raises(ImportError):
+            LazyModule("fluidly.missing").anything
+
+    def test_jitteredretry_is_still_exported(self):
+        from fluidly.auth.jwt_requests import JitteredRetry
+        from fluidly.auth.retry import JitteredRetry as retry_policy
+
+        assert JitteredRetry is retry_policy
@@ -0,0 +1,152 @@
+import os
+from unittest import mock
+
+import pytest
+from google.api_core.exceptions import AlreadyExists
+
+from fluidly.auth import invalidation
+from fluidly.auth.cache import (
+    ADMIN_SCOPE,
+    connection_scope,
+    disable_permissions_cache,
+    enable_permissions_cache,
+    enable_shared_permissions_cache,
+)
+from fluidly.auth.invalidation import (
+    handle_permissions_changed,
+    setup_permissions_invalidation,
+)
+from fluidly.pubsub.exceptions import DropMessageException
+from fluidly.pubsub.tests import message_from_dict
+
+CONNECTION_A = connection_scope("connection_a")
+CONNECTION_B = connection_scope("connection_b")
+
+
+@pytest.fixture(params=["memory", "shared"])
+def permissions_cache(request, tmp_path):
+    if request.param == "shared":
+        cache = enable_shared_permissions_cache(str(tmp_path / "permissions.sqlite3"))
+    else:
+        cache = enable_permissions_cache()
+    cache.set(("1", CONNECTION_A), True)
+    cache.set(("1", CONNECTION_B), True)
+    cache.set(("1", ADMIN_SCOPE), False)
+    cache.set(("2", CONNECTION_A), True)
+    yield cache
+    disable_permissions_cache()
+
+
+def cached(cache):
+    keys = [
+        ("1", CONNECTION_A),
+        ("1", CONNECTION_B),
+        ("1", ADMIN_SCOPE),
+        ("2", CONNECTION_A),
+    ]
+    return [key for key in keys if cache.get(key) is not None]
+
+
+class TestInvalidate:
+    def test_user_and_connection(self, permissions_cache):
+        assert permissions_cache.invalidate("1", CONNECTION_A) == 1
+
+        assert cached(permissions_cache) == [
+            ("1", CONNECTION_B),
+            ("1", ADMIN_SCOPE),
+            ("2", CONNECTION_A),
+        ]
+
+    def test_user(self, permissions_cache):
+        assert permissions_cache.invalidate(subject="1") == 3
+
+        assert cached(permissions_cache) == [("2", CONNECTION_A)]
+
+    def test_connection(self, permissions_cache):
+        assert permissions_cache.invalidate(scope=CONNECTION_A) == 2
+
+        assert cached(permissions_cache) == [("1", CONNECTION_B), ("1", ADMIN_SCOPE)]
+        assert permissions_cache.stats()["invalidations"] == 2
+
+    def test_does_not_store_decisions_checked_before(self, permissions_cache):
+        checked_at = 0.0
+        permissions_cache.invalidate("1", CONNECTION_A)
+
+        permissions_cache.set(("1", CONNECTION_A), True, checked_at)
+        permissions_cache.set(("3", CONNECTION_A), True)
+
+        assert permissions_cache.get(("1", CONNECTION_A)) is None
+        assert permissions_cache.get(("3", CONNECTION_A)) == True
+
+
+class TestHandlePermissionsChanged:
+    def test_evicts_decisions(self, permissions_cache):
+        message = message_from_dict({"userId": 1, "connectionId": "connection_a"})
+
+        handle_permissions_changed(message)
+
+        assert ("1", CONNECTION_A) not in cached(permissions_cache)
+        assert len(cached(permissions_cache)) == 3
+        assert message.message.ack.called
+
+    def test_evicts_user_decisions(self, permissions_cache):
+        handle_permissions_changed(message_from_dict({"userId": "1"}))
+
+        assert cached(permissions_cache) == [("2", CONNECTION_A)]
+
+    def test_drops_events_without_user_or_connection(self, permissions_cache):
+        message = message_from_dict({"other": "field"})
+
+        with pytest.raises(DropMessageException):
+            handle_permissions_changed(message)
+        assert len(cached(permissions_cache)) == 4
+
+    def test_cache_disabled(self):
+        message = message_from_dict({"userId": "1"})
+
+        handle_permissions_changed(message)
+
+        assert message.message.ack.called
+
+    def test_setup_permissions_invalidation(self, monkeypatch):
+        mock_setup_subscriptions = mock.MagicMock()
+        monkeypatch.setattr(
+            invalidation, "setup_subscriptions", mock_setup_subscriptions
+        )
+
+        setup_permissions_invalidation(
+            "user-permissions-changed-worker-1",
+            flow_control=mock.sentinel.flow_control,
+        )
+
+        mock_setup_subscriptions.assert_called_once_with(
+            [("user-permissions-changed-worker-1", handle_permissions_changed)],
+            flow_control=mock.sentinel.flow_control,
+        )
+
+    def test_subscribes_each_process_to_its_own_subscription(self, monkeypatch):
+        mock_subscriber = mock.MagicMock()
+        mock_subscriber.subscription_path = lambda project, name: name
+        mock_subscriber.topic_path = lambda project, name: name
+        mock_subscriber.create_subscription.side_effect = [None, AlreadyExists("")]
+        mock_setup_subscriptions = mock.MagicMock()
+        monkeypatch.setattr(
+            invalidation, "get_pubsub_subscriber", lambda: mock_subscriber
+        )
+        monkeypatch.setattr(
+            invalidation, "setup_subscriptions", mock_setup_subscriptions
+        )
+        monkeypatch.setattr(invalidation.socket, "gethostname", lambda: "web.1")
+
+        for _ in range(2):
+            setup_permissions_invalidation()
+
+        subscription_name = f"user-permissions-changed-web-1-{os.getpid()}"
+        request = mock_subscriber.create_subscription.call_args[1]["request"]
+        assert request["name"] == subscription_name
+        assert request["topic"] == "user-permissions-changed"
+        assert request["expiration_policy"] == {"ttl": {"seconds": 86400}}
+        assert mock_setup_subscriptions.call_args[0][0] == [
+            (subscription_name, handle_permissions_changed)
+        ]
+        assert mock_setup_subscriptions.call_count == 2
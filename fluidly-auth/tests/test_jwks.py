@@ -0,0 +1,270 @@
+import asyncio
+import base64
+import json
+import threading
+import time
+from unittest import mock
+
+import pytest
+import responses
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from google.auth import crypt, jwt
+
+from fluidly.auth.jwks import (
+    JWKS,
+    InvalidTokenException,
+    TokenVerifier,
+    disable_token_verification,
+    enable_token_verification,
+    get_bearer_token,
+    get_token_verifier,
+    verify_authorization,
+)
+
+ISSUER = "https://fluidly.eu.auth0.com/"
+JWKS_URL = "https://fluidly.eu.auth0.com/.well-known/jwks.json"
+AUDIENCE = "https://api.fluidly.com"
+CLAIMS = {
+    "iss": ISSUER,
+    "aud": [AUDIENCE, "https://fluidly.eu.auth0.com/userinfo"],
+    "sub": "auth0|123",
+    "https://api.fluidly.com/app_metadata": {"userId": "user_id"},
+}
+
+
+def to_base64url(number):
+    encoded = number.to_bytes((number.bit_length() + 7) // 8, "big")
+    return base64.urlsafe_b64encode(encoded).rstrip(b"=").decode("utf-8")
+
+
+class KeyPair:
+    def __init__(self, kid):
+        self.kid = kid
+        self.private_key = rsa.generate_private_key(
+            public_exponent=65537, key_size=2048
+        )
+
+    def jwk(self):
+        numbers = self.private_key.public_key().public_numbers()
+        return {
+            "kty": "RSA",
+            "use": "sig",
+            "alg": "RS256",
+            "kid": self.kid,
+            "n": to_base64url(numbers.n),
+            "e": to_base64url(numbers.e),
+        }
+
+    def sign(self, **claims):
+        pem = self.private_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+        signer = crypt.RSASigner.from_string(pem, key_id=self.kid)
+        now = int(time.time())
+        payload = {**CLAIMS, "iat": now, "exp": now + 3600, **claims}
+        return jwt.encode(signer, payload).decode("utf-8")
+
+
+@pytest.fixture(scope="module")
+def key_pair():
+    return KeyPair("key-1")
+
+
+@pytest.fixture()
+def mocked_jwks(mocked_responses, key_pair):
+    mocked_responses.add(responses.GET, JWKS_URL, json={"keys": [key_pair.jwk()]})
+    yield mocked_responses
+
+
+@pytest.fixture()
+def verifier():
+    return TokenVerifier({ISSUER: JWKS(JWKS_URL)}, audience=AUDIENCE)
+
+
+class TestTokenVerifier:
+    def test_returns_claims(self, mocked_jwks, key_pair, verifier):
+        claims = verifier.verify(key_pair.sign())
+
+        assert claims["sub"] == "auth0|123"
+        assert claims["https://api.fluidly.com/app_metadata"] == {"userId": "user_id"}
+
+    def test_caches_verified_tokens(self, mocked_jwks, key_pair, verifier):
+        token = key_pair.sign()
+
+        verifier.verify(token)["sub"] = "updated"
+
+        assert verifier.verify(token)["sub"] == "auth0|123"
+        assert verifier.stats()["hits"] == 1
+        assert len(mocked_jwks.calls) == 1
+
+    def test_rejects_invalid_signature(self, mocked_jwks, key_pair, verifier):
+        header, payload, _ = key_pair.sign().split(".")
+        _, _, signature = key_pair.sign(sub="other").split(".")
+
+        with pytest.raises(InvalidTokenException, match="Invalid signature"):
+            verifier.verify(f"{header}.{payload}.{signature}")
+
+    @pytest.mark.parametrize(
+        "claims,error",
+        [
+            ({"exp": 1}, "expired"),
+            ({"iat": int(time.time()) + 600}, "not yet valid"),
+            ({"aud": "https://other.api"}, "audience"),
+        ],
+    )
+    def test_rejects_invalid_claims(
+        self, mocked_jwks, key_pair, verifier, claims, error
+    ):
+        with pytest.raises(InvalidTokenException, match=error):
+            verifier.verify(key_pair.sign(**claims))
+
+    def test_rejects_untrusted_issuer(self, key_pair, verifier):
+        with pytest.raises(InvalidTokenException, match="Untrusted issuer"):
+            verifier.verify(key_pair.sign(iss="https://other.issuer/"))
+
+    def test_rejects_malformed_token(self, verifier):
+        with pytest.raises(InvalidTokenException, match="Malformed"):
+            verifier.verify("not.a.token")
+
+    @pytest.mark.parametrize("kid", [None, ["key-1"], {"kid": "key-1"}, 1])
+    def test_rejects_invalid_key_id(self, key_pair, verifier, kid):
+        _, payload, signature = key_pair.sign().split(".")
+        header = base64.urlsafe_b64encode(
+            json.dumps({"alg": "RS256", "kid": kid}).encode("utf-8")
+        ).decode("utf-8")
+
+        with pytest.raises(InvalidTokenException, match="Invalid signing key id"):
+            verifier.verify(f"{header}.{payload}.{signature}")
+
+    def test_skips_unusable_keys(self, mocked_responses, key_pair, verifier):
+        mocked_responses.add(
+            responses.GET,
+            JWKS_URL,
+            json={
+                "keys": [
+                    {**key_pair.jwk(), "kid": None},
+                    {k: v for k, v in key_pair.jwk().items() if k != "kid"},
+                    {k: v for k, v in key_pair.jwk().items() if k != "kty"},
+                    {**key_pair.jwk(), "kid": "no-modulus", "n": None},
+                    key_pair.jwk(),
+                ]
+            },
+        )
+
+        assert verifier.verify(key_pair.sign())["sub"] == "auth0|123"
+        assert verifier.issuers[ISSUER].stats()["keys"] == 1
+
+    def test_fetches_rotated_keys(self, mocked_jwks, key_pair, verifier):
+        rotated_key_pair = KeyPair("key-2")
+        verifier.verify(key_pair.sign())
+        mocked_jwks.replace(
+            responses.GET, JWKS_URL, json={"keys": [rotated_key_pair.jwk()]}
+        )
+        verifier.issuers[ISSUER].min_refresh_interval = 0
+
+        assert verifier.verify(rotated_key_pair.sign())["sub"] == "auth0|123"
+        assert verifier.stats()["issuers"][ISSUER]["refreshes"] == 2
+
+    def test_unknown_key_fetches_are_throttled(self, mocked_jwks, verifier):
+        other_key_pair = KeyPair("unknown")
+
+        for _ in range(3):
+            with pytest.raises(InvalidTokenException, match="Unknown signing key"):
+                verifier.verify(other_key_pair.sign())
+
+        assert len(mocked_jwks.calls) == 1
+
+    def test_keeps_keys_when_fetch_fails(self, mocked_jwks, key_pair, verifier):
+        jwks = verifier.issuers[ISSUER]
+        verifier.verify(key_pair.sign())
+        mocked_jwks.replace(responses.GET, JWKS_URL, status=500)
+        jwks.refresh_interval = 0
+        jwks.min_refresh_interval = 0
+
+        assert verifier.verify(key_pair.sign(sub="other"))["sub"] == "other"
+        jwks._refresh_thread.join()
+        jwks.refresh_interval = 3600
+        assert verifier.verify(key_pair.sign(sub="another"))["sub"] == "another"
+        assert jwks.stats() == {"refreshes": 1, "failures": 1, "keys": 1}
+
+    def test_serves_current_keys_while_refreshing(
+        self, mocked_responses, key_pair, verifier
+    ):
+        jwks = verifier.issuers[ISSUER]
+        release = threading.Event()
+
+        def slow_jwks(request):
+            if jwks.refreshes:
+                release.wait(5)
+            return 200, {}, json.dumps({"keys": [key_pair.jwk()]})
+
+        mocked_responses.add_callback(responses.GET, JWKS_URL, callback=slow_jwks)
+        verifier.verify(key_pair.sign())
+        jwks.refresh_interval = 0
+        jwks.min_refresh_interval = 0
+
+        for sub in ("other", "another"):
+            assert verifier.verify(key_pair.sign(sub=sub))["sub"] == sub
+        assert jwks.refreshes == 1
+
+        release.set()
+        jwks._refresh_thread.join()
+        assert jwks.refreshes == 2
+        assert [call.request.url for call in mocked_responses.calls] == [JWKS_URL] * 2
+
+    def test_verifies_async_off_the_event_loop(self, mocked_jwks, key_pair, verifier):
+        token = key_pair.sign()
+        threads = []
+
+        def decode(*args):
+            threads.append(threading.current_thread())
+            return TokenVerifier.decode(verifier, *args)
+
+        loop = asyncio.new_event_loop()
+        try:
+            with mock.patch.object(verifier, "decode", side_effect=decode):
+                claims = loop.run_until_complete(verifier.verify_async(token))
+                cached_claims = loop.run_until_complete(verifier.verify_async(token))
+        finally:
+            loop.close()
+
+        assert claims == cached_claims
+        assert claims["sub"] == "auth0|123"
+        assert len(threads) == 1
+        assert threads[0] is not threading.current_thread()
+
+
+class TestGetBearerToken:
+    @pytest.mark.parametrize(
+        "authorization,token",
+        [
+            ("Bearer abc", "abc"),
+            ("bearer abc", "abc"),
+            ("Basic abc", None),
+            ("Bearer ", None),
+            (None, None),
+        ],
+    )
+    def test_get_bearer_token(self, authorization, token):
+        assert get_bearer_token(authorization) == token
+
+
+class TestTokenVerification:
+    def test_verify_authorization(self, mocked_jwks, key_pair):
+        enable_token_verification({ISSUER: JWKS_URL}, audience=AUDIENCE)
+        try:
+            claims = verify_authorization(f"Bearer {key_pair.sign()}")
+            with pytest.raises(InvalidTokenException):
+                verify_authorization(None)
+        finally:
+            disable_token_verification()
+
+        assert claims["sub"] == "auth0|123"
+        assert get_token_verifier() is None
+
+    def test_verification_must_be_enabled(self):
+        with pytest.raises(ValueError):
+            verify_authorization("Bearer abc")
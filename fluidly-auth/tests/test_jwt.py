@@ -1,12 +1,24 @@
 import json
+import os
 from unittest import mock
 
 import pytest
 from freezegun import freeze_time
 from google.oauth2.service_account import Credentials
 
-from fluidly.auth import jwt
-from fluidly.auth.jwt import generate_jwt
+from fluidly.auth import jwt, token_refresher
+from fluidly.auth.jwt import (
+    generate_jwt,
+    get_service_account_and_signer,
+    signer_registry,
+    token_cache,
+)
+from fluidly.auth.token_refresher import (
+    TokenRefresher,
+    disable_token_refresher,
+    enable_token_refresher,
+    get_token_refresher,
+)
 
 
 class MockCredentials:
@@ -46,6 +58,15 @@ def mocked_jwt(monkeypatch):
     yield mock_jwt
 
 
+@pytest.fixture(autouse=True)
+def clear_caches():
+    token_cache.clear()
+    signer_registry.clear()
+    yield
+    token_cache.clear()
+    signer_registry.clear()
+
+
 @pytest.fixture()
 def mocked_env_credentials_path(monkeypatch):
     monkeypatch.setenv("GOOGLE_APPLICATION_CREDENTIALS", "/some/path/credentials.json")
@@ -146,3 +167,212 @@ class TestGenerateJWT:
     def test_raises_error_if_not_json_string(self):
         with pytest.raises(json.decoder.JSONDecodeError):
             generate_jwt({}, google_application_credentials_info="not an object")
+
+
+class TestTokenCache:
+    PATH = "/some/path/credentials.json"
+
+    def test_reuses_signed_token(
+        self, mocked_crypt, mocked_jwt, mock_google_credentials
+    ):
+        assert (
+            generate_jwt({}, google_application_credentials=self.PATH) == b"JWT_TOKEN"
+        )
+        assert (
+            generate_jwt({}, google_application_credentials=self.PATH) == b"JWT_TOKEN"
+        )
+
+        assert mocked_jwt.encode.call_count == 1
+        assert token_cache.stats() == {"hits": 1, "misses": 1, "size": 1}
+
+    def test_sets_cached_claims(
+        self, mocked_crypt, mocked_jwt, mock_google_credentials
+    ):
+        with freeze_time("2019-01-14 03:21:34"):
+            generate_jwt({}, google_application_credentials=self.PATH)
+
+        with freeze_time("2019-01-14 03:31:34"):
+            claims = {}
+            generate_jwt(claims, google_application_credentials=self.PATH)
+
+        assert claims["iat"] == 1547436094
+        assert claims["exp"] == 1547439694
+
+    def test_resigns_token_near_expiry(
+        self, mocked_crypt, mocked_jwt, mock_google_credentials
+    ):
+        with freeze_time("2019-01-14 03:21:34"):
+            generate_jwt({}, google_application_credentials=self.PATH)
+
+        with freeze_time("2019-01-14 04:18:34"):
+            claims = {}
+            generate_jwt(claims, google_application_credentials=self.PATH)
+
+        assert mocked_jwt.encode.call_count == 2
+        assert claims["iat"] == 1547439514
+
+    def test_different_claims_are_signed_separately(
+        self, mocked_crypt, mocked_jwt, mock_google_credentials
+    ):
+        generate_jwt({"user": "1"}, google_application_credentials=self.PATH)
+        generate_jwt({"user": "2"}, google_application_credentials=self.PATH)
+
+        assert mocked_jwt.encode.call_count == 2
+        assert token_cache.stats()["misses"] == 2
+
+    def test_different_credentials_are_signed_separately(
+        self, mocked_crypt, mocked_jwt, mock_google_credentials
+    ):
+        generate_jwt({}, google_application_credentials=self.PATH)
+        generate_jwt(
+            {}, google_application_credentials_info='{"private_key":"very private"}'
+        )
+
+        assert mocked_jwt.encode.call_count == 2
+
+    def test_evicts_least_recently_used_token(
+        self, monkeypatch, mocked_crypt, mocked_jwt, mock_google_credentials
+    ):
+        monkeypatch.setattr(token_cache, "max_size", 1)
+
+        generate_jwt({"user": "1"}, google_application_credentials=self.PATH)
+        generate_jwt({"user": "2"}, google_application_credentials=self.PATH)
+        generate_jwt({"user": "1"}, google_application_credentials=self.PATH)
+
+        assert mocked_jwt.encode.call_count == 3
+        assert token_cache.stats()["size"] == 1
+
+    def test_resigns_token_when_credentials_file_changes(
+        self, tmp_path, mocked_crypt, mocked_jwt, mock_google_credentials
+    ):
+        credentials_file = tmp_path / "credentials.json"
+        credentials_file.write_text('{"private_key":"very private"}')
+        generate_jwt({}, google_application_credentials=str(credentials_file))
+        os.utime(credentials_file, (0, 0))
+        mocked_jwt.encode.return_value = b"ROTATED_JWT_TOKEN"
+
+        assert (
+            generate_jwt({}, google_application_credentials=str(credentials_file))
+            == b"ROTATED_JWT_TOKEN"
+        )
+        assert mocked_crypt.RSASigner.from_service_account_file.call_count == 2
+        signer = mocked_jwt.encode.call_args[0][0]
+        assert signer == mocked_crypt.RSASigner.from_service_account_file.return_value
+
+
+class TestSignerRegistry:
+    @pytest.fixture()
+    def credentials_file(self, tmp_path):
+        path = tmp_path / "credentials.json"
+        path.write_text('{"private_key":"very private"}')
+        return path
+
+    def test_loads_signer_once_per_file(
+        self, credentials_file, mocked_crypt, mock_google_credentials
+    ):
+        get_service_account_and_signer(str(credentials_file), None)
+        sa_email, signer = get_service_account_and_signer(str(credentials_file), None)
+
+        assert sa_email == "test@email.com"
+        assert signer == mocked_crypt.RSASigner.from_service_account_file.return_value
+        assert mocked_crypt.RSASigner.from_service_account_file.call_count == 1
+
+    def test_reloads_signer_when_file_changes(
+        self, credentials_file, mocked_crypt, mock_google_credentials
+    ):
+        get_service_account_and_signer(str(credentials_file), None)
+        os.utime(credentials_file, (0, 0))
+        get_service_account_and_signer(str(credentials_file), None)
+
+        assert mocked_crypt.RSASigner.from_service_account_file.call_count == 2
+
+    def test_loads_signer_once_per_info(self, mocked_crypt, mock_google_credentials):
+        get_service_account_and_signer(None, {"private_key": "very private"})
+        get_service_account_and_signer(None, {"private_key": "very private"})
+        get_service_account_and_signer(None, {"private_key": "other"})
+
+        assert mocked_crypt.RSASigner.from_service_account_info.call_count == 2
+
+    def test_does_not_cache_missing_file(self, mocked_crypt, mock_google_credentials):
+        get_service_account_and_signer("/some/path/credentials.json", None)
+        get_service_account_and_signer("/some/path/credentials.json", None)
+
+        assert mocked_crypt.RSASigner.from_service_account_file.call_count == 2
+
+
+class TestTokenRefresher:
+    PATH = "/some/path/credentials.json"
+
+    @pytest.fixture(autouse=True)
+    def disabled_refresher(self):
+        yield
+        disable_token_refresher()
+
+    def test_refreshes_used_tokens(
+        self, mocked_crypt, mocked_jwt, mock_google_credentials
+    ):
+        refresher = TokenRefresher(refresh_at=0.8)
+
+        with freeze_time("2019-01-14 03:21:34") as frozen_time:
+            generate_jwt({"user": "1"}, google_application_credentials=self.PATH)
+            generate_jwt({"user": "1"}, google_application_credentials=self.PATH)
+
+            frozen_time.tick(2879)
+            refresher.refresh()
+            assert mocked_jwt.encode.call_count == 1
+
+            frozen_time.tick(1)
+            refresher.refresh()
+            assert mocked_jwt.encode.call_count == 2
+            assert mocked_jwt.encode.call_args[0][1]["user"] == "1"
+
+            frozen_time.tick(3000)
+            claims = {"user": "1"}
+            generate_jwt(claims, google_application_credentials=self.PATH)
+
+        assert mocked_jwt.encode.call_count == 2
+        assert claims["iat"] == 1547436094 + 2880
+        assert refresher.stats()["refreshed"] == 1
+
+    def test_does_not_refresh_unused_tokens(
+        self, mocked_crypt, mocked_jwt, mock_google_credentials
+    ):
+        refresher = TokenRefresher(refresh_at=0.5)
+
+        with freeze_time("2019-01-14 03:21:34") as frozen_time:
+            generate_jwt({}, google_application_credentials=self.PATH)
+
+            frozen_time.tick(1800)
+            refresher.refresh()
+
+        assert mocked_jwt.encode.call_count == 1
+
+    def test_counts_failures(
+        self, monkeypatch, mocked_crypt, mocked_jwt, mock_google_credentials
+    ):
+        monkeypatch.setattr(token_refresher.base_logger, "get_logger", mock.MagicMock())
+        refresher = TokenRefresher(refresh_at=0.5)
+
+        with freeze_time("2019-01-14 03:21:34") as frozen_time:
+            generate_jwt({}, google_application_credentials=self.PATH)
+            generate_jwt({}, google_application_credentials=self.PATH)
+
+            mocked_jwt.encode.side_effect = Exception()
+            frozen_time.tick(1800)
+            refresher.refresh()
+
+        assert refresher.stats()["failures"] == 1
+
+    def test_invalid_refresh_at(self):
+        with pytest.raises(ValueError):
+            TokenRefresher(refresh_at=1.2)
+
+    def test_enable_starts_thread(self):
+        refresher = enable_token_refresher(interval=60)
+
+        assert get_token_refresher() is refresher
+        assert refresher.stats()["running"]
+
+        disable_token_refresher()
+        assert not refresher.stats()["running"]
+        assert get_token_refresher() is None
@@ -1,17 +1,32 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest import mock
 
 import pytest
 import responses
 
 from fluidly.auth import jwt_requests
-from fluidly.auth.jwt_requests import make_jwt_request
+from fluidly.auth.deadline import DeadlineExceededException
+from fluidly.auth.jwt_requests import (
+    JitteredRetry,
+    configure_session,
+    get_session,
+    make_jwt_request,
+)
 
 
 @pytest.fixture()
-def mocked_requests(monkeypatch):
-    mock_requests = mock.MagicMock()
-    monkeypatch.setattr(jwt_requests, "requests", mock_requests)
-    yield mock_requests
+def mocked_session(monkeypatch):
+    mock_session = mock.MagicMock()
+    monkeypatch.setattr(jwt_requests, "get_session", lambda: mock_session)
+    yield mock_session
+
+
+@pytest.fixture()
+def reset_session():
+    yield
+    configure_session()
 
 
 class TestMakeJWTRequests:
@@ -25,10 +40,169 @@ class TestMakeJWTRequests:
 
         assert response.status_code == 200
 
-    def test_passing_jwt(self, mocked_requests):
+    def test_passing_jwt(self, mocked_session):
         make_jwt_request(TestMakeJWTRequests.JWT, TestMakeJWTRequests.URL)
 
-        mocked_requests.get.assert_called_with(
+        mocked_session.get.assert_called_with(
             "https://test.url",
             headers={"Authorization": "Bearer test", "content-type": "text/html"},
+            timeout=(3.05, 10.0),
         )
+
+    def test_passing_timeout(self, mocked_session):
+        make_jwt_request(TestMakeJWTRequests.JWT, TestMakeJWTRequests.URL, (1, 2))
+
+        args, kwargs = mocked_session.get.call_args
+        assert kwargs["timeout"] == (1, 2)
+
+    def test_reusing_session(self, mocked_responses):
+        mocked_responses.add(responses.GET, TestMakeJWTRequests.URL)
+
+        session = get_session()
+        make_jwt_request(TestMakeJWTRequests.JWT, TestMakeJWTRequests.URL)
+
+        assert get_session() is session
+
+
+@pytest.fixture()
+def slow_server():
+    class SlowHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(1)
+            self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SlowHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture()
+def retry_after_server():
+    class RetryAfterHandler(BaseHTTPRequestHandler):
+        requests = 0
+
+        def do_GET(self):
+            RetryAfterHandler.requests += 1
+            if RetryAfterHandler.requests == 1:
+                self.send_response(503)
+                self.send_header("Retry-After", "3")
+            else:
+                self.send_response(200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RetryAfterHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/"
+    server.shutdown()
+    server.server_close()
+
+
+class TestMakeJWTRequestsWithDeadline:
+    JWT = b"test"
+    URL = "https://test.url"
+
+    def test_retries_are_bounded_by_deadline(self, reset_session, slow_server):
+        configure_session(max_retries=2)
+
+        start = time.monotonic()
+        with pytest.raises(DeadlineExceededException):
+            make_jwt_request(self.JWT, slow_server, deadline_at=time.monotonic() + 0.3)
+
+        assert time.monotonic() - start < 0.6
+
+    def test_retrying_unavailable_service_within_deadline(self, mocked_responses):
+        mocked_responses.add(responses.GET, self.URL, status=503)
+        mocked_responses.add(responses.GET, self.URL, status=200)
+
+        response = make_jwt_request(
+            self.JWT, self.URL, deadline_at=time.monotonic() + 5
+        )
+
+        assert response.status_code == 200
+        assert len(mocked_responses.calls) == 2
+
+    def test_returning_last_response_once_retries_are_exhausted(
+        self, reset_session, mocked_responses
+    ):
+        configure_session(max_retries=1, backoff_factor=0)
+        mocked_responses.add(responses.GET, self.URL, status=503)
+
+        response = make_jwt_request(
+            self.JWT, self.URL, deadline_at=time.monotonic() + 5
+        )
+
+        assert response.status_code == 503
+        assert len(mocked_responses.calls) == 2
+
+    def test_failing_once_deadline_has_passed(self, mocked_responses):
+        with pytest.raises(DeadlineExceededException):
+            make_jwt_request(self.JWT, self.URL, deadline_at=time.monotonic() - 1)
+
+        assert len(mocked_responses.calls) == 0
+
+
+class TestConfigureSession:
+    def test_configures_pool_and_retries(self, reset_session):
+        session = configure_session(pool_maxsize=32, max_retries=3)
+
+        adapter = session.get_adapter("https://test.url")
+        assert adapter._pool_maxsize == 32
+        assert isinstance(adapter.max_retries, JitteredRetry)
+        assert adapter.max_retries.total == 3
+        assert get_session() is session
+
+    def test_configures_timeout(self, reset_session, mocked_session):
+        configure_session(connect_timeout=1, read_timeout=2)
+
+        make_jwt_request(TestMakeJWTRequests.JWT, TestMakeJWTRequests.URL)
+
+        args, kwargs = mocked_session.get.call_args
+        assert kwargs["timeout"] == (1, 2)
+
+    def test_retries_ignore_retry_after(self, reset_session, retry_after_server):
+        configure_session(max_retries=1, backoff_factor=0.1)
+
+        start = time.monotonic()
+        response = make_jwt_request(TestMakeJWTRequests.JWT, retry_after_server)
+
+        assert response.status_code == 200
+        assert time.monotonic() - start < 1
+
+    def test_closes_previous_session(self, reset_session):
+        previous_session = get_session()
+
+        with mock.patch.object(previous_session, "close") as close:
+            configure_session()
+
+        assert close.called
+
+
+class TestJitteredRetry:
+    def test_backoff_is_jittered_below_exponential_backoff(self):
+        retry = JitteredRetry(total=5, backoff_factor=1)
+        for _ in range(3):
+            retry = retry.increment(method="GET", url="/")
+
+        backoffs = {retry.get_backoff_time() for _ in range(20)}
+
+        assert len(backoffs) > 1
+        assert all(0 <= backoff <= 4 for backoff in backoffs)
+
+    def test_no_backoff_on_first_retry(self):
+        retry = JitteredRetry(total=5, backoff_factor=1)
+
+        assert retry.get_backoff_time() == 0
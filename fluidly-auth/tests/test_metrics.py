@@ -0,0 +1,149 @@
+import re
+from unittest import mock
+
+import pytest
+import responses
+
+from fluidly.auth import permissions
+from fluidly.auth.metrics import (
+    ADMIN,
+    CONNECTION,
+    DENIED,
+    GRANTED,
+    LatencyHistogram,
+    PermissionsMetrics,
+    get_endpoint,
+    permissions_metrics,
+)
+from fluidly.auth.permissions import (
+    UserPermissionsPayloadException,
+    UserPermissionsRequestException,
+    check_admin_permissions,
+    check_user_permissions,
+)
+
+FLUIDLY_API_URL = "https://fluidly-api.url"
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    permissions_metrics.reset()
+    yield
+    permissions_metrics.reset()
+
+
+@pytest.fixture()
+def mocked_generate_jwt(monkeypatch):
+    monkeypatch.setattr(permissions, "generate_jwt", mock.MagicMock())
+
+
+class TestLatencyHistogram:
+    def test_empty(self):
+        histogram = LatencyHistogram()
+
+        assert histogram.percentile(0.5) is None
+        assert histogram.count == 0
+
+    def test_percentiles_within_bucket_precision(self):
+        histogram = LatencyHistogram()
+        for latency in range(1, 1001):
+            histogram.record(latency / 1000)
+
+        assert histogram.count == 1000
+        assert histogram.max == 1.0
+        assert histogram.percentile(0.5) == pytest.approx(0.5, rel=0.25)
+        assert histogram.percentile(0.95) == pytest.approx(0.95, rel=0.25)
+        assert histogram.percentile(0.99) == pytest.approx(0.99, rel=0.25)
+        assert histogram.percentile(1) == 1.0
+
+    def test_observations_above_highest_bucket(self):
+        histogram = LatencyHistogram(buckets=[0.1, 1])
+        histogram.record(5)
+
+        assert histogram.percentile(0.99) == pytest.approx(4.96)
+        assert histogram.buckets() == [(0.1, 0), (1, 0), (float("inf"), 1)]
+
+
+class TestPermissionsMetrics:
+    def test_snapshot(self):
+        metrics = PermissionsMetrics()
+        metrics.record(CONNECTION, GRANTED, 0.1)
+        metrics.record(CONNECTION, DENIED, 0.2)
+
+        snapshot = metrics.snapshot()
+
+        assert snapshot[CONNECTION]["count"] == 2
+        assert snapshot[CONNECTION]["sum"] == pytest.approx(0.3)
+        assert snapshot[CONNECTION]["max"] == 0.2
+        assert snapshot[CONNECTION]["outcomes"] == {
+            "granted": 1,
+            "denied": 1,
+            "payload_error": 0,
+            "request_error": 0,
+        }
+        assert snapshot[ADMIN]["count"] == 0
+        assert snapshot[ADMIN]["p99"] is None
+
+    def test_reset(self):
+        metrics = PermissionsMetrics()
+        metrics.record(ADMIN, GRANTED, 0.1)
+        metrics.reset()
+
+        assert metrics.snapshot()[ADMIN]["count"] == 0
+
+    def test_get_endpoint(self):
+        assert get_endpoint(f"{FLUIDLY_API_URL}/v1/user-permissions/admin") == ADMIN
+        assert (
+            get_endpoint(f"{FLUIDLY_API_URL}/v1/user-permissions/connections/admin-1")
+            == CONNECTION
+        )
+        assert (
+            get_endpoint(f"{FLUIDLY_API_URL}/v1/user-permissions/connections/admin")
+            == CONNECTION
+        )
+
+
+class TestRecordedPermissionChecks:
+    def outcomes(self, endpoint):
+        return permissions_metrics.snapshot()[endpoint]["outcomes"]
+
+    def test_records_granted_and_denied(self, mocked_generate_jwt, mocked_responses):
+        mocked_responses.add(
+            responses.GET,
+            f"{FLUIDLY_API_URL}/v1/user-permissions/connections/connection_id",
+            json={"grantAccess": True},
+        )
+        mocked_responses.add(
+            responses.GET,
+            f"{FLUIDLY_API_URL}/v1/user-permissions/admin",
+            json={"grantAccess": False},
+        )
+
+        check_user_permissions({}, "connection_id", FLUIDLY_API_URL)
+        check_admin_permissions({}, FLUIDLY_API_URL)
+
+        assert self.outcomes(CONNECTION)["granted"] == 1
+        assert self.outcomes(ADMIN)["denied"] == 1
+        assert permissions_metrics.snapshot()[CONNECTION]["p50"] is not None
+
+    def test_records_payload_error(self, mocked_generate_jwt, mocked_responses):
+        mocked_responses.add(
+            responses.GET, re.compile(f"{FLUIDLY_API_URL}/*"), status=500
+        )
+
+        with pytest.raises(UserPermissionsPayloadException):
+            check_user_permissions({}, "connection_id", FLUIDLY_API_URL)
+
+        assert self.outcomes(CONNECTION)["payload_error"] == 1
+
+    def test_records_request_error(self, mocked_generate_jwt, mocked_responses):
+        mocked_responses.add(
+            responses.GET,
+            re.compile(f"{FLUIDLY_API_URL}/*"),
+            body=ConnectionError(),
+        )
+
+        with pytest.raises(UserPermissionsRequestException):
+            check_admin_permissions({}, FLUIDLY_API_URL)
+
+        assert self.outcomes(ADMIN)["request_error"] == 1
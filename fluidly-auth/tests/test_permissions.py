@@ -1,14 +1,31 @@
+import json
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 from unittest import mock
 
 import pytest
+import requests
 import responses
 
 from fluidly.auth import permissions
+from fluidly.auth.cache import (
+    ADMIN_SCOPE,
+    disable_permissions_cache,
+    enable_permissions_cache,
+    enable_shared_permissions_cache,
+)
+from fluidly.auth.deadline import request_deadline
 from fluidly.auth.permissions import (
+    TooManyConnectionsException,
+    UserPermissionsDeadlineExceededException,
     UserPermissionsPayloadException,
+    UserPermissionsRequestException,
     check_admin_permissions,
     check_user_permissions,
+    check_user_permissions_many,
+    configure_max_connections,
+    get_max_connections,
 )
 
 FLUIDLY_API_URL = "https://fluidly-api.url"
@@ -52,6 +69,16 @@ def mocked_500_permissions(mocked_responses):
     yield mocked_responses
 
 
+@pytest.fixture(params=["memory", "shared"])
+def permissions_cache(request, tmp_path):
+    if request.param == "shared":
+        cache = enable_shared_permissions_cache(str(tmp_path / "permissions.sqlite3"))
+    else:
+        cache = enable_permissions_cache()
+    yield cache
+    disable_permissions_cache()
+
+
 @pytest.fixture()
 def mocked_env_permissions_url_path(monkeypatch):
     mock_env_permissions_url = mock.MagicMock()
@@ -146,3 +173,286 @@ class TestCheckAdminPermissions:
         self, mocked_generate_jwt, mocked_200_granted_permissions
     ):
         assert check_admin_permissions({}, fluidly_api_url=FLUIDLY_API_URL) == True
+
+
+class TestCachedPermissions:
+    CLAIMS = {"sub": "auth0|123"}
+
+    def test_cache_disabled_by_default(
+        self, mocked_generate_jwt, mocked_200_granted_permissions
+    ):
+        check_user_permissions(self.CLAIMS, "connection_id", FLUIDLY_API_URL)
+        check_user_permissions(self.CLAIMS, "connection_id", FLUIDLY_API_URL)
+
+        assert len(mocked_200_granted_permissions.calls) == 2
+
+    def test_caches_user_decision(
+        self, permissions_cache, mocked_generate_jwt, mocked_200_granted_permissions
+    ):
+        for _ in range(20):
+            assert check_user_permissions(
+                dict(self.CLAIMS), "connection_id", FLUIDLY_API_URL
+            )
+
+        assert len(mocked_200_granted_permissions.calls) == 1
+        assert permissions_cache.stats()["hits"] == 19
+
+    def test_caches_per_connection(
+        self, permissions_cache, mocked_generate_jwt, mocked_200_granted_permissions
+    ):
+        check_user_permissions(dict(self.CLAIMS), "connection_id", FLUIDLY_API_URL)
+        check_user_permissions(dict(self.CLAIMS), "other_id", FLUIDLY_API_URL)
+        check_admin_permissions(dict(self.CLAIMS), FLUIDLY_API_URL)
+
+        assert len(mocked_200_granted_permissions.calls) == 3
+
+    def test_caches_denials(
+        self, permissions_cache, mocked_generate_jwt, mocked_200_not_granted_permissions
+    ):
+        assert not check_admin_permissions(dict(self.CLAIMS), FLUIDLY_API_URL)
+        assert not check_admin_permissions(dict(self.CLAIMS), FLUIDLY_API_URL)
+
+        assert len(mocked_200_not_granted_permissions.calls) == 1
+
+    def test_does_not_cache_errors(
+        self, permissions_cache, mocked_generate_jwt, mocked_500_permissions
+    ):
+        for _ in range(2):
+            with pytest.raises(UserPermissionsPayloadException):
+                check_user_permissions(
+                    dict(self.CLAIMS), "connection_id", FLUIDLY_API_URL
+                )
+
+        assert len(mocked_500_permissions.calls) == 2
+
+    def test_does_not_cache_without_subject(
+        self, permissions_cache, mocked_generate_jwt, mocked_200_granted_permissions
+    ):
+        check_user_permissions({}, "connection_id", FLUIDLY_API_URL)
+        check_user_permissions({}, "connection_id", FLUIDLY_API_URL)
+
+        assert len(mocked_200_granted_permissions.calls) == 2
+
+    def test_revalidates_expired_decision(
+        self, permissions_cache, mocked_generate_jwt, mocked_responses
+    ):
+        permissions_cache.grant_ttl = 0
+        url = f"{FLUIDLY_API_URL}/v1/user-permissions/connections/connection_id"
+        mocked_responses.add(
+            responses.GET, url, json={"grantAccess": True}, headers={"ETag": '"v1"'}
+        )
+        mocked_responses.add(responses.GET, url, status=304)
+
+        for _ in range(3):
+            assert check_user_permissions(
+                dict(self.CLAIMS), "connection_id", FLUIDLY_API_URL
+            )
+
+        requests = [call.request for call in mocked_responses.calls]
+        assert len(requests) == 3
+        assert "If-None-Match" not in requests[0].headers
+        assert requests[1].headers["If-None-Match"] == '"v1"'
+        assert requests[2].headers["If-None-Match"] == '"v1"'
+
+    def test_revalidation_with_new_decision(
+        self, permissions_cache, mocked_generate_jwt, mocked_responses
+    ):
+        permissions_cache.grant_ttl = 0
+        url = f"{FLUIDLY_API_URL}/v1/user-permissions/admin"
+        last_modified = "Mon, 14 Jan 2019 03:21:34 GMT"
+        mocked_responses.add(
+            responses.GET,
+            url,
+            json={"grantAccess": True},
+            headers={"Last-Modified": last_modified},
+        )
+        mocked_responses.add(responses.GET, url, json={"grantAccess": False})
+
+        assert check_admin_permissions(dict(self.CLAIMS), FLUIDLY_API_URL)
+        assert not check_admin_permissions(dict(self.CLAIMS), FLUIDLY_API_URL)
+
+        request = mocked_responses.calls[1].request
+        assert request.headers["If-Modified-Since"] == last_modified
+        assert permissions_cache.get_stale(("auth0|123", ADMIN_SCOPE)) is None
+
+
+class TestCheckUserPermissionsMany:
+    @pytest.fixture()
+    def mocked_per_connection_permissions(self, mocked_responses):
+        def callback(request):
+            granted = not request.url.endswith("/denied")
+            return 200, {}, json.dumps({"grantAccess": granted})
+
+        mocked_responses.add_callback(
+            responses.GET, re.compile(f"{FLUIDLY_API_URL}/*"), callback=callback
+        )
+        yield mocked_responses
+
+    def test_required_permission_url(self):
+        with pytest.raises(ValueError, match="Please provide FLUIDLY_API_URL"):
+            check_user_permissions_many({}, ["connection_id"])
+
+    def test_returns_decision_per_connection(
+        self, mocked_generate_jwt, mocked_per_connection_permissions
+    ):
+        decisions = check_user_permissions_many(
+            {}, ["first", "denied", "second"], FLUIDLY_API_URL
+        )
+
+        assert decisions == {"first": True, "denied": False, "second": True}
+        assert len(mocked_per_connection_permissions.calls) == 3
+
+    def test_checks_duplicates_once(
+        self, mocked_generate_jwt, mocked_per_connection_permissions
+    ):
+        decisions = check_user_permissions_many(
+            {}, ["first", "first"], FLUIDLY_API_URL, max_concurrency=1
+        )
+
+        assert decisions == {"first": True}
+        assert len(mocked_per_connection_permissions.calls) == 1
+
+    def test_does_not_share_claims_between_checks(
+        self, mocked_generate_jwt, mocked_200_granted_permissions
+    ):
+        claims = {"sub": "auth0|123"}
+
+        check_user_permissions_many(claims, ["first", "second"], FLUIDLY_API_URL)
+
+        assert claims == {"sub": "auth0|123"}
+        first_claims, second_claims = [
+            call[0][0] for call in mocked_generate_jwt.call_args_list
+        ]
+        assert first_claims is not second_claims
+
+    def test_raises_errors(self, mocked_generate_jwt, mocked_500_permissions):
+        with pytest.raises(UserPermissionsPayloadException):
+            check_user_permissions_many({}, ["first", "second"], FLUIDLY_API_URL)
+
+    def test_rejects_too_many_connections(
+        self, monkeypatch, mocked_generate_jwt, mocked_per_connection_permissions
+    ):
+        monkeypatch.setattr(permissions, "_max_connections", get_max_connections())
+        configure_max_connections(2)
+
+        with pytest.raises(TooManyConnectionsException):
+            check_user_permissions_many({}, ["a", "b", "c"], FLUIDLY_API_URL)
+        assert len(mocked_per_connection_permissions.calls) == 0
+
+        decisions = check_user_permissions_many(
+            {}, ["a", "b", "a"], FLUIDLY_API_URL, max_concurrency=1
+        )
+        assert decisions == {"a": True, "b": True}
+
+
+class TestPermissionsDeadline:
+    CLAIMS = {"sub": "auth0|123"}
+
+    def test_deadline_caps_timeout(
+        self, mocked_generate_jwt, mocked_200_granted_permissions
+    ):
+        assert check_user_permissions(
+            {}, "connection_id", FLUIDLY_API_URL, deadline=0.5
+        )
+
+        timeout = mocked_200_granted_permissions.calls[0].request.req_kwargs["timeout"]
+        assert 0 < timeout.connect_timeout <= 0.5
+        assert 0 < timeout.read_timeout <= 0.5
+        assert 0 < timeout.total <= 0.5
+
+    def test_deadline_from_context(
+        self, mocked_generate_jwt, mocked_200_granted_permissions
+    ):
+        with request_deadline(0.5):
+            check_admin_permissions({}, FLUIDLY_API_URL, deadline=10)
+
+        timeout = mocked_200_granted_permissions.calls[0].request.req_kwargs["timeout"]
+        assert timeout.total <= 0.5
+
+    def test_gives_up_when_deadline_passed(self, mocked_generate_jwt):
+        with pytest.raises(UserPermissionsDeadlineExceededException):
+            check_user_permissions({}, "connection_id", FLUIDLY_API_URL, deadline=0)
+
+    def test_timeout_past_deadline(self, mocked_generate_jwt, mocked_responses):
+        def slow_timeout(request):
+            time.sleep(0.05)
+            raise requests.exceptions.ReadTimeout()
+
+        mocked_responses.add_callback(
+            responses.GET, re.compile(f"{FLUIDLY_API_URL}/*"), callback=slow_timeout
+        )
+
+        with pytest.raises(UserPermissionsRequestException) as exc_info:
+            check_user_permissions({}, "connection_id", FLUIDLY_API_URL, deadline=0.01)
+
+        assert isinstance(exc_info.value, UserPermissionsDeadlineExceededException)
+
+    def test_cached_decisions_ignore_deadline(
+        self, permissions_cache, mocked_generate_jwt, mocked_200_granted_permissions
+    ):
+        check_user_permissions(dict(self.CLAIMS), "connection_id", FLUIDLY_API_URL)
+
+        assert check_user_permissions(
+            dict(self.CLAIMS), "connection_id", FLUIDLY_API_URL, deadline=0
+        )
+
+    def test_deadline_of_a_check_does_not_fail_concurrent_checks(
+        self, mocked_generate_jwt, mocked_responses
+    ):
+        calls = []
+
+        def timeout_once(request):
+            calls.append(request)
+            if len(calls) == 1:
+                time.sleep(0.2)
+                raise requests.exceptions.ReadTimeout()
+            return 200, {}, json.dumps({"grantAccess": True})
+
+        mocked_responses.add_callback(
+            responses.GET, re.compile(f"{FLUIDLY_API_URL}/*"), callback=timeout_once
+        )
+        results = {}
+
+        def check(name, deadline):
+            try:
+                results[name] = check_user_permissions(
+                    dict(self.CLAIMS), "connection_id", FLUIDLY_API_URL, deadline
+                )
+            except Exception as e:
+                results[name] = e
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            executor.submit(check, "with_deadline", 0.1)
+            time.sleep(0.02)
+            executor.submit(check, "without_deadline", None)
+
+        assert isinstance(
+            results["with_deadline"], UserPermissionsDeadlineExceededException
+        )
+        assert results["without_deadline"] is True
+        # The waiting check made the request again past the first deadline
+        assert len(mocked_responses.calls) == 2
+
+    def test_checks_with_deadlines_share_requests(
+        self, mocked_generate_jwt, mocked_responses
+    ):
+        def slow_granted(request):
+            time.sleep(0.1)
+            return 200, {}, json.dumps({"grantAccess": True})
+
+        mocked_responses.add_callback(
+            responses.GET, re.compile(f"{FLUIDLY_API_URL}/*"), callback=slow_granted
+        )
+
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            results = list(
+                executor.map(
+                    lambda _: check_user_permissions(
+                        dict(self.CLAIMS), "connection_id", FLUIDLY_API_URL, 5.0
+                    ),
+                    range(10),
+                )
+            )
+
+        assert results == [True] * 10
+        assert len(mocked_responses.calls) == 1
@@ -0,0 +1,140 @@
+import io
+import time
+from unittest import mock
+
+import pytest
+import requests
+import responses
+
+from fluidly.auth import service_client
+from fluidly.auth.deadline import request_deadline
+from fluidly.auth.service_client import DeadlineExceededException, ServiceClient
+
+BASE_URL = "https://api.test"
+
+
+@pytest.fixture(autouse=True)
+def mocked_generate_jwt(monkeypatch):
+    mock_generate_jwt = mock.MagicMock(return_value=b"JWT_TOKEN")
+    monkeypatch.setattr(service_client, "generate_jwt", mock_generate_jwt)
+    yield mock_generate_jwt
+
+
+@pytest.fixture()
+def client():
+    client = ServiceClient(BASE_URL, claims={"scope": "read"}, backoff_factor=0)
+    yield client
+    client.close()
+
+
+class TestServiceClient:
+    def test_get_with_bearer_token(self, client, mocked_generate_jwt, mocked_responses):
+        mocked_responses.add(responses.GET, f"{BASE_URL}/v1/items", json=[1, 2])
+
+        response = client.get("/v1/items", params={"page": 1})
+
+        assert response.json() == [1, 2]
+        request = mocked_responses.calls[0].request
+        assert request.headers["Authorization"] == "Bearer JWT_TOKEN"
+        assert request.url == f"{BASE_URL}/v1/items?page=1"
+        assert mocked_generate_jwt.call_args[0][0] == {"scope": "read"}
+
+    def test_claims_are_not_updated(
+        self, client, mocked_generate_jwt, mocked_responses
+    ):
+        mocked_generate_jwt.side_effect = lambda claims, *args: (
+            claims.update({"iat": 1}) or b"JWT_TOKEN"
+        )
+        mocked_responses.add(responses.GET, f"{BASE_URL}/v1/items")
+
+        client.get("v1/items")
+
+        assert client.claims == {"scope": "read"}
+
+    def test_post(self, client, mocked_responses):
+        mocked_responses.add(responses.POST, f"{BASE_URL}/v1/items", status=201)
+
+        response = client.post("/v1/items", json={"name": "item"}, headers={"X-A": "b"})
+
+        assert response.status_code == 201
+        request = mocked_responses.calls[0].request
+        assert request.body == b'{"name": "item"}'
+        assert request.headers["X-A"] == "b"
+
+    def test_retries_idempotent_requests(self, client, mocked_responses):
+        mocked_responses.add(responses.GET, f"{BASE_URL}/v1/items", status=503)
+        mocked_responses.add(responses.GET, f"{BASE_URL}/v1/items", status=200)
+
+        assert client.get("/v1/items").status_code == 200
+        assert len(mocked_responses.calls) == 2
+
+    def test_retries_connection_errors(self, client, mocked_responses):
+        mocked_responses.add(
+            responses.GET, f"{BASE_URL}/v1/items", body=requests.ConnectionError()
+        )
+        mocked_responses.add(responses.GET, f"{BASE_URL}/v1/items", status=200)
+
+        assert client.get("/v1/items").status_code == 200
+
+    def test_does_not_retry_post(self, client, mocked_responses):
+        mocked_responses.add(responses.POST, f"{BASE_URL}/v1/items", status=503)
+
+        assert client.post("/v1/items").status_code == 503
+        assert len(mocked_responses.calls) == 1
+
+    def test_does_not_retry_streamed_bodies(self, client, mocked_responses):
+        mocked_responses.add(responses.PUT, f"{BASE_URL}/v1/items", status=503)
+
+        client.request("PUT", "/v1/items", data=io.BytesIO(b"body"))
+
+        assert len(mocked_responses.calls) == 1
+
+    def test_gives_up_after_max_retries(self, client, mocked_responses):
+        mocked_responses.add(responses.GET, f"{BASE_URL}/v1/items", status=503)
+
+        assert client.get("/v1/items").status_code == 503
+        assert len(mocked_responses.calls) == 3
+
+    def test_streams_response(self, client, mocked_responses):
+        mocked_responses.add(responses.GET, f"{BASE_URL}/v1/export", body=b"a" * 100)
+
+        with client.stream("GET", "/v1/export") as response:
+            assert b"".join(response.iter_content(10)) == b"a" * 100
+
+    def test_deadline_exceeded(self, client, mocked_responses):
+        def slow_unavailable(request):
+            time.sleep(0.1)
+            return 503, {}, ""
+
+        mocked_responses.add_callback(
+            responses.GET, f"{BASE_URL}/v1/items", callback=slow_unavailable
+        )
+
+        with pytest.raises(DeadlineExceededException):
+            client.get("/v1/items", deadline=0.05)
+        assert len(mocked_responses.calls) == 1
+
+    def test_deadline_from_context(self, client):
+        with request_deadline(0.5):
+            timeout = client.timeout(client.deadline_at(10))
+
+        assert timeout.total <= 0.5
+
+    def test_deadline_caps_timeout(self, client):
+        timeout = client.timeout(client.deadline_at(0.5))
+
+        assert timeout.total <= 0.5
+        assert timeout.connect_timeout <= 0.5
+
+    def test_records_latency_metrics(self, client, mocked_responses):
+        mocked_responses.add(responses.GET, f"{BASE_URL}/v1/items", status=503)
+        mocked_responses.add(responses.GET, f"{BASE_URL}/v1/items", status=200)
+        mocked_responses.add(responses.POST, f"{BASE_URL}/v1/items", status=201)
+
+        client.get("/v1/items")
+        client.post("/v1/items")
+
+        snapshot = client.metrics.snapshot()
+        assert snapshot["statuses"] == {"503": 1, "200": 1, "201": 1}
+        assert snapshot["latency"]["GET"]["count"] == 2
+        assert snapshot["latency"]["POST"]["p99"] is not None
@@ -0,0 +1,286 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from fluidly.auth import async_permissions, permissions
+from fluidly.auth.async_permissions import check_user_permissions_async
+from fluidly.auth.permissions import check_user_permissions
+from fluidly.auth.single_flight import SingleFlight, permissions_single_flight
+
+FLUIDLY_API_URL = "https://fluidly-api.url"
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "Timed out waiting for condition"
+        time.sleep(0.001)
+
+
+def run_in_threads(count, target):
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(target())) for _ in range(count)
+    ]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+class TestSingleFlight:
+    def test_collapses_concurrent_calls(self):
+        single_flight = SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def fn():
+            calls.append(1)
+            release.wait(2)
+            return "result"
+
+        threads, results = run_in_threads(5, lambda: single_flight.do("key", fn))
+        wait_for(lambda: single_flight.collapsed == 4)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        assert calls == [1]
+        assert results == ["result"] * 5
+        assert single_flight.stats() == {"calls": 1, "collapsed": 4}
+
+    def test_shares_exceptions(self):
+        single_flight = SingleFlight()
+        release = threading.Event()
+
+        def fn():
+            release.wait(2)
+            raise RuntimeError("Nope")
+
+        def call():
+            try:
+                single_flight.do("key", fn)
+            except RuntimeError as e:
+                return str(e)
+
+        threads, results = run_in_threads(3, call)
+        wait_for(lambda: single_flight.collapsed == 2)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        assert results == ["Nope"] * 3
+
+    def test_waiting_callers_time_out(self):
+        single_flight = SingleFlight()
+        release = threading.Event()
+
+        def fn():
+            release.wait(2)
+            return "result"
+
+        thread = threading.Thread(target=single_flight.do, args=("key", fn))
+        thread.start()
+        wait_for(lambda: single_flight.calls == 1)
+
+        with pytest.raises(TimeoutError):
+            single_flight.do("key", fn, timeout=0.01)
+        release.set()
+        thread.join()
+
+    def test_waiting_callers_retry_on_errors(self):
+        single_flight = SingleFlight()
+        release = threading.Event()
+
+        def fail():
+            release.wait(2)
+            raise TimeoutError()
+
+        def leader():
+            with pytest.raises(TimeoutError):
+                single_flight.do("key", fail, retry_on=(TimeoutError,))
+
+        thread = threading.Thread(target=leader)
+        thread.start()
+        wait_for(lambda: single_flight.calls == 1)
+
+        threads, results = run_in_threads(
+            3,
+            lambda: single_flight.do("key", lambda: "result", retry_on=(TimeoutError,)),
+        )
+        wait_for(lambda: single_flight.collapsed == 3)
+        release.set()
+        for t in [thread, *threads]:
+            t.join()
+
+        assert results == ["result"] * 3
+        assert single_flight.stats()["calls"] >= 2
+
+    def test_does_not_collapse_sequential_calls(self):
+        single_flight = SingleFlight()
+
+        single_flight.do("key", lambda: 1)
+        single_flight.do("key", lambda: 2)
+
+        assert single_flight.stats() == {"calls": 2, "collapsed": 0}
+
+    def test_collapses_concurrent_coroutines(self):
+        single_flight = SingleFlight()
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "result"
+
+        async def gather():
+            return await asyncio.gather(
+                *[single_flight.do_async("key", fn) for _ in range(5)]
+            )
+
+        assert asyncio.run(gather()) == ["result"] * 5
+        assert calls == [1]
+        assert single_flight.stats() == {"calls": 1, "collapsed": 4}
+
+    def test_shares_coroutine_exceptions(self):
+        single_flight = SingleFlight()
+
+        async def fn():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("Nope")
+
+        async def gather():
+            return await asyncio.gather(
+                *[single_flight.do_async("key", fn) for _ in range(3)],
+                return_exceptions=True,
+            )
+
+        results = asyncio.run(gather())
+
+        assert all(isinstance(result, RuntimeError) for result in results)
+
+    def test_waiting_coroutines_time_out(self):
+        single_flight = SingleFlight()
+
+        async def fn():
+            await asyncio.sleep(0.1)
+            return "result"
+
+        async def gather():
+            return await asyncio.gather(
+                single_flight.do_async("key", fn),
+                single_flight.do_async("key", fn, timeout=0.01),
+                return_exceptions=True,
+            )
+
+        result, error = asyncio.run(gather())
+
+        assert result == "result"
+        assert isinstance(error, TimeoutError)
+
+    def test_cancelled_leader_does_not_cancel_waiting_coroutines(self):
+        single_flight = SingleFlight()
+
+        async def fn():
+            await asyncio.sleep(0.05)
+            return "result"
+
+        async def gather():
+            leader = asyncio.ensure_future(single_flight.do_async("key", fn))
+            await asyncio.sleep(0)
+            follower = asyncio.ensure_future(single_flight.do_async("key", fn))
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            return await asyncio.gather(leader, follower, return_exceptions=True)
+
+        leader, follower = asyncio.run(gather())
+
+        assert isinstance(leader, asyncio.CancelledError)
+        assert follower == "result"
+        assert single_flight.stats() == {"calls": 1, "collapsed": 1}
+
+
+class TestCoalescedPermissions:
+    @pytest.fixture(autouse=True)
+    def reset_single_flight(self):
+        permissions_single_flight.reset()
+        yield
+        permissions_single_flight.reset()
+
+    def test_collapses_concurrent_user_permissions(self, monkeypatch):
+        release = threading.Event()
+        calls = []
+
+        def check_permissions(original_payload, request_url, **kwargs):
+            calls.append(request_url)
+            release.wait(2)
+            return True
+
+        monkeypatch.setattr(permissions, "check_permissions", check_permissions)
+
+        threads, results = run_in_threads(
+            10,
+            lambda: check_user_permissions(
+                {"sub": "auth0|123"}, "connection_id", FLUIDLY_API_URL
+            ),
+        )
+        wait_for(lambda: permissions_single_flight.collapsed == 9)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        assert len(calls) == 1
+        assert results == [True] * 10
+
+    def test_collapses_concurrent_async_user_permissions(self, monkeypatch):
+        calls = []
+
+        async def check_permissions_async(original_payload, request_url, **kwargs):
+            calls.append(request_url)
+            await asyncio.sleep(0.01)
+            return True
+
+        monkeypatch.setattr(
+            async_permissions, "check_permissions_async", check_permissions_async
+        )
+
+        async def gather():
+            return await asyncio.gather(
+                *[
+                    check_user_permissions_async(
+                        {"sub": "auth0|123"}, "connection_id", FLUIDLY_API_URL
+                    )
+                    for _ in range(10)
+                ]
+            )
+
+        assert asyncio.run(gather()) == [True] * 10
+        assert len(calls) == 1
+        assert permissions_single_flight.stats()["collapsed"] == 9
+
+    def test_does_not_collapse_different_subjects(self, monkeypatch):
+        calls = []
+
+        async def check_permissions_async(original_payload, request_url, **kwargs):
+            calls.append(request_url)
+            await asyncio.sleep(0.01)
+            return True
+
+        monkeypatch.setattr(
+            async_permissions, "check_permissions_async", check_permissions_async
+        )
+
+        async def gather():
+            return await asyncio.gather(
+                check_user_permissions_async(
+                    {"sub": "auth0|1"}, "connection_id", FLUIDLY_API_URL
+                ),
+                check_user_permissions_async(
+                    {"sub": "auth0|2"}, "connection_id", FLUIDLY_API_URL
+                ),
+            )
+
+        asyncio.run(gather())
+
+        assert len(calls) == 2
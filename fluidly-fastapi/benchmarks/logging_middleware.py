@@ -0,0 +1,133 @@
+"""Per-request overhead of `LoggingMiddleware` against the `BaseHTTPMiddleware`
+implementation it replaced, and of recording request metrics.
+
+Requests are sent straight to the ASGI app, without a server, and logging is
+discarded so only the middleware itself is measured:
+
+    python fluidly-fastapi/benchmarks/logging_middleware.py --requests 5000
+"""
+
+import argparse
+import asyncio
+import time
+from typing import Any, Callable, Dict, List
+from unittest import mock
+
+from fastapi import FastAPI
+from fastapi.requests import Request
+from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message
+
+from fluidly.fastapi.metrics import MetricsRegistry
+from fluidly.fastapi.middleware import logging
+from fluidly.fastapi.middleware.logging import LoggingMiddleware
+
+
+class BaseHTTPLoggingMiddleware(BaseHTTPMiddleware):
+    """The success path of `LoggingMiddleware` up to fluidly-fastapi 0.1.10"""
+
+    async def dispatch(
+        self, request: Request, call_next: RequestResponseEndpoint
+    ) -> Response:
+        logger = logging.get_logger()
+        start = time.time()
+        response = await call_next(request)
+        LoggingMiddleware._bind_request_context(logger, request)
+        logger.info(
+            "rest_request_processed",
+            duration=time.time() - start,
+            success=True,
+            status_code=response.status_code,
+        )
+        return response
+
+
+def create_app(middleware: Any = None, **options: Any) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/{partner_id}/{connection_id}")
+    def route(partner_id: int, connection_id: str) -> Dict[str, str]:
+        return {"msg": "Sending hugs from FastAPI"}
+
+    if middleware is not None:
+        app.add_middleware(middleware, **options)
+    return app
+
+
+async def request(app: ASGIApp) -> None:
+    scope = {
+        "type": "http",
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "server": ("testserver", 80),
+        "path": "/1/xero:123",
+        "raw_path": b"/1/xero:123",
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"testserver"), (b"user-agent", b"benchmark")],
+    }
+    messages: List[Message] = []
+    response_complete = asyncio.Event()
+
+    async def receive() -> Message:
+        if not messages:
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # Streaming responses listen for the client disconnecting
+        await response_complete.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message: Message) -> None:
+        messages.append(message)
+        if message["type"] == "http.response.body" and not message.get("more_body"):
+            response_complete.set()
+
+    await app(scope, receive, send)
+    assert messages[0]["status"] == 200
+
+
+async def measure(app: ASGIApp, requests: int) -> float:
+    """Returns the mean seconds per request"""
+    for _ in range(min(requests, 100)):
+        await request(app)
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        await request(app)
+    return (time.perf_counter() - start) / requests
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=5)
+    options = parser.parse_args()
+
+    apps: Dict[str, Callable[[], FastAPI]] = {
+        "no middleware": lambda: create_app(),
+        "BaseHTTPMiddleware": lambda: create_app(BaseHTTPLoggingMiddleware),
+        "pure ASGI": lambda: create_app(LoggingMiddleware),
+        "pure ASGI + metrics": lambda: create_app(
+            LoggingMiddleware, metrics=MetricsRegistry()
+        ),
+    }
+    with mock.patch.object(logging, "get_logger"):
+        timings = {
+            name: min(
+                asyncio.run(measure(factory(), options.requests))
+                for _ in range(options.rounds)
+            )
+            for name, factory in apps.items()
+        }
+
+    baseline = timings["no middleware"]
+    for name, timing in timings.items():
+        print(
+            f"{name:>21}: {timing * 1e6:8.1f}us per request, "
+            f"{(timing - baseline) * 1e6:+8.1f}us overhead"
+        )
+
+
+if __name__ == "__main__":
+    main()
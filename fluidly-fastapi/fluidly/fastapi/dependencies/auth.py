@@ -1,112 +1,225 @@
-import json
-from typing import Any, Dict
+from typing import TYPE_CHECKING, Any, Dict, List, NoReturn
 
 from fastapi.exceptions import HTTPException
 from fastapi.requests import Request
 
+from fluidly.auth.claims import USER_INFO_HEADER, parse_claims
+from fluidly.auth.lazy import LazyModule
 from fluidly.auth.permissions import (
     UserPermissionsPayloadException,
     UserPermissionsRequestException,
     check_admin_permissions,
     check_user_permissions,
+    check_user_permissions_many,
+    get_max_connections,
 )
-from fluidly.fastapi.utils import base64_decode
 from fluidly.structlog.base_logger import get_logger
 
+if TYPE_CHECKING:
+    from fluidly.auth import async_permissions, jwks
+else:
+    # Only used by the async dependencies, httpx is slow to import
+    async_permissions = LazyModule("fluidly.auth.async_permissions")
+    # Token verification is optional, its dependencies are imported on first use
+    jwks = LazyModule("fluidly.auth.jwks")
 
-def get_authorised_user(request: Request) -> Dict[str, Any]:
-    """Retrieves the authentication information from Google Cloud Endpoints
-    and passes it to user permissions service"""
+PERMISSIONS_EXCEPTIONS = (
+    ValueError,
+    UserPermissionsPayloadException,
+    UserPermissionsRequestException,
+)
+
+
+def get_claims(request: Request, event: str) -> Dict[str, Any]:
+    """Parses the claims from the user info header set by Google Cloud Endpoints,
+    repeated headers are served from the claims cache. When token verification is
+    enabled the claims come from the verified bearer token instead."""
     logger = get_logger()
-    encoded_user_info = request.headers.get("X-Endpoint-API-UserInfo", None)
+    if jwks.get_token_verifier() is not None:
+        try:
+            verified_claims: Dict[str, Any] = jwks.verify_authorization(
+                request.headers.get("Authorization")
+            )
+            return verified_claims
+        except jwks.InvalidTokenException:
+            logger.error(event, exc_info=True)
+            raise HTTPException(status_code=401, detail="User is not authenticated")
+
+    encoded_user_info = request.headers.get(USER_INFO_HEADER, None)
     if not encoded_user_info:
-        logger.error("get_authorised_user", exc_info=True)
+        logger.error(event, exc_info=True)
         raise HTTPException(status_code=401, detail="User is not authenticated")
 
-    decoded_user_info = base64_decode(encoded_user_info)
-    user_info = json.loads(decoded_user_info)
-    claims = (
-        json.loads(user_info.get("claims", "{}"))
-        if "claims" in user_info
-        else user_info
-    )
+    claims: Dict[str, Any] = parse_claims(encoded_user_info)
+    return claims
 
-    email = claims.get("https://api.fluidly.com/email", None)
-    name = claims.get("https://api.fluidly.com/name", None)
-    auth0_claims = claims.get("https://api.fluidly.com/app_metadata", {})
+
+async def get_claims_async(request: Request, event: str) -> Dict[str, Any]:
+    """Same as `get_claims` but verifies bearer tokens off the event loop, as
+    verifying may wait for the signing keys of the issuer to be fetched"""
+    if jwks.get_token_verifier() is None:
+        return get_claims(request, event)
+
+    try:
+        verified_claims: Dict[str, Any] = await jwks.verify_authorization_async(
+            request.headers.get("Authorization")
+        )
+        return verified_claims
+    except jwks.InvalidTokenException:
+        get_logger().error(event, exc_info=True)
+        raise HTTPException(status_code=401, detail="User is not authenticated")
+
+
+def is_service_account(claims: Dict[str, Any]) -> bool:
     internal_claims = claims.get("https://api.fluidly.com/internal_metadata", {})
+    return bool(internal_claims.get("isServiceAccount", False))
+
+
+def get_user(claims: Dict[str, Any]) -> Dict[str, Any]:
+    auth0_claims = claims.get("https://api.fluidly.com/app_metadata", {})
+
+    return {
+        "user_id": auth0_claims.get("userId", None),
+        "email": claims.get("https://api.fluidly.com/email", None),
+        "name": claims.get("https://api.fluidly.com/name", None),
+    }
+
+
+def raise_forbidden(event: str, detail: str) -> NoReturn:
+    get_logger().error(event, exc_info=True)
+    raise HTTPException(status_code=403, detail=detail)
 
+
+def get_authorised_user(request: Request) -> Dict[str, Any]:
+    """Retrieves the authentication information from Google Cloud Endpoints
+    and passes it to user permissions service"""
+    claims = get_claims(request, "get_authorised_user")
     connection_id = request.path_params["connection_id"]
-    user_id = auth0_claims.get("userId", None)
 
     try:
-        is_service_account = internal_claims.get("isServiceAccount", False)
+        if not is_service_account(claims) and not check_user_permissions(
+            claims, connection_id
+        ):
+            raise_forbidden("get_authorised_user", "User cannot access this resource")
+    except PERMISSIONS_EXCEPTIONS:
+        raise_forbidden(
+            "get_authorised_user", "An issue occurred while fetching permissions"
+        )
 
-        if not is_service_account and not check_user_permissions(claims, connection_id):
-            logger.error("get_authorised_user", exc_info=True)
-            raise HTTPException(
-                status_code=403, detail="User cannot access this resource"
-            )
-    except (
-        ValueError,
-        UserPermissionsPayloadException,
-        UserPermissionsRequestException,
-    ):
-        logger.error("get_authorised_user", exc_info=True)
+    return {"connection_id": connection_id, **get_user(claims)}
+
+
+async def get_authorised_user_async(request: Request) -> Dict[str, Any]:
+    """Same as `get_authorised_user` but checks permissions on the event loop
+    instead of FastAPI's threadpool"""
+    claims = await get_claims_async(request, "get_authorised_user")
+    connection_id = request.path_params["connection_id"]
+
+    try:
+        if not is_service_account(
+            claims
+        ) and not await async_permissions.check_user_permissions_async(
+            claims, connection_id
+        ):
+            raise_forbidden("get_authorised_user", "User cannot access this resource")
+    except PERMISSIONS_EXCEPTIONS:
+        raise_forbidden(
+            "get_authorised_user", "An issue occurred while fetching permissions"
+        )
+
+    return {"connection_id": connection_id, **get_user(claims)}
+
+
+def get_connection_ids(request: Request) -> List[str]:
+    connection_ids = request.query_params.getlist("connection_id")
+    if not connection_ids:
+        raise HTTPException(status_code=400, detail="Please provide connection_id")
+    max_connections = get_max_connections()
+    if len(set(connection_ids)) > max_connections:
         raise HTTPException(
-            status_code=403, detail="An issue occurred while fetching permissions"
+            status_code=400,
+            detail=f"Please provide at most {max_connections} connection_id",
         )
+    return connection_ids
 
-    return {
-        "connection_id": connection_id,
-        "user_id": user_id,
-        "email": email,
-        "name": name,
-    }
+
+def get_authorised_connections_user(request: Request) -> Dict[str, Any]:
+    """Authorises the user against every `connection_id` query parameter, the
+    request is rejected if any of the connections cannot be accessed or if there
+    are more than `get_max_connections`"""
+    claims = get_claims(request, "get_authorised_connections_user")
+    connection_ids = get_connection_ids(request)
+
+    try:
+        if not is_service_account(claims) and not all(
+            check_user_permissions_many(claims, connection_ids).values()
+        ):
+            raise_forbidden(
+                "get_authorised_connections_user", "User cannot access this resource"
+            )
+    except PERMISSIONS_EXCEPTIONS:
+        raise_forbidden(
+            "get_authorised_connections_user",
+            "An issue occurred while fetching permissions",
+        )
+
+    return {"connection_ids": connection_ids, **get_user(claims)}
+
+
+async def get_authorised_connections_user_async(request: Request) -> Dict[str, Any]:
+    """Same as `get_authorised_connections_user` but checks permissions on the
+    event loop instead of FastAPI's threadpool"""
+    claims = await get_claims_async(request, "get_authorised_connections_user")
+    connection_ids = get_connection_ids(request)
+
+    try:
+        if not is_service_account(claims) and not all(
+            (
+                await async_permissions.check_user_permissions_many_async(
+                    claims, connection_ids
+                )
+            ).values()
+        ):
+            raise_forbidden(
+                "get_authorised_connections_user", "User cannot access this resource"
+            )
+    except PERMISSIONS_EXCEPTIONS:
+        raise_forbidden(
+            "get_authorised_connections_user",
+            "An issue occurred while fetching permissions",
+        )
+
+    return {"connection_ids": connection_ids, **get_user(claims)}
 
 
 def get_admin_user(request: Request) -> Dict[str, Any]:
     """Retrieves the authentication information from Google Cloud Endpoints and passes it to user permissions service"""
-    logger = get_logger()
-    encoded_info = request.headers.get("X-Endpoint-API-UserInfo", None)
-    if not encoded_info:
-        logger.error("get_admin_user", exc_info=True)
-        raise HTTPException(status_code=401, detail="User is not authenticated")
+    claims = get_claims(request, "get_admin_user")
 
-    info_json = base64_decode(encoded_info)
-    # First parsing of the decoded header string
-    user_info = json.loads(info_json)
-    # Claims are given as a string by Cloud Endpoints so we have
-    # to parse the claims attribute
-    claims = (
-        json.loads(user_info.get("claims", "{}"))
-        if "claims" in user_info
-        else user_info
-    )
-
-    email = claims.get("https://api.fluidly.com/email", None)
-    name = claims.get("https://api.fluidly.com/name", None)
-    auth0_claims = claims.get("https://api.fluidly.com/app_metadata", {})
-    internal_claims = claims.get("https://api.fluidly.com/internal_metadata", {})
+    try:
+        if not is_service_account(claims) and not check_admin_permissions(claims):
+            raise_forbidden("get_admin_user", "User cannot access this resource")
+    except PERMISSIONS_EXCEPTIONS:
+        raise_forbidden(
+            "get_admin_user", "An issue occurred while fetching permissions"
+        )
 
-    user_id_from_token = auth0_claims.get("userId", None)
+    return get_user(claims)
 
-    try:
-        is_service_account = internal_claims.get("isServiceAccount", False)
 
-        if not is_service_account and not check_admin_permissions(claims):
-            logger.error("get_admin_user", exc_info=True)
-            raise HTTPException(
-                status_code=403, detail="User cannot access this resource"
-            )
-    except (
-        ValueError,
-        UserPermissionsPayloadException,
-        UserPermissionsRequestException,
-    ):
-        logger.error("get_admin_user", exc_info=True)
-        raise HTTPException(
-            status_code=403, detail="An issue occurred while fetching permissions"
+async def get_admin_user_async(request: Request) -> Dict[str, Any]:
+    """Same as `get_admin_user` but checks permissions on the event loop instead of
+    FastAPI's threadpool"""
+    claims = await get_claims_async(request, "get_admin_user")
+
+    try:
+        if not is_service_account(
+            claims
+        ) and not await async_permissions.check_admin_permissions_async(claims):
+            raise_forbidden("get_admin_user", "User cannot access this resource")
+    except PERMISSIONS_EXCEPTIONS:
+        raise_forbidden(
+            "get_admin_user", "An issue occurred while fetching permissions"
         )
 
-    return {"user_id": user_id_from_token, "email": email, "name": name}
+    return get_user(claims)
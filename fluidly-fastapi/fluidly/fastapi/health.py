@@ -0,0 +1,159 @@
+import asyncio
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+
+from fastapi import APIRouter
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response
+
+from fluidly.fastapi.constants.status import StatusEnum
+from fluidly.fastapi.responses.health import HealthResponse
+from fluidly.fastapi.responses.readiness import ReadinessResponse
+from fluidly.structlog.base_logger import get_logger
+
+# A check passes unless it raises, times out or returns False
+CheckFunction = Callable[[], Any]
+
+
+class HealthChecks:
+    """Dependency checks behind the health and readiness probes.
+
+    Checks run concurrently, each bounded by its own timeout so a slow dependency
+    fails its check instead of stalling the probe. Coroutine functions run on the
+    event loop, other functions in the threadpool. Threads can't be stopped, so
+    a function which times out fails its check until it returns rather than
+    being called again. Results are cached for `cache_ttl` seconds and probes
+    arriving while the checks run share that run, so probe storms do not add
+    load on the dependencies.
+    """
+
+    def __init__(self, timeout: float = 2.0, cache_ttl: float = 5.0) -> None:
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+        self.runs = 0
+        self._checks: Dict[str, Tuple[CheckFunction, float, bool]] = {}
+        self._results: Dict[str, bool] = {}
+        self._checked_at: Optional[float] = None
+        self._running: Optional["asyncio.Future[Dict[str, bool]]"] = None
+        self._lock = threading.Lock()
+        self._calls: Set[str] = set()
+
+    def add_check(
+        self,
+        name: str,
+        check: CheckFunction,
+        timeout: Optional[float] = None,
+        liveness: bool = False,
+    ) -> None:
+        """Registers a readiness check, `liveness` checks are also part of the
+        health probe"""
+        self._checks[name] = (
+            check,
+            self.timeout if timeout is None else timeout,
+            liveness,
+        )
+        self.clear()
+
+    def _call(self, name: str, check: CheckFunction) -> Any:
+        try:
+            return check()
+        finally:
+            with self._lock:
+                self._calls.discard(name)
+
+    async def run_check(self, name: str, check: CheckFunction, timeout: float) -> bool:
+        try:
+            if asyncio.iscoroutinefunction(check):
+                result = await asyncio.wait_for(check(), timeout)
+            else:
+                with self._lock:
+                    if name in self._calls:
+                        get_logger().warning("Health check still running", check=name)
+                        return False
+                    self._calls.add(name)
+                # The thread keeps running past the timeout, only the probe moves on
+                result = await asyncio.wait_for(
+                    run_in_threadpool(self._call, name, check), timeout
+                )
+        except asyncio.TimeoutError:
+            get_logger().warning("Health check timed out", check=name, timeout=timeout)
+            return False
+        except Exception:
+            get_logger().warning("Health check failed", check=name, exc_info=True)
+            return False
+        return result is not False
+
+    async def run(self) -> Dict[str, bool]:
+        names = list(self._checks)
+        passed = await asyncio.gather(
+            *[
+                self.run_check(name, check, timeout)
+                for name, (check, timeout, _) in self._checks.items()
+            ]
+        )
+        self._results = dict(zip(names, passed))
+        self._checked_at = time.monotonic()
+        self.runs += 1
+        return self._results
+
+    async def results(self) -> Dict[str, bool]:
+        """Returns whether each check passed, from the cache when fresh"""
+        if self._checked_at is not None and (
+            time.monotonic() - self._checked_at < self.cache_ttl
+        ):
+            return dict(self._results)
+
+        if self._running is None or self._running.done():
+            self._running = asyncio.ensure_future(self.run())
+        # Shielded so a probe which gives up does not cancel the shared run
+        return dict(await asyncio.shield(self._running))
+
+    async def is_alive(self) -> bool:
+        results = await self.results()
+        return all(
+            results.get(name, False)
+            for name, (_, _, liveness) in self._checks.items()
+            if liveness
+        )
+
+    async def is_ready(self) -> bool:
+        return all((await self.results()).values())
+
+    def clear(self) -> None:
+        self._results = {}
+        self._checked_at = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            running = sorted(self._calls)
+        return {"runs": self.runs, "results": dict(self._results), "running": running}
+
+
+health_checks = HealthChecks()
+
+health_router = APIRouter()
+
+
+def get_status(passed: bool, response: Response) -> StatusEnum:
+    if not passed:
+        response.status_code = 503
+        return StatusEnum.KO
+    return StatusEnum.OK
+
+
+@health_router.get("/health", response_model=HealthResponse)
+async def get_health(response: Response) -> HealthResponse:
+    """Liveness probe, runs the checks of `health_checks` added with
+    `liveness=True`. Add it to an app with `app.include_router(health_router)`"""
+    return HealthResponse(
+        fastapi_status=get_status(await health_checks.is_alive(), response)
+    )
+
+
+@health_router.get("/readiness", response_model=ReadinessResponse)
+async def get_readiness(response: Response) -> ReadinessResponse:
+    """Readiness probe, answers 503 when any check of `health_checks` fails"""
+    return ReadinessResponse(
+        fastapi_status=get_status(await health_checks.is_ready(), response)
+    )
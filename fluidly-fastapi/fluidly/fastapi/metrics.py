@@ -0,0 +1,165 @@
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from fastapi import APIRouter
+from starlette.responses import Response
+
+from fluidly.auth.metrics import LatencyHistogram, permissions_metrics
+
+# Bucket bounds in seconds of the Prometheus client libraries
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Requests which matched no route share a label to bound the number of series
+UNMATCHED_ROUTE = "unmatched"
+
+# Starlette adds the charset to text media types
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return (
+        "{"
+        + ",".join(f'{name}="{escape_label_value(value)}"' for name, value in labels)
+        + "}"
+    )
+
+
+def format_bound(bound: float) -> str:
+    return "+Inf" if bound == float("inf") else repr(float(bound))
+
+
+def render_histogram(
+    name: str, help_text: str, histograms: Iterable[Tuple[Labels, LatencyHistogram]]
+) -> List[str]:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for labels, histogram in histograms:
+        for bound, count in histogram.buckets():
+            bucket_labels = format_labels(labels + (("le", format_bound(bound)),))
+            lines.append(f"{name}_bucket{bucket_labels} {count}")
+        lines.append(f"{name}_sum{format_labels(labels)} {histogram.sum!r}")
+        lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+    return lines
+
+
+def render_samples(
+    name: str, metric_type: str, help_text: str, samples: Iterable[Tuple[Labels, int]]
+) -> List[str]:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+    for labels, value in samples:
+        lines.append(f"{name}{format_labels(labels)} {value}")
+    return lines
+
+
+class MetricsRegistry:
+    """Request metrics of a service in the Prometheus text exposition format.
+
+    Holds latency histograms and response counters per method and route path,
+    and in-flight gauges per method, populated by `LoggingMiddleware`. Updates
+    are made from the event loop thread only so they take no locks, reads may
+    see a request in the counters but not yet in the histogram.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self._buckets = buckets
+        self.reset()
+
+    def request_started(self, method: str) -> None:
+        self._in_flight[method] = self._in_flight.get(method, 0) + 1
+
+    def request_finished(
+        self, method: str, route: Optional[str], status_code: int, duration: float
+    ) -> None:
+        # Requests in flight when the registry was reset are not counted
+        self._in_flight[method] = max(self._in_flight.get(method, 0) - 1, 0)
+
+        key = (method, route or UNMATCHED_ROUTE)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = LatencyHistogram(self._buckets)
+        histogram.record(duration)
+
+        response_key = (*key, str(status_code))
+        self._responses[response_key] = self._responses.get(response_key, 0) + 1
+
+    def render(self) -> str:
+        lines = render_histogram(
+            "http_request_duration_seconds",
+            "Duration of HTTP requests in seconds.",
+            [
+                ((("method", method), ("route", route)), histogram)
+                for (method, route), histogram in list(self._histograms.items())
+            ],
+        )
+        lines += render_samples(
+            "http_responses_total",
+            "counter",
+            "HTTP responses by status code.",
+            [
+                ((("method", method), ("route", route), ("status", status)), count)
+                for (method, route, status), count in list(self._responses.items())
+            ],
+        )
+        lines += render_samples(
+            "http_requests_in_flight",
+            "gauge",
+            "HTTP requests being handled.",
+            [
+                ((("method", method),), count)
+                for method, count in self._in_flight.items()
+            ],
+        )
+        lines += render_permissions_metrics()
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        self._histograms: Dict[Tuple[str, str], LatencyHistogram] = {}
+        self._responses: Dict[Tuple[str, str, str], int] = {}
+        self._in_flight: Dict[str, int] = {}
+
+
+def render_permissions_metrics() -> List[str]:
+    """Renders the permission checks against the user permissions service made by
+    fluidly.auth"""
+    snapshot = permissions_metrics.snapshot()
+    histograms = []
+    for endpoint in snapshot:
+        histogram = permissions_metrics.histogram(endpoint)
+        if histogram is not None:
+            histograms.append(((("endpoint", endpoint),), histogram))
+
+    lines = render_histogram(
+        "fluidly_permissions_check_duration_seconds",
+        "Duration of requests to the user permissions service in seconds.",
+        histograms,
+    )
+    lines += render_samples(
+        "fluidly_permissions_checks_total",
+        "counter",
+        "Permission checks against the user permissions service by outcome.",
+        [
+            ((("endpoint", endpoint), ("outcome", outcome)), count)
+            for endpoint, endpoint_snapshot in snapshot.items()
+            for outcome, count in endpoint_snapshot["outcomes"].items()
+        ],
+    )
+    return lines
+
+
+metrics_registry = MetricsRegistry()
+
+metrics_router = APIRouter()
+
+
+@metrics_router.get("/metrics", include_in_schema=False)
+async def get_metrics() -> Response:
+    """Serves `metrics_registry`, add it to an app with
+    `app.include_router(metrics_router)`. Rendered on the event loop so it does not
+    race with the middleware updates."""
+    return Response(metrics_registry.render(), media_type=CONTENT_TYPE)
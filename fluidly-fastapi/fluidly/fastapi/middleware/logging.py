@@ -1,67 +1,159 @@
 import time
-from typing import Any
+from typing import Any, Dict, Optional
 
 from fastapi.requests import Request
-from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
-from starlette.responses import JSONResponse, Response
+from starlette.datastructures import MutableHeaders
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
+from fluidly.fastapi.metrics import MetricsRegistry
+from fluidly.fastapi.middleware.sampling import SamplingPolicy
 from fluidly.structlog.base_logger import get_logger
+from fluidly.structlog.headers import get_header_filter
+from fluidly.structlog.server_timing import (
+    Timings,
+    collect_timings,
+    format_server_timing,
+)
 
 
-class LoggingMiddleware(BaseHTTPMiddleware):
+class LoggingMiddleware:
+    """Logs a `rest_request_processed` event for every HTTP request.
+
+    A pure ASGI middleware, it wraps `send` rather than `call_next` so responses
+    are streamed through untouched and background tasks run as usual.
+
+    Errors are always logged, successful requests can be sampled with a
+    `SamplingPolicy`, e.g.
+    `app.add_middleware(LoggingMiddleware, sampling=SamplingPolicy(rate=0.1))`.
+    When server timing is enabled the timings recorded while handling a request
+    are sent in a `Server-Timing` header and logged. Requests are counted in
+    `metrics`, e.g. `fluidly.fastapi.metrics.metrics_registry`, when given.
+    """
+
     JSON_PROBLEM_CONTENT_TYPE = "application/problem+json"
 
+    def __init__(
+        self,
+        app: ASGIApp,
+        sampling: Optional[SamplingPolicy] = None,
+        metrics: Optional[MetricsRegistry] = None,
+    ) -> None:
+        self.app = app
+        self.sampling = sampling
+        self.metrics = metrics
+        self._route_paths: Dict[Any, Optional[str]] = {}
+
+    def _get_route_path(self, scope: Scope) -> Optional[str]:
+        """Returns the path template of the route which handled the request"""
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return None
+
+        try:
+            return self._route_paths[endpoint]
+        except KeyError:
+            pass
+
+        route_path = None
+        for route in getattr(scope.get("app"), "routes", []):
+            if getattr(route, "endpoint", None) is endpoint:
+                route_path = route.path
+                break
+        self._route_paths[endpoint] = route_path
+        return route_path
+
     @staticmethod
-    def _override_content_type(response: Response) -> None:
-        response.headers["content-type"] = LoggingMiddleware.JSON_PROBLEM_CONTENT_TYPE
+    def _override_content_type(message: Message) -> Message:
+        headers = MutableHeaders(raw=list(message.get("headers", [])))
+        headers["content-type"] = LoggingMiddleware.JSON_PROBLEM_CONTENT_TYPE
+        return {**message, "headers": headers.raw}
 
     @staticmethod
-    def _bind_request_context(logger: Any, request: Request) -> None:
-        # todo: think of a way to get at least few of these before invoking `call_next`
-        # https://github.com/tiangolo/fastapi/issues/1879#issuecomment-672684259
+    def _add_server_timing(
+        message: Message, timings: Timings, duration: float
+    ) -> Message:
+        headers = MutableHeaders(raw=list(message.get("headers", [])))
+        headers.append(
+            "server-timing", format_server_timing({**timings, "total": duration})
+        )
+        return {**message, "headers": headers.raw}
+
+    @staticmethod
+    def _bind_request_context(
+        logger: Any, request: Request, timings: Optional[Timings] = None
+    ) -> None:
+        # The router sets the endpoint and path params on the scope, so they are
+        # only known once the app has handled the request
 
         endpoint = request.scope.get("endpoint")
         endpoint_name = getattr(endpoint, "__qualname__", None)
 
-        logger.bind(
+        context = dict(
             url=str(request.url),
             args=request.path_params,
             connection_id=request.path_params.get("connection_id"),
             partner_id=request.path_params.get("partner_id"),
-            headers=dict(request.headers),
+            headers=get_header_filter().filter(request.headers.items()),
             callback=endpoint_name,
         )
+        if timings is not None:
+            context["timings"] = dict(timings)
+        logger.bind(**context)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        if self.metrics is None:
+            with collect_timings() as timings:
+                await self._process(scope, receive, send, timings)
+            return
+
+        method = scope["method"]
+        start = time.perf_counter()
+        status_code: Optional[int] = None
+        self.metrics.request_started(method)
+        try:
+            with collect_timings() as timings:
+                status_code = await self._process(scope, receive, send, timings)
+        finally:
+            self.metrics.request_finished(
+                method,
+                self._get_route_path(scope),
+                status_code or 500,
+                time.perf_counter() - start,
+            )
 
-    async def dispatch(
-        self, request: Request, call_next: RequestResponseEndpoint
-    ) -> Response:
+    async def _process(
+        self, scope: Scope, receive: Receive, send: Send, timings: Optional[Timings]
+    ) -> Optional[int]:
+        """Handles and logs the request, returns the status code it was answered
+        with"""
         logger = get_logger()
         start = time.time()
+        status_code: Optional[int] = None
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if message["status"] >= 400:
+                    # Error handlers in FastAPI turn raised exceptions into responses
+                    # before they reach middlewares, so errors are told by status
+                    message = self._override_content_type(message)
+                if timings is not None:
+                    message = self._add_server_timing(
+                        message, timings, time.time() - start
+                    )
+            await send(message)
 
         try:
-            response = await call_next(request)
-            self._bind_request_context(logger, request)
-
-            if response.status_code >= 400:
-                # Error handlers in FastAPI turn raised exceptions into Response objects.
-                # They are invoked before middlewares, thus we cannot catch `HTTPException` in here
-                # Maybe we should try creating custom APIRouter instead of using middleware:
-                # https://github.com/tiangolo/fastapi/issues/954#issuecomment-617683548
-
-                self._override_content_type(response)
-
-                end = time.time()
-                logger.error(
-                    "rest_request_processed",
-                    duration=end - start,
-                    success=False,
-                    status_code=response.status_code,
-                )
-
-                return response
-
+            await self.app(scope, receive, send_wrapper)
         except Exception:
-            self._bind_request_context(logger, request)
+            self._bind_request_context(logger, Request(scope), timings)
             end = time.time()
             logger.error(
                 "rest_request_processed",
@@ -69,18 +161,46 @@ class LoggingMiddleware(BaseHTTPMiddleware):
                 success=False,
                 exc_info=True,
                 status_code=500,
+                sample_rate=1.0,
             )
-            return JSONResponse(
+            if status_code is not None:
+                # Too late to answer with a 500, the server closes the connection
+                raise
+
+            response = JSONResponse(
                 status_code=500,
                 content={"detail": "An unknown error occurred"},
                 media_type=LoggingMiddleware.JSON_PROBLEM_CONTENT_TYPE,
             )
+            await response(scope, receive, send)
+            return 500
 
         end = time.time()
+        if status_code is None or status_code >= 400:
+            self._bind_request_context(logger, Request(scope), timings)
+            logger.error(
+                "rest_request_processed",
+                duration=end - start,
+                success=False,
+                status_code=status_code,
+                sample_rate=1.0,
+            )
+            return status_code
+
+        sample_rate = 1.0
+        if self.sampling is not None:
+            sample_rate = self.sampling.get_sample_rate(
+                self._get_route_path(scope), end - start
+            )
+            if not self.sampling.sample(sample_rate):
+                return status_code
+
+        self._bind_request_context(logger, Request(scope), timings)
         logger.info(
             "rest_request_processed",
             duration=end - start,
             success=True,
-            status_code=response.status_code,
+            status_code=status_code,
+            sample_rate=sample_rate,
         )
-        return response
+        return status_code
@@ -0,0 +1,52 @@
+import random
+from typing import Dict, Mapping, Optional
+
+
+def _check_rate(rate: float) -> float:
+    if not 0 <= rate <= 1:
+        raise ValueError(f"Sample rate must be between 0 and 1, got {rate}")
+    return rate
+
+
+class SamplingPolicy:
+    """Decides which successful requests `LoggingMiddleware` logs.
+
+    Fast successful requests are logged with probability `rate`, or the rate of
+    their route in `route_rates` keyed by route path, e.g. `{"/health": 0}`.
+    Requests taking `latency_threshold` seconds or longer are always logged, as
+    are errors. Each event carries the `sample_rate` it was logged with, so counts
+    can be re-weighted by `1 / sample_rate`.
+    """
+
+    def __init__(
+        self,
+        rate: float = 1.0,
+        route_rates: Optional[Mapping[str, float]] = None,
+        latency_threshold: Optional[float] = None,
+    ) -> None:
+        self.rate = _check_rate(rate)
+        self.route_rates = {
+            route: _check_rate(route_rate)
+            for route, route_rate in (route_rates or {}).items()
+        }
+        self.latency_threshold = latency_threshold
+        self.logged = 0
+        self.dropped = 0
+
+    def get_sample_rate(self, route: Optional[str], duration: float) -> float:
+        if self.latency_threshold is not None and duration >= self.latency_threshold:
+            return 1.0
+        if route is None:
+            return self.rate
+        return self.route_rates.get(route, self.rate)
+
+    def sample(self, sample_rate: float) -> bool:
+        sampled = sample_rate >= 1 or random.random() < sample_rate
+        if sampled:
+            self.logged += 1
+        else:
+            self.dropped += 1
+        return sampled
+
+    def stats(self) -> Dict[str, int]:
+        return {"logged": self.logged, "dropped": self.dropped}
@@ -11,7 +11,7 @@ URL = "https://github.com/fluidly/python-shared"
 EMAIL = "tech@fluidly.com"
 AUTHOR = "Fluidly"
 REQUIRES_PYTHON = ">=3.6.0"
-VERSION = "0.1.6"
+VERSION = "0.1.21"
 
 
 def local_dependencies(*packages):
@@ -21,7 +21,7 @@ def local_dependencies(*packages):
     return list(packages)
 
 
-REQUIRED = ["fastapi==0.68.2", "fastapi_camelcase"] + local_dependencies(
+REQUIRED = ["fastapi==0.68.2", "fastapi_camelcase", "httpx"] + local_dependencies(
     "fluidly-structlog", "fluidly-auth"
 )
 
@@ -1,13 +1,24 @@
 import base64
 import json
+import subprocess
+import sys
 from unittest import mock
 
 import pytest
 from fastapi import Depends, FastAPI
 from fastapi.testclient import TestClient
 
+from fluidly.auth import async_permissions, jwks, permissions
+from fluidly.auth.jwks import InvalidTokenException
 from fluidly.fastapi.dependencies import auth
-from fluidly.fastapi.dependencies.auth import get_admin_user, get_authorised_user
+from fluidly.fastapi.dependencies.auth import (
+    get_admin_user,
+    get_admin_user_async,
+    get_authorised_connections_user,
+    get_authorised_connections_user_async,
+    get_authorised_user,
+    get_authorised_user_async,
+)
 
 
 @pytest.fixture
@@ -52,6 +63,85 @@ def mocked_admin_given_permissions(monkeypatch):
     yield check_admin_permissions_mock
 
 
+def mock_async_permissions(monkeypatch, name, return_value):
+    calls = []
+
+    async def check_permissions_async(*args):
+        calls.append(args)
+        return return_value
+
+    monkeypatch.setattr(async_permissions, name, check_permissions_async)
+    return calls
+
+
+@pytest.fixture
+def mocked_async_given_permissions(monkeypatch):
+    yield mock_async_permissions(monkeypatch, "check_user_permissions_async", True)
+
+
+@pytest.fixture
+def mocked_async_not_given_permissions(monkeypatch):
+    yield mock_async_permissions(monkeypatch, "check_user_permissions_async", False)
+
+
+@pytest.fixture
+def mocked_async_admin_given_permissions(monkeypatch):
+    yield mock_async_permissions(monkeypatch, "check_admin_permissions_async", True)
+
+
+@pytest.fixture
+def mocked_async_admin_not_given_permissions(monkeypatch):
+    yield mock_async_permissions(monkeypatch, "check_admin_permissions_async", False)
+
+
+def decide_per_connection(claims, connection_ids):
+    return {
+        connection_id: connection_id != "denied" for connection_id in connection_ids
+    }
+
+
+@pytest.fixture
+def mocked_many_permissions(monkeypatch):
+    check_user_permissions_many_mock = mock.MagicMock(side_effect=decide_per_connection)
+    monkeypatch.setattr(
+        auth, "check_user_permissions_many", check_user_permissions_many_mock
+    )
+    yield check_user_permissions_many_mock
+
+
+@pytest.fixture
+def mocked_async_many_permissions(monkeypatch):
+    calls = []
+
+    async def check_user_permissions_many_async(claims, connection_ids):
+        calls.append(connection_ids)
+        return decide_per_connection(claims, connection_ids)
+
+    monkeypatch.setattr(
+        async_permissions,
+        "check_user_permissions_many_async",
+        check_user_permissions_many_async,
+    )
+    yield calls
+
+
+def verify_authorization(authorization):
+    if authorization != "Bearer valid-token":
+        raise InvalidTokenException("Invalid signature")
+    return {"https://api.fluidly.com/app_metadata": {"userId": 2}}
+
+
+async def verify_authorization_async(authorization):
+    return verify_authorization(authorization)
+
+
+@pytest.fixture
+def mocked_token_verification(monkeypatch):
+    monkeypatch.setattr(jwks, "get_token_verifier", mock.MagicMock())
+    monkeypatch.setattr(jwks, "verify_authorization", verify_authorization)
+    monkeypatch.setattr(jwks, "verify_authorization_async", verify_authorization_async)
+
+
 class TestAuthBase:
     @staticmethod
     def _encode_claims(claims):
@@ -93,6 +183,28 @@ class TestAuthBase:
         def admin_endpoint(admin_user=Depends(get_admin_user)):
             return admin_user
 
+        @fastapi_app.get("/shared/async/authorised/{connection_id}")
+        async def async_authorised_endpoint(
+            connection_id: str, authorised_user=Depends(get_authorised_user_async)
+        ):
+            return authorised_user
+
+        @fastapi_app.get("/shared/connections")
+        def connections_endpoint(
+            authorised_user=Depends(get_authorised_connections_user),
+        ):
+            return authorised_user
+
+        @fastapi_app.get("/shared/async/connections")
+        async def async_connections_endpoint(
+            authorised_user=Depends(get_authorised_connections_user_async),
+        ):
+            return authorised_user
+
+        @fastapi_app.get("/shared/async/admin")
+        async def async_admin_endpoint(admin_user=Depends(get_admin_user_async)):
+            return admin_user
+
         self.client = TestClient(fastapi_app)
 
 
@@ -288,3 +400,239 @@ class TestAdminESPv2(TestAdminESPv1):
                 "https://api.fluidly.com/internal_metadata": {**internal_metadata},
             }
         )
+
+
+class TestAuthorisedAsync(TestAuthBase):
+    def test_user_unauthenticated(self):
+        response = self.client.get("/shared/async/authorised/some:connection_id")
+        assert response.status_code == 401
+        assert response.json() == {"detail": "User is not authenticated"}
+
+    def test_permissions_unavailable(self):
+        response = self.client.get(
+            "/shared/async/authorised/some:connection_id",
+            headers={"X-Endpoint-API-UserInfo": self._get_dummy_user_info()},
+        )
+        assert response.status_code == 403
+        assert response.json() == {
+            "detail": "An issue occurred while fetching permissions"
+        }
+
+    def test_permissions_available_not_granted(
+        self, mocked_async_not_given_permissions
+    ):
+        response = self.client.get(
+            "/shared/async/authorised/some:connection_id",
+            headers={"X-Endpoint-API-UserInfo": self._get_dummy_user_info()},
+        )
+        assert response.status_code == 403
+        assert response.json() == {"detail": "User cannot access this resource"}
+
+    def test_permissions_available_granted(self, mocked_async_given_permissions):
+        response = self.client.get(
+            "/shared/async/authorised/some:connection_id",
+            headers={
+                "X-Endpoint-API-UserInfo": self._get_dummy_user_info(
+                    email="bob@burgers.com", name="Bob", app_metadata={"userId": 2}
+                )
+            },
+        )
+        assert response.status_code == 200
+        assert response.json() == {
+            "connection_id": "some:connection_id",
+            "user_id": 2,
+            "email": "bob@burgers.com",
+            "name": "Bob",
+        }
+        assert mocked_async_given_permissions[0][1] == "some:connection_id"
+
+    def test_service_account_granted(self, mocked_async_not_given_permissions):
+        response = self.client.get(
+            "/shared/async/authorised/some:connection_id",
+            headers={
+                "X-Endpoint-API-UserInfo": self._get_dummy_user_info(
+                    internal_metadata={"isServiceAccount": True}
+                )
+            },
+        )
+        assert response.status_code == 200
+        assert mocked_async_not_given_permissions == []
+
+
+class TestAdminAsync(TestAuthBase):
+    def test_admin_unauthenticated(self):
+        response = self.client.get("/shared/async/admin")
+        assert response.status_code == 401
+        assert response.json() == {"detail": "User is not authenticated"}
+
+    def test_admin_permissions_unavailable(self):
+        response = self.client.get(
+            "/shared/async/admin",
+            headers={"X-Endpoint-API-UserInfo": self._get_dummy_user_info()},
+        )
+        assert response.status_code == 403
+        assert response.json() == {
+            "detail": "An issue occurred while fetching permissions"
+        }
+
+    def test_admin_permissions_available_not_granted(
+        self, mocked_async_admin_not_given_permissions
+    ):
+        response = self.client.get(
+            "/shared/async/admin",
+            headers={"X-Endpoint-API-UserInfo": self._get_dummy_user_info()},
+        )
+        assert response.status_code == 403
+        assert response.json() == {"detail": "User cannot access this resource"}
+
+    def test_admin_permissions_available_granted(
+        self, mocked_async_admin_given_permissions
+    ):
+        response = self.client.get(
+            "/shared/async/admin",
+            headers={
+                "X-Endpoint-API-UserInfo": self._get_dummy_user_info(
+                    email="bob@burgers.com", name="Bob", app_metadata={"userId": 2}
+                )
+            },
+        )
+        assert response.status_code == 200
+        assert response.json() == {
+            "user_id": 2,
+            "email": "bob@burgers.com",
+            "name": "Bob",
+        }
+
+    def test_admin_service_account_granted(
+        self, mocked_async_admin_not_given_permissions
+    ):
+        response = self.client.get(
+            "/shared/async/admin",
+            headers={
+                "X-Endpoint-API-UserInfo": self._get_dummy_user_info(
+                    internal_metadata={"isServiceAccount": True}
+                )
+            },
+        )
+        assert response.status_code == 200
+
+
+class TestAuthorisedConnections(TestAuthBase):
+    PATH = "/shared/connections"
+
+    def test_user_unauthenticated(self):
+        response = self.client.get(f"{self.PATH}?connection_id=first")
+        assert response.status_code == 401
+
+    def test_connection_ids_required(self):
+        response = self.client.get(
+            self.PATH, headers={"X-Endpoint-API-UserInfo": self._get_dummy_user_info()}
+        )
+        assert response.status_code == 400
+        assert response.json() == {"detail": "Please provide connection_id"}
+
+    def test_too_many_connection_ids(
+        self, monkeypatch, mocked_many_permissions, mocked_async_many_permissions
+    ):
+        monkeypatch.setattr(permissions, "_max_connections", 2)
+
+        response = self.client.get(
+            f"{self.PATH}?connection_id=first&connection_id=second&connection_id=third",
+            headers={"X-Endpoint-API-UserInfo": self._get_dummy_user_info()},
+        )
+        assert response.status_code == 400
+        assert response.json() == {"detail": "Please provide at most 2 connection_id"}
+        assert not mocked_many_permissions.called
+        assert mocked_async_many_permissions == []
+
+    def test_permissions_unavailable(self):
+        response = self.client.get(
+            f"{self.PATH}?connection_id=first",
+            headers={"X-Endpoint-API-UserInfo": self._get_dummy_user_info()},
+        )
+        assert response.status_code == 403
+        assert response.json() == {
+            "detail": "An issue occurred while fetching permissions"
+        }
+
+    def test_all_connections_granted(
+        self, mocked_many_permissions, mocked_async_many_permissions
+    ):
+        response = self.client.get(
+            f"{self.PATH}?connection_id=first&connection_id=second",
+            headers={
+                "X-Endpoint-API-UserInfo": self._get_dummy_user_info(
+                    email="bob@burgers.com", name="Bob", app_metadata={"userId": 2}
+                )
+            },
+        )
+        assert response.status_code == 200
+        assert response.json() == {
+            "connection_ids": ["first", "second"],
+            "user_id": 2,
+            "email": "bob@burgers.com",
+            "name": "Bob",
+        }
+
+    def test_one_connection_not_granted(
+        self, mocked_many_permissions, mocked_async_many_permissions
+    ):
+        response = self.client.get(
+            f"{self.PATH}?connection_id=first&connection_id=denied",
+            headers={"X-Endpoint-API-UserInfo": self._get_dummy_user_info()},
+        )
+        assert response.status_code == 403
+        assert response.json() == {"detail": "User cannot access this resource"}
+
+    def test_service_account_granted(
+        self, mocked_many_permissions, mocked_async_many_permissions
+    ):
+        response = self.client.get(
+            f"{self.PATH}?connection_id=denied",
+            headers={
+                "X-Endpoint-API-UserInfo": self._get_dummy_user_info(
+                    internal_metadata={"isServiceAccount": True}
+                )
+            },
+        )
+        assert response.status_code == 200
+
+
+class TestAuthorisedConnectionsAsync(TestAuthorisedConnections):
+    PATH = "/shared/async/connections"
+
+
+class TestBearerTokenVerification(TestAuthBase):
+    def test_verified_token_granted(
+        self, mocked_token_verification, mocked_given_permissions
+    ):
+        response = self.client.get(
+            "/shared/authorised/some:connection_id",
+            headers={"Authorization": "Bearer valid-token"},
+        )
+        assert response.status_code == 200
+        assert response.json()["user_id"] == 2
+
+    def test_invalid_token_unauthenticated(self, mocked_token_verification):
+        response = self.client.get(
+            "/shared/async/authorised/some:connection_id",
+            headers={
+                "Authorization": "Bearer invalid-token",
+                "X-Endpoint-API-UserInfo": self._get_dummy_user_info(),
+            },
+        )
+        assert response.status_code == 401
+        assert response.json() == {"detail": "User is not authenticated"}
+
+    def test_importable_without_cryptography(self):
+        # cryptography is only installed with the `jwks` extra of fluidly-auth
+        subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import sys; sys.modules['cryptography'] = None; "
+                "from fluidly.fastapi.dependencies.auth import jwks; "
+                "jwks.get_token_verifier()",
+            ],
+            check=True,
+        )
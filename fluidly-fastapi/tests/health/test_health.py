@@ -0,0 +1,165 @@
+import asyncio
+import threading
+import time
+from unittest import mock
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from fluidly.fastapi import health
+from fluidly.fastapi.health import HealthChecks, health_router
+
+
+@pytest.fixture(autouse=True)
+def mock_structlog(monkeypatch):
+    get_logger_mock = mock.Mock()
+    monkeypatch.setattr(health, "get_logger", get_logger_mock)
+    return get_logger_mock.return_value
+
+
+@pytest.fixture()
+def checks(monkeypatch):
+    checks = HealthChecks(timeout=0.5)
+    monkeypatch.setattr(health, "health_checks", checks)
+    return checks
+
+
+@pytest.fixture()
+def client(checks):
+    app = FastAPI()
+    app.include_router(health_router)
+    return TestClient(app)
+
+
+class TestHealthChecks:
+    def test_runs_checks_concurrently(self, checks):
+        async def database():
+            await asyncio.sleep(0.1)
+
+        async def pubsub():
+            await asyncio.sleep(0.1)
+
+        checks.add_check("database", database)
+        checks.add_check("pubsub", pubsub)
+
+        start = time.monotonic()
+        results = asyncio.run(checks.results())
+
+        assert results == {"database": True, "pubsub": True}
+        assert time.monotonic() - start < 0.19
+
+    def test_failed_checks(self, checks, mock_structlog):
+        def raises():
+            raise ConnectionError()
+
+        checks.add_check("raises", raises)
+        checks.add_check("returns_false", lambda: False)
+        checks.add_check("passes", lambda: None)
+
+        assert asyncio.run(checks.results()) == {
+            "raises": False,
+            "returns_false": False,
+            "passes": True,
+        }
+        assert mock_structlog.warning.call_args[0] == ("Health check failed",)
+
+    def test_slow_check_times_out(self, checks, mock_structlog):
+        async def slow():
+            await asyncio.sleep(1)
+
+        checks.add_check("slow", slow, timeout=0.05)
+
+        start = time.monotonic()
+        assert asyncio.run(checks.results()) == {"slow": False}
+        assert time.monotonic() - start < 0.5
+        assert mock_structlog.warning.call_args[0] == ("Health check timed out",)
+
+    def test_timed_out_check_is_not_called_again_until_it_returns(
+        self, checks, mock_structlog
+    ):
+        release = threading.Event()
+        check = mock.Mock(side_effect=lambda: release.wait(5))
+        checks.add_check("database", check, timeout=0.05)
+        checks.cache_ttl = 0
+
+        async def probe():
+            # Probes of a server share its event loop and threadpool
+            assert await checks.results() == {"database": False}
+            assert await checks.results() == {"database": False}
+            assert mock_structlog.warning.call_args[0] == (
+                "Health check still running",
+            )
+            assert checks.stats()["running"] == ["database"]
+            assert check.call_count == 1
+
+            release.set()
+            while checks.stats()["running"]:
+                await asyncio.sleep(0.01)
+
+            assert await checks.results() == {"database": True}
+            assert check.call_count == 2
+
+        asyncio.run(asyncio.wait_for(probe(), 5))
+
+    def test_caches_results(self, checks):
+        check = mock.Mock(return_value=True)
+        checks.add_check("database", check)
+
+        async def probe_storm():
+            return await asyncio.gather(*[checks.results() for _ in range(10)])
+
+        asyncio.run(probe_storm())
+        asyncio.run(checks.results())
+
+        assert check.call_count == 1
+        assert checks.stats() == {
+            "runs": 1,
+            "results": {"database": True},
+            "running": [],
+        }
+
+    def test_runs_again_once_expired(self, checks):
+        check = mock.Mock(return_value=True)
+        checks.add_check("database", check)
+        checks.cache_ttl = 0
+
+        asyncio.run(checks.results())
+        asyncio.run(checks.results())
+
+        assert check.call_count == 2
+
+
+class TestHealthRouter:
+    def test_ready(self, client, checks):
+        checks.add_check("database", lambda: True)
+
+        response = client.get("/readiness")
+
+        assert response.status_code == 200
+        assert response.json() == {"fastapiStatus": "OK"}
+
+    def test_not_ready(self, client, checks):
+        checks.add_check("database", lambda: False)
+
+        response = client.get("/readiness")
+
+        assert response.status_code == 503
+        assert response.json() == {"fastapiStatus": "KO"}
+
+    def test_health_only_depends_on_liveness_checks(self, client, checks):
+        checks.add_check("database", lambda: False)
+        checks.add_check("event_loop", lambda: True, liveness=True)
+
+        response = client.get("/health")
+
+        assert response.status_code == 200
+        assert response.json() == {"fastapiStatus": "OK"}
+
+    def test_unhealthy(self, client, checks):
+        checks.add_check("event_loop", lambda: False, liveness=True)
+
+        response = client.get("/health")
+
+        assert response.status_code == 503
+        assert response.json() == {"fastapiStatus": "KO"}
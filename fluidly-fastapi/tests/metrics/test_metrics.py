@@ -0,0 +1,119 @@
+from unittest import mock
+
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from fluidly.auth.metrics import GRANTED, PermissionsMetrics
+from fluidly.fastapi import metrics
+from fluidly.fastapi.metrics import (
+    CONTENT_TYPE,
+    MetricsRegistry,
+    escape_label_value,
+    metrics_router,
+)
+from fluidly.fastapi.middleware import logging
+from fluidly.fastapi.middleware.logging import LoggingMiddleware
+
+
+@pytest.fixture(autouse=True)
+def mock_structlog(monkeypatch):
+    monkeypatch.setattr(logging, "get_logger", mock.Mock())
+
+
+@pytest.fixture()
+def registry(monkeypatch):
+    registry = MetricsRegistry(buckets=(0.1, 1.0))
+    monkeypatch.setattr(metrics, "metrics_registry", registry)
+    monkeypatch.setattr(metrics, "permissions_metrics", PermissionsMetrics())
+    return registry
+
+
+@pytest.fixture()
+def client(registry):
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    def get_item(item_id: int):
+        if item_id == 0:
+            raise HTTPException(status_code=404, detail="Item not found")
+        return {}
+
+    app.include_router(metrics_router)
+    app.add_middleware(LoggingMiddleware, metrics=registry)
+    return TestClient(app)
+
+
+class TestMetricsRegistry:
+    def test_records_requests(self, registry):
+        registry.request_started("GET")
+        registry.request_finished("GET", "/items/{item_id}", 200, 0.05)
+
+        lines = registry.render().splitlines()
+
+        labels = 'method="GET",route="/items/{item_id}"'
+        assert f'http_request_duration_seconds_bucket{{{labels},le="0.1"}} 1' in lines
+        assert f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 1' in lines
+        assert f"http_request_duration_seconds_count{{{labels}}} 1" in lines
+        assert f'http_responses_total{{{labels},status="200"}} 1' in lines
+        assert 'http_requests_in_flight{method="GET"} 0' in lines
+
+    def test_unmatched_route(self, registry):
+        registry.request_started("GET")
+        registry.request_finished("GET", None, 404, 0.01)
+
+        assert (
+            'http_responses_total{method="GET",route="unmatched",status="404"} 1'
+            in registry.render().splitlines()
+        )
+
+    def test_reset(self, registry):
+        registry.request_started("GET")
+        registry.reset()
+        registry.request_finished("GET", "/", 200, 0.01)
+
+        assert 'http_requests_in_flight{method="GET"} 0' in registry.render()
+
+
+class TestMetricsRoute:
+    def test_serves_metrics(self, client):
+        client.get("/items/1")
+        client.get("/items/0")
+        client.get("/missing")
+
+        response = client.get("/metrics")
+
+        assert response.headers["content-type"] == f"{CONTENT_TYPE}; charset=utf-8"
+        lines = response.text.splitlines()
+        assert (
+            'http_responses_total{method="GET",route="/items/{item_id}",status="200"} 1'
+            in lines
+        )
+        assert (
+            'http_responses_total{method="GET",route="/items/{item_id}",status="404"} 1'
+            in lines
+        )
+        assert (
+            'http_responses_total{method="GET",route="unmatched",status="404"} 1'
+            in lines
+        )
+        # The scrape itself is in flight
+        assert 'http_requests_in_flight{method="GET"} 1' in lines
+
+    def test_exports_permissions_metrics(self, client):
+        metrics.permissions_metrics.record("connection", GRANTED, 0.2)
+
+        lines = client.get("/metrics").text.splitlines()
+
+        assert (
+            'fluidly_permissions_checks_total{endpoint="connection",outcome="granted"} 1'
+            in lines
+        )
+        assert (
+            'fluidly_permissions_check_duration_seconds_count{endpoint="connection"} 1'
+            in lines
+        )
+
+
+def test_escape_label_value():
+    assert escape_label_value('a"b\\c\nd') == 'a\\"b\\\\c\\nd'
@@ -1,11 +1,18 @@
 from unittest import mock
 
 import pytest
-from fastapi import FastAPI, HTTPException
+from fastapi import BackgroundTasks, FastAPI, HTTPException
 from fastapi.testclient import TestClient
+from starlette.responses import StreamingResponse
 
 from fluidly.fastapi.middleware import logging
 from fluidly.fastapi.middleware.logging import LoggingMiddleware
+from fluidly.fastapi.middleware.sampling import SamplingPolicy
+from fluidly.structlog.server_timing import (
+    disable_server_timing,
+    enable_server_timing,
+    record_timing,
+)
 
 
 def default_test_route():
@@ -30,7 +37,11 @@ def setup_fastapi():
         fastapi_app.add_api_route(route_path, route)
 
         for custom_middleware in custom_middlewares:
-            fastapi_app.add_middleware(custom_middleware)
+            if isinstance(custom_middleware, tuple):
+                custom_middleware, options = custom_middleware
+                fastapi_app.add_middleware(custom_middleware, **options)
+            else:
+                fastapi_app.add_middleware(custom_middleware)
 
         return TestClient(fastapi_app)
 
@@ -49,6 +60,7 @@ class TestLoggingMiddleware:
         assert args == ("rest_request_processed",)
         assert kwargs["status_code"] == 200
         assert kwargs["success"] == True
+        assert kwargs["sample_rate"] == 1.0
 
     def test_binds_request_data_on_successful_request(
         self, setup_fastapi, mock_structlog
@@ -208,3 +220,180 @@ class TestLoggingMiddleware:
             "host": "testserver",
             "user-agent": "testclient",
         }
+
+    def test_streams_response(self, setup_fastapi, mock_structlog):
+        chunks = []
+
+        def body():
+            for chunk in (b"a", b"b", b"c"):
+                chunks.append(chunk)
+                yield chunk
+
+        def route():
+            return StreamingResponse(body(), media_type="text/plain")
+
+        client = setup_fastapi(route=route, custom_middlewares=[LoggingMiddleware])
+
+        response = client.get("/test")
+
+        assert response.content == b"abc"
+        assert response.headers["content-type"].startswith("text/plain")
+        assert chunks == [b"a", b"b", b"c"]
+        args, kwargs = mock_structlog.info.call_args
+        assert kwargs["status_code"] == 200
+
+    def test_runs_background_tasks(self, setup_fastapi, mock_structlog):
+        tasks = []
+
+        def route(background_tasks: BackgroundTasks):
+            background_tasks.add_task(tasks.append, "done")
+            return {}
+
+        client = setup_fastapi(route=route, custom_middlewares=[LoggingMiddleware])
+
+        client.get("/test")
+
+        assert tasks == ["done"]
+        assert mock_structlog.info.called
+
+    def test_raises_unexpected_exception_after_response_started(
+        self, setup_fastapi, mock_structlog
+    ):
+        def body():
+            yield b"a"
+            1 / 0
+
+        def route():
+            return StreamingResponse(body())
+
+        client = setup_fastapi(route=route, custom_middlewares=[LoggingMiddleware])
+
+        with pytest.raises(ZeroDivisionError):
+            client.get("/test")
+
+        args, kwargs = mock_structlog.error.call_args
+        assert kwargs["status_code"] == 500
+        assert kwargs["exc_info"] == True
+
+    def test_filters_logged_headers(self, setup_fastapi, mock_structlog):
+        client = setup_fastapi(custom_middlewares=[LoggingMiddleware])
+
+        client.get(
+            "/test",
+            headers={
+                "Authorization": "Bearer token",
+                "X-Endpoint-API-UserInfo": "eyJzdWIiOiAiYXV0aDB8MTIzIn0",
+            },
+        )
+
+        _, kwargs = mock_structlog.bind.call_args
+        assert kwargs["headers"]["authorization"] == "[REDACTED]"
+        assert "x-endpoint-api-userinfo" not in kwargs["headers"]
+
+
+class TestServerTiming:
+    @pytest.fixture(autouse=True)
+    def server_timing(self):
+        enable_server_timing()
+        yield
+        disable_server_timing()
+
+    def test_sends_and_logs_timings(self, setup_fastapi, mock_structlog):
+        def route():
+            record_timing("db", 0.25)
+            return {}
+
+        client = setup_fastapi(route=route, custom_middlewares=[LoggingMiddleware])
+
+        response = client.get("/test")
+
+        server_timing = response.headers["server-timing"]
+        assert server_timing.startswith("db;dur=250.0, total;dur=")
+        _, kwargs = mock_structlog.bind.call_args
+        assert kwargs["timings"] == {"db": 0.25}
+
+    def test_sends_timings_with_errors(self, setup_fastapi, mock_structlog):
+        def route():
+            record_timing("auth", 0.01)
+            raise HTTPException(status_code=403, detail="Forbidden")
+
+        client = setup_fastapi(route=route, custom_middlewares=[LoggingMiddleware])
+
+        response = client.get("/test")
+
+        assert response.headers["content-type"] == "application/problem+json"
+        assert response.headers["server-timing"].startswith("auth;dur=10.0")
+
+    def test_disabled(self, setup_fastapi, mock_structlog):
+        disable_server_timing()
+        client = setup_fastapi(custom_middlewares=[LoggingMiddleware])
+
+        response = client.get("/test")
+
+        assert "server-timing" not in response.headers
+        _, kwargs = mock_structlog.bind.call_args
+        assert "timings" not in kwargs
+
+
+class TestSampling:
+    def test_drops_unsampled_successes(self, setup_fastapi, mock_structlog):
+        sampling = SamplingPolicy(rate=0)
+        client = setup_fastapi(
+            custom_middlewares=[(LoggingMiddleware, {"sampling": sampling})]
+        )
+
+        client.get("/test")
+
+        assert not mock_structlog.info.called
+        assert not mock_structlog.bind.called
+        assert sampling.stats() == {"logged": 0, "dropped": 1}
+
+    def test_always_logs_errors(self, setup_fastapi, mock_structlog):
+        def route():
+            raise HTTPException(status_code=404, detail="Test not found")
+
+        client = setup_fastapi(
+            route=route,
+            custom_middlewares=[(LoggingMiddleware, {"sampling": SamplingPolicy(0)})],
+        )
+
+        client.get("/test")
+
+        args, kwargs = mock_structlog.error.call_args
+        assert kwargs["status_code"] == 404
+        assert kwargs["sample_rate"] == 1.0
+
+    def test_uses_route_rate(self, setup_fastapi, mock_structlog, monkeypatch):
+        monkeypatch.setattr("random.random", lambda: 0.3)
+        sampling = SamplingPolicy(rate=0, route_rates={"/{partner_id}": 0.5})
+
+        def route(partner_id: int):
+            return {}
+
+        client = setup_fastapi(
+            route=route,
+            route_path="/{partner_id}",
+            custom_middlewares=[(LoggingMiddleware, {"sampling": sampling})],
+        )
+
+        client.get("/1")
+
+        args, kwargs = mock_structlog.info.call_args
+        assert kwargs["sample_rate"] == 0.5
+        assert sampling.stats() == {"logged": 1, "dropped": 0}
+
+    def test_always_logs_slow_requests(self, setup_fastapi, mock_structlog):
+        sampling = SamplingPolicy(rate=0, latency_threshold=0)
+        client = setup_fastapi(
+            custom_middlewares=[(LoggingMiddleware, {"sampling": sampling})]
+        )
+
+        client.get("/test")
+
+        args, kwargs = mock_structlog.info.call_args
+        assert kwargs["sample_rate"] == 1.0
+
+    @pytest.mark.parametrize("rate", [-0.1, 1.5])
+    def test_rejects_invalid_rate(self, rate):
+        with pytest.raises(ValueError):
+            SamplingPolicy(route_rates={"/test": rate})
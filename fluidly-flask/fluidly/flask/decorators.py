@@ -1,104 +1,130 @@
-import json
 from functools import wraps
 
 from flask import g, request
 
+from fluidly.auth.claims import USER_INFO_HEADER, parse_claims
+from fluidly.auth.lazy import LazyModule
 from fluidly.auth.permissions import (
     UserPermissionsPayloadException,
     UserPermissionsRequestException,
     check_admin_permissions,
     check_user_permissions,
+    check_user_permissions_many,
+    get_max_connections,
 )
 from fluidly.flask.api_exception import APIException
-from fluidly.flask.utils import base64_decode
 
+# Token verification is optional, its dependencies are imported on first use
+jwks = LazyModule("fluidly.auth.jwks")
 
-def authorised(f):
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        """Retrieves the authentication information from Google Cloud Endpoints
-        and passes it to user permissions service"""
-        encoded_user_info = request.headers.get("X-Endpoint-API-UserInfo", None)
-        if not encoded_user_info:
+PERMISSIONS_EXCEPTIONS = (
+    ValueError,
+    UserPermissionsPayloadException,
+    UserPermissionsRequestException,
+)
+
+
+def get_claims():
+    """Retrieves the claims from the authentication information set by
+    Google Cloud Endpoints, or from the bearer token when token verification is
+    enabled"""
+    if jwks.get_token_verifier() is not None:
+        try:
+            return jwks.verify_authorization(request.headers.get("Authorization"))
+        except jwks.InvalidTokenException:
             raise APIException(status=401, title="User is not authenticated")
 
-        decoded_user_info = base64_decode(encoded_user_info)
-        user_info = json.loads(decoded_user_info)
+    encoded_user_info = request.headers.get(USER_INFO_HEADER, None)
+    if not encoded_user_info:
+        raise APIException(status=401, title="User is not authenticated")
 
-        if "claims" in user_info:
-            claims = json.loads(user_info.get("claims", "{}"))
-        else:
-            # Support ESPv2
-            claims = user_info
+    return parse_claims(encoded_user_info)
 
-        auth0_claims = claims.get("https://api.fluidly.com/app_metadata", {})
-        internal_claims = claims.get("https://api.fluidly.com/internal_metadata", {})
 
+def is_service_account(claims):
+    internal_claims = claims.get("https://api.fluidly.com/internal_metadata", {})
+    return internal_claims.get("isServiceAccount", False)
+
+
+def get_user_id(claims):
+    auth0_claims = claims.get("https://api.fluidly.com/app_metadata", {})
+    return auth0_claims.get("userId", None)
+
+
+def authorised(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        """Retrieves the authentication information from Google Cloud Endpoints
+        and passes it to user permissions service"""
+        claims = get_claims()
         connection_id = request.view_args["connection_id"]
-        user_id = auth0_claims.get("userId", None)
 
         try:
-            is_service_account = internal_claims.get("isServiceAccount", False)
-
-            if not is_service_account and not check_user_permissions(
+            if not is_service_account(claims) and not check_user_permissions(
                 claims, connection_id
             ):
                 raise APIException(status=403, title="User cannot access this resource")
-        except (
-            ValueError,
-            UserPermissionsPayloadException,
-            UserPermissionsRequestException,
-        ):
+        except PERMISSIONS_EXCEPTIONS:
             raise APIException(
                 status=403, title="An issue occurred while fetching permissions"
             )
 
         g.connection_id = connection_id
-        g.user_id = user_id
+        g.user_id = get_user_id(claims)
         return f(*args, **kwargs)
 
     return decorated_function
 
 
-def admin(f):
+def authorised_connections(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        """Retrieves the authentication information from Google Cloud Endpoints and passes it to user permissions service"""
-        encoded_info = request.headers.get("X-Endpoint-API-UserInfo", None)
-        if not encoded_info:
-            raise APIException(status=401, title="User is not authenticated")
+        """Authorises the user against every `connection_id` query parameter,
+        the request is rejected if any of the connections cannot be accessed or
+        if there are more than `get_max_connections`"""
+        claims = get_claims()
+        connection_ids = request.args.getlist("connection_id")
+        if not connection_ids:
+            raise APIException(status=400, title="Please provide connection_id")
+        max_connections = get_max_connections()
+        if len(set(connection_ids)) > max_connections:
+            raise APIException(
+                status=400,
+                title=f"Please provide at most {max_connections} connection_id",
+            )
+
+        try:
+            if not is_service_account(claims) and not all(
+                check_user_permissions_many(claims, connection_ids).values()
+            ):
+                raise APIException(status=403, title="User cannot access this resource")
+        except PERMISSIONS_EXCEPTIONS:
+            raise APIException(
+                status=403, title="An issue occurred while fetching permissions"
+            )
 
-        info_json = base64_decode(encoded_info)
-        # First parsing of the decoded header string
-        user_info = json.loads(info_json)
-        # Claims are given as a string by Cloud Endpoints so we have
-        # to parse the claims attribute
-        if "claims" in user_info:
-            claims = json.loads(user_info.get("claims", "{}"))
-        else:
-            # Support ESPv2
-            claims = user_info
+        g.connection_ids = connection_ids
+        g.user_id = get_user_id(claims)
+        return f(*args, **kwargs)
 
-        auth0_claims = claims.get("https://api.fluidly.com/app_metadata", {})
-        internal_claims = claims.get("https://api.fluidly.com/internal_metadata", {})
+    return decorated_function
 
-        user_id_from_token = auth0_claims.get("userId", None)
 
-        try:
-            is_service_account = internal_claims.get("isServiceAccount", False)
+def admin(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        """Retrieves the authentication information from Google Cloud Endpoints and passes it to user permissions service"""
+        claims = get_claims()
 
-            if not is_service_account and not check_admin_permissions(claims):
+        try:
+            if not is_service_account(claims) and not check_admin_permissions(claims):
                 raise APIException(status=403, title="User cannot access this resource")
-        except (
-            ValueError,
-            UserPermissionsPayloadException,
-            UserPermissionsRequestException,
-        ):
+        except PERMISSIONS_EXCEPTIONS:
             raise APIException(
                 status=403, title="An issue occurred while fetching permissions"
             )
 
-        g.user_id = user_id_from_token
+        g.user_id = get_user_id(claims)
         return f(*args, **kwargs)
 
     return decorated_function
@@ -1,5 +1,8 @@
-from typing import Any, TypeVar
+from typing import Any, Dict, Optional, TypeVar
 
+from fluidly.auth import jwks as jwks
+from fluidly.auth.claims import USER_INFO_HEADER as USER_INFO_HEADER
+from fluidly.auth.claims import parse_claims as parse_claims
 from fluidly.auth.permissions import (
     UserPermissionsPayloadException as UserPermissionsPayloadException,
 )
@@ -8,10 +11,17 @@ from fluidly.auth.permissions import (
 )
 from fluidly.auth.permissions import check_admin_permissions as check_admin_permissions
 from fluidly.auth.permissions import check_user_permissions as check_user_permissions
+from fluidly.auth.permissions import (
+    check_user_permissions_many as check_user_permissions_many,
+)
+from fluidly.auth.permissions import get_max_connections as get_max_connections
 from fluidly.flask.api_exception import APIException as APIException
-from fluidly.flask.utils import base64_decode as base64_decode
 
 T = TypeVar("T")
 
+def get_claims() -> Dict[str, Any]: ...
+def is_service_account(claims: Dict[str, Any]) -> bool: ...
+def get_user_id(claims: Dict[str, Any]) -> Optional[Any]: ...
 def authorised(f: T) -> T: ...
+def authorised_connections(f: T) -> T: ...
 def admin(f: T) -> T: ...
@@ -5,12 +5,14 @@ from flask import request
 
 from fluidly.flask.api_exception import APIException
 from fluidly.structlog import base_logger
+from fluidly.structlog.headers import get_header_filter
+from fluidly.structlog.server_timing import collect_timings, format_server_timing
 
 
 def rest_log_entrypoint(func):
     @wraps(func)
     def decorated_function(*args, **kwargs):
-        headers = dict(request.headers)
+        headers = get_header_filter().filter(request.headers.items())
 
         connection_id_from_path = request.view_args.get("connection_id")
         partner_id_from_path = request.view_args.get("partner_id")
@@ -19,25 +21,33 @@ def rest_log_entrypoint(func):
         logger = logger.new(callback=func.__qualname__)
         start = time.time()
 
-        try:
-            result = func(*args, **kwargs)
-        except APIException as exception:
-            end = time.time()
-            logger.error(
-                "rest_request_processed",
-                duration=end - start,
-                success=False,
-                exc_info=True,
-                connection_id=connection_id_from_path,
-                partner_id=partner_id_from_path,
-                headers=headers,
-                args=dict(request.view_args),
-                status_code=exception.status,
-                url=request.full_path,
-            )
-            raise exception
+        with collect_timings() as timings:
+            try:
+                result = func(*args, **kwargs)
+            except APIException as exception:
+                end = time.time()
+                if timings is not None:
+                    logger = logger.bind(timings=dict(timings))
+                logger.error(
+                    "rest_request_processed",
+                    duration=end - start,
+                    success=False,
+                    exc_info=True,
+                    connection_id=connection_id_from_path,
+                    partner_id=partner_id_from_path,
+                    headers=headers,
+                    args=dict(request.view_args),
+                    status_code=exception.status,
+                    url=request.full_path,
+                )
+                raise exception
 
         end = time.time()
+        if timings is not None:
+            logger = logger.bind(timings=dict(timings))
+            result.headers["Server-Timing"] = format_server_timing(
+                {**timings, "total": end - start}
+            )
         logger.info(
             "rest_request_processed",
             duration=end - start,
@@ -2,5 +2,8 @@ from typing import Any
 
 from fluidly.flask.api_exception import APIException as APIException
 from fluidly.structlog import base_logger as base_logger
+from fluidly.structlog.headers import get_header_filter as get_header_filter
+from fluidly.structlog.server_timing import collect_timings as collect_timings
+from fluidly.structlog.server_timing import format_server_timing as format_server_timing
 
 def rest_log_entrypoint(func: Any) -> Any: ...
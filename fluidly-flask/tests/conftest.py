@@ -1,10 +1,10 @@
 import json
 
 import pytest
-from flask import Blueprint, Flask, Response
+from flask import Blueprint, Flask, Response, g
 
 from fluidly.flask.api_exception import APIException, handle_api_exception
-from fluidly.flask.decorators import admin, authorised
+from fluidly.flask.decorators import admin, authorised, authorised_connections
 from fluidly.flask.exception_handling import log_safely
 
 test_view = Blueprint("test_view", __name__)
@@ -16,6 +16,12 @@ def authorised_endpoint(connection_id):
     return connection_id, 200
 
 
+@test_view.route("/authorised-connections")
+@authorised_connections
+def authorised_connections_endpoint():
+    return ",".join(g.connection_ids), 200
+
+
 @test_view.route("/admin")
 @admin
 def admin_endpoint():
@@ -1,9 +1,13 @@
 import base64
 import json
+import subprocess
+import sys
 from unittest import mock
 
 import pytest
 
+from fluidly.auth import jwks, permissions
+from fluidly.auth.jwks import InvalidTokenException
 from fluidly.flask import decorators
 
 
@@ -57,6 +61,31 @@ def mocked_admin_given_permissions(monkeypatch):
     yield check_admin_permissions_mock
 
 
+@pytest.fixture
+def mocked_many_permissions(monkeypatch):
+    check_user_permissions_many_mock = mock.MagicMock(
+        side_effect=lambda claims, connection_ids: {
+            connection_id: connection_id != "denied" for connection_id in connection_ids
+        }
+    )
+    monkeypatch.setattr(
+        decorators, "check_user_permissions_many", check_user_permissions_many_mock
+    )
+    yield check_user_permissions_many_mock
+
+
+def verify_authorization(authorization):
+    if authorization != "Bearer valid-token":
+        raise InvalidTokenException("Invalid signature")
+    return {"https://api.fluidly.com/app_metadata": {"userId": 2}}
+
+
+@pytest.fixture
+def mocked_token_verification(monkeypatch):
+    monkeypatch.setattr(jwks, "get_token_verifier", mock.MagicMock())
+    monkeypatch.setattr(jwks, "verify_authorization", verify_authorization)
+
+
 class TestAuthorisedESPv1:
     @staticmethod
     def _encode_claims(claims):
@@ -255,3 +284,109 @@ class TestAdminESPv2(TestAdminESPv1):
                 "https://api.fluidly.com/internal_metadata": {**internal_metadata},
             }
         )
+
+
+class TestAuthorisedConnections:
+    _get_dummy_user_info = staticmethod(TestAuthorisedESPv2._get_dummy_user_info)
+
+    def test_user_unauthenticated(self, client):
+        response = client.get("/shared/authorised-connections?connection_id=first")
+        assert response.status_code == 401
+
+    def test_connection_ids_required(self, client, mocked_many_permissions):
+        response = client.get(
+            "/shared/authorised-connections",
+            headers={"X-Endpoint-API-UserInfo": self._get_dummy_user_info()},
+        )
+        assert response.status_code == 400
+        assert response.json["title"] == "Please provide connection_id"
+
+    def test_too_many_connection_ids(
+        self, monkeypatch, client, mocked_many_permissions
+    ):
+        monkeypatch.setattr(permissions, "_max_connections", 2)
+
+        response = client.get(
+            "/shared/authorised-connections"
+            "?connection_id=first&connection_id=second&connection_id=third",
+            headers={"X-Endpoint-API-UserInfo": self._get_dummy_user_info()},
+        )
+        assert response.status_code == 400
+        assert response.json["title"] == "Please provide at most 2 connection_id"
+        assert not mocked_many_permissions.called
+
+    def test_permissions_unavailable(self, client):
+        response = client.get(
+            "/shared/authorised-connections?connection_id=first",
+            headers={"X-Endpoint-API-UserInfo": self._get_dummy_user_info()},
+        )
+        assert response.status_code == 403
+        assert response.json["title"] == "An issue occurred while fetching permissions"
+
+    def test_all_connections_granted(self, client, mocked_many_permissions):
+        response = client.get(
+            "/shared/authorised-connections?connection_id=first&connection_id=second",
+            headers={"X-Endpoint-API-UserInfo": self._get_dummy_user_info()},
+        )
+        assert response.status_code == 200
+        assert response.data == b"first,second"
+        args, _ = mocked_many_permissions.call_args
+        assert args[1] == ["first", "second"]
+
+    def test_one_connection_not_granted(self, client, mocked_many_permissions):
+        response = client.get(
+            "/shared/authorised-connections?connection_id=first&connection_id=denied",
+            headers={"X-Endpoint-API-UserInfo": self._get_dummy_user_info()},
+        )
+        assert response.status_code == 403
+        assert response.json["title"] == "User cannot access this resource"
+
+    def test_service_account_granted(self, client, mocked_many_permissions):
+        response = client.get(
+            "/shared/authorised-connections?connection_id=denied",
+            headers={
+                "X-Endpoint-API-UserInfo": self._get_dummy_user_info(
+                    internal_metadata={"isServiceAccount": True}
+                )
+            },
+        )
+        assert response.status_code == 200
+        assert not mocked_many_permissions.called
+
+
+class TestBearerTokenVerification:
+    def test_verified_token_granted(
+        self, client, mocked_token_verification, mocked_given_permissions
+    ):
+        response = client.get(
+            "/shared/authorised/some:connection_id",
+            headers={"Authorization": "Bearer valid-token"},
+        )
+        assert response.status_code == 200
+        assert mocked_given_permissions.call_args[0][0] == {
+            "https://api.fluidly.com/app_metadata": {"userId": 2}
+        }
+
+    def test_invalid_token_unauthenticated(self, client, mocked_token_verification):
+        response = client.get(
+            "/shared/admin",
+            headers={
+                "Authorization": "Bearer invalid-token",
+                "X-Endpoint-API-UserInfo": TestAuthorisedESPv2._get_dummy_user_info(),
+            },
+        )
+        assert response.status_code == 401
+        assert response.json["title"] == "User is not authenticated"
+
+    def test_importable_without_cryptography(self):
+        # cryptography is only installed with the `jwks` extra of fluidly-auth
+        subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import sys; sys.modules['cryptography'] = None; "
+                "from fluidly.flask.decorators import jwks; "
+                "jwks.get_token_verifier()",
+            ],
+            check=True,
+        )
@@ -3,6 +3,7 @@ from unittest import mock
 import pytest
 
 from fluidly.structlog import base_logger
+from fluidly.structlog.server_timing import disable_server_timing, enable_server_timing
 
 
 @pytest.fixture()
@@ -26,3 +27,27 @@ def test_rest_log_entrypoint_exception(client, logger_mock):
 
     assert logger_mock.new.called
     assert logger_mock.new.return_value.error.called
+
+
+def test_rest_log_entrypoint_filters_headers(client, logger_mock):
+    client.get(
+        "/shared/logging-success",
+        headers={"Authorization": "Bearer token", "Cookie": "session=secret"},
+    )
+
+    _, kwargs = logger_mock.new.return_value.info.call_args
+    assert kwargs["headers"]["Authorization"] == "[REDACTED]"
+    assert "Cookie" not in kwargs["headers"]
+
+
+def test_rest_log_entrypoint_server_timing(client, logger_mock):
+    enable_server_timing()
+    try:
+        response = client.get("/shared/logging-success")
+    finally:
+        disable_server_timing()
+
+    assert response.headers["Server-Timing"].startswith("total;dur=")
+    _, kwargs = logger_mock.new.return_value.bind.call_args
+    assert kwargs["timings"] == {}
+    assert logger_mock.new.return_value.bind.return_value.info.called
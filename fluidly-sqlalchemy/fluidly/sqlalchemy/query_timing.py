@@ -0,0 +1,29 @@
+import time
+from typing import Any
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from fluidly.structlog.server_timing import record_timing
+
+
+def _before_cursor_execute(
+    conn: Any, cursor: Any, statement: Any, parameters: Any, context: Any, *args: Any
+) -> None:
+    context._fluidly_query_start = time.perf_counter()
+
+
+def _after_cursor_execute(
+    conn: Any, cursor: Any, statement: Any, parameters: Any, context: Any, *args: Any
+) -> None:
+    start = getattr(context, "_fluidly_query_start", None)
+    if start is not None:
+        record_timing("db", time.perf_counter() - start)
+
+
+def record_query_timings(engine: Any = Engine) -> None:
+    """Records the time spent running queries on `engine`, or on every engine, as
+    the `db` server timing of the current request"""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
@@ -11,9 +11,17 @@ URL = "https://github.com/fluidly/python-shared"
 EMAIL = "tech@fluidly.com"
 AUTHOR = "Fluidly"
 REQUIRES_PYTHON = ">=3.6.0"
-VERSION = "0.1.1"
+VERSION = "0.1.2"
 
-REQUIRED = ["sqlalchemy"]
+
+def local_dependencies(*packages):
+    if os.environ.get("INSTALL_EDITABLE"):
+        return []
+
+    return list(packages)
+
+
+REQUIRED = ["sqlalchemy"] + local_dependencies("fluidly-structlog")
 
 EXTRAS = {
     # 'fancy feature': ['django'],
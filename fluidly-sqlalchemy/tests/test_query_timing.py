@@ -0,0 +1,32 @@
+import sqlalchemy as db
+
+from fluidly.sqlalchemy.query_timing import record_query_timings
+from fluidly.structlog.server_timing import (
+    collect_timings,
+    disable_server_timing,
+    enable_server_timing,
+)
+
+
+def test_record_query_timings():
+    engine = db.create_engine("sqlite://")
+    record_query_timings(engine)
+    record_query_timings(engine)
+
+    enable_server_timing()
+    try:
+        with collect_timings() as timings:
+            with engine.connect() as connection:
+                connection.execute(db.text("select 1"))
+    finally:
+        disable_server_timing()
+
+    assert timings["db"] > 0
+
+
+def test_record_query_timings_outside_requests():
+    engine = db.create_engine("sqlite://")
+    record_query_timings(engine)
+
+    with engine.connect() as connection:
+        assert connection.execute(db.text("select 1")).scalar() == 1
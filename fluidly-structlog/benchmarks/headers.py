@@ -0,0 +1,73 @@
+"""Size of the headers logged with each REST request and the time taken to select
+them, logging every header against the default `HeaderFilter`:
+
+    python fluidly-structlog/benchmarks/headers.py --iterations 100000
+"""
+
+import argparse
+import base64
+import json
+import timeit
+from typing import Callable, Dict, List, Tuple
+
+from fluidly.structlog.headers import HeaderFilter
+
+USER_INFO = {
+    "iss": "https://fluidly.eu.auth0.com/",
+    "sub": "auth0|5f0c8e0a9d7b2a0013a1b2c3",
+    "aud": ["https://api.fluidly.com", "https://fluidly.eu.auth0.com/userinfo"],
+    "azp": "aBcDeFgHiJkLmNoPqRsTuVwXyZ012345",
+    "scope": "openid profile email",
+    "https://api.fluidly.com/app_metadata": {
+        "userId": "0f9c8e0a-9d7b-4a00-13a1-b2c3d4e5f607",
+        "partnerIds": list(range(1, 40)),
+    },
+    "https://api.fluidly.com/user_metadata": {"name": "A Fluidly User"},
+}
+
+# Headers of a request forwarded by Google Cloud Endpoints
+HEADERS: List[Tuple[str, str]] = [
+    ("host", "api.fluidly.com"),
+    ("user-agent", "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7)"),
+    ("accept", "application/json"),
+    ("accept-encoding", "gzip, deflate, br"),
+    ("authorization", "Bearer " + "x" * 900),
+    ("cookie", "; ".join(f"cookie_{i}={'y' * 64}" for i in range(10))),
+    ("x-cloud-trace-context", "105445aa7843bc8bf206b12000100000/1;o=1"),
+    ("x-forwarded-for", "203.0.113.195, 35.191.0.1"),
+    (
+        "x-endpoint-api-userinfo",
+        base64.urlsafe_b64encode(json.dumps(USER_INFO).encode()).decode(),
+    ),
+]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=100000)
+    options = parser.parse_args()
+
+    header_filter = HeaderFilter()
+    selections: Dict[str, Callable[[], Dict[str, str]]] = {
+        "all headers": lambda: dict(HEADERS),
+        "HeaderFilter": lambda: header_filter.filter(HEADERS),
+    }
+    for name, select in selections.items():
+        size = len(json.dumps({"headers": select()}))
+        timing = min(timeit.repeat(select, number=options.iterations, repeat=5))
+        rendering = min(
+            timeit.repeat(
+                lambda: json.dumps({"headers": select()}),
+                number=options.iterations,
+                repeat=5,
+            )
+        )
+        print(
+            f"{name:>12}: {size:6d} bytes per log line, "
+            f"{timing / options.iterations * 1e6:6.2f}us to select, "
+            f"{rendering / options.iterations * 1e6:6.2f}us to select and render"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+from typing import Dict, Iterable, Optional, Tuple
+
+# Large or sensitive headers which are left out of request logs by default, the
+# user info header set by Google Cloud Endpoints is a base64 blob of the claims
+DEFAULT_DENYLIST = ("cookie", "x-endpoint-api-userinfo")
+DEFAULT_REDACT = ("authorization", "proxy-authorization", "x-api-key")
+REDACTED = "[REDACTED]"
+
+_KEEP = 0
+_REDACT = 1
+_DROP = 2
+
+
+class HeaderFilter:
+    """Selects the request headers to log.
+
+    Only headers in `allowlist` are logged, or all of them if it is None. Headers
+    in `denylist` are dropped and the values of headers in `redact` are replaced
+    with `[REDACTED]`, the denylist wins over the allowlist. Header names are
+    case insensitive. The lists are compiled into a single lookup up front so
+    filtering is one pass over the headers.
+    """
+
+    def __init__(
+        self,
+        allowlist: Optional[Iterable[str]] = None,
+        denylist: Iterable[str] = DEFAULT_DENYLIST,
+        redact: Iterable[str] = DEFAULT_REDACT,
+    ) -> None:
+        self._default = _KEEP if allowlist is None else _DROP
+        self._actions: Dict[str, int] = {
+            name.lower(): _KEEP for name in allowlist or ()
+        }
+        for name in redact:
+            if allowlist is None or name.lower() in self._actions:
+                self._actions[name.lower()] = _REDACT
+        for name in denylist:
+            self._actions[name.lower()] = _DROP
+
+    def filter(self, headers: Iterable[Tuple[str, str]]) -> Dict[str, str]:
+        filtered = {}
+        for name, value in headers:
+            action = self._actions.get(name.lower(), self._default)
+            if action == _KEEP:
+                filtered[name] = value
+            elif action == _REDACT:
+                filtered[name] = REDACTED
+        return filtered
+
+
+_header_filter = HeaderFilter()
+
+
+def configure_header_filter(
+    allowlist: Optional[Iterable[str]] = None,
+    denylist: Iterable[str] = DEFAULT_DENYLIST,
+    redact: Iterable[str] = DEFAULT_REDACT,
+) -> HeaderFilter:
+    """Sets the headers logged with REST requests by fluidly.flask and
+    fluidly.fastapi, e.g. `configure_header_filter(allowlist=["user-agent"])`"""
+    global _header_filter
+
+    _header_filter = HeaderFilter(allowlist, denylist, redact)
+    return _header_filter
+
+
+def get_header_filter() -> HeaderFilter:
+    return _header_filter
@@ -0,0 +1,71 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+
+Timings = Dict[str, float]
+
+_enabled = False
+_timings: "ContextVar[Optional[Timings]]" = ContextVar(
+    "fluidly_server_timings", default=None
+)
+
+
+def enable_server_timing() -> None:
+    """Breaks down the duration of REST requests handled by fluidly.flask and
+    fluidly.fastapi into a `Server-Timing` header and `timings` log field"""
+    global _enabled
+
+    _enabled = True
+
+
+def disable_server_timing() -> None:
+    global _enabled
+
+    _enabled = False
+
+
+def is_server_timing_enabled() -> bool:
+    return _enabled
+
+
+@contextmanager
+def collect_timings() -> Iterator[Optional[Timings]]:
+    """Collects the timings recorded in the block, yields None when server timing
+    is disabled. Timings follow the context into coroutines and the threadpool
+    of Starlette but not into threads started in the block."""
+    if not _enabled:
+        yield None
+        return
+
+    token = _timings.set({})
+    try:
+        yield _timings.get()
+    finally:
+        _timings.reset(token)
+
+
+def record_timing(name: str, duration: float) -> None:
+    """Adds `duration` seconds to the `name` timing of the current request"""
+    timings = _timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + duration
+
+
+@contextmanager
+def measure(name: str) -> Iterator[None]:
+    if _timings.get() is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_timing(name, time.perf_counter() - start)
+
+
+def format_server_timing(timings: Timings) -> str:
+    return ", ".join(
+        f"{name};dur={duration * 1000:.1f}" for name, duration in timings.items()
+    )
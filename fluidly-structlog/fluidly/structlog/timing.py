@@ -2,11 +2,13 @@ import time
 from contextlib import contextmanager
 
 from fluidly.structlog.base_logger import get_logger
+from fluidly.structlog.server_timing import record_timing
 
 
 @contextmanager
 def log_duration(key_name):
-    """Logs duration of block and binds result to structlog
+    """Logs duration of block and binds result to structlog, the duration is
+    also recorded as a server timing of the current request
 
     Arguments:
         key_name {str} -- Key to bind the result
@@ -18,3 +20,4 @@ def log_duration(key_name):
 
     end_time = time.time()
     log.bind(**{key_name: end_time - start_time})
+    record_timing(key_name, end_time - start_time)
@@ -1,5 +1,6 @@
 from typing import Any
 
 from fluidly.structlog.base_logger import get_logger as get_logger
+from fluidly.structlog.server_timing import record_timing as record_timing
 
 def log_duration(key_name: Any) -> None: ...
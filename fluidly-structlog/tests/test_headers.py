@@ -0,0 +1,61 @@
+import pytest
+
+from fluidly.structlog import headers
+from fluidly.structlog.headers import (
+    REDACTED,
+    HeaderFilter,
+    configure_header_filter,
+    get_header_filter,
+)
+
+HEADERS = [
+    ("Host", "api.fluidly.com"),
+    ("User-Agent", "test"),
+    ("Authorization", "Bearer token"),
+    ("Cookie", "session=secret"),
+    ("X-Endpoint-API-UserInfo", "eyJzdWIiOiAiYXV0aDB8MTIzIn0"),
+]
+
+
+@pytest.fixture()
+def restore_header_filter(monkeypatch):
+    monkeypatch.setattr(headers, "_header_filter", headers._header_filter)
+
+
+class TestHeaderFilter:
+    def test_default_filter(self):
+        assert HeaderFilter().filter(HEADERS) == {
+            "Host": "api.fluidly.com",
+            "User-Agent": "test",
+            "Authorization": REDACTED,
+        }
+
+    def test_allowlist(self):
+        header_filter = HeaderFilter(allowlist=["user-agent", "Authorization"])
+
+        assert header_filter.filter(HEADERS) == {
+            "User-Agent": "test",
+            "Authorization": REDACTED,
+        }
+
+    def test_denylist_wins_over_allowlist(self):
+        header_filter = HeaderFilter(allowlist=["host", "cookie"])
+
+        assert header_filter.filter(HEADERS) == {"Host": "api.fluidly.com"}
+
+    def test_custom_lists(self):
+        header_filter = HeaderFilter(denylist=["host"], redact=["user-agent"])
+
+        assert header_filter.filter(HEADERS) == {
+            "User-Agent": REDACTED,
+            "Authorization": "Bearer token",
+            "Cookie": "session=secret",
+            "X-Endpoint-API-UserInfo": "eyJzdWIiOiAiYXV0aDB8MTIzIn0",
+        }
+
+
+def test_configure_header_filter(restore_header_filter):
+    header_filter = configure_header_filter(allowlist=["host"])
+
+    assert get_header_filter() is header_filter
+    assert get_header_filter().filter(HEADERS) == {"Host": "api.fluidly.com"}
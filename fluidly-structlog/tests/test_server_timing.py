@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+from fluidly.structlog.server_timing import (
+    collect_timings,
+    disable_server_timing,
+    enable_server_timing,
+    format_server_timing,
+    measure,
+    record_timing,
+)
+from fluidly.structlog.timing import log_duration
+
+
+@pytest.fixture()
+def server_timing():
+    enable_server_timing()
+    yield
+    disable_server_timing()
+
+
+class TestServerTiming:
+    def test_records_timings(self, server_timing):
+        with collect_timings() as timings:
+            record_timing("db", 0.01)
+            record_timing("db", 0.02)
+            with measure("auth"):
+                pass
+            with log_duration("handler"):
+                pass
+
+        assert timings["db"] == pytest.approx(0.03)
+        assert set(timings) == {"db", "auth", "handler"}
+
+    def test_follows_context_into_coroutines(self, server_timing):
+        async def handler():
+            record_timing("pubsub", 0.5)
+
+        async def request():
+            with collect_timings() as timings:
+                await asyncio.gather(asyncio.ensure_future(handler()))
+            return timings
+
+        assert asyncio.run(request()) == {"pubsub": 0.5}
+
+    def test_disabled(self):
+        with collect_timings() as timings:
+            record_timing("db", 0.01)
+
+        assert timings is None
+
+    def test_ignores_timings_outside_requests(self, server_timing):
+        record_timing("db", 0.01)
+
+        with collect_timings() as timings:
+            pass
+
+        assert timings == {}
+
+
+def test_format_server_timing():
+    assert (
+        format_server_timing({"auth": 0.0123, "db": 0.2})
+        == "auth;dur=12.3, db;dur=200.0"
+    )